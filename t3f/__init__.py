@@ -8,4 +8,6 @@ from t3f.initializers import *
 from t3f.regularizers import *
 from t3f.riemannian import *
 from t3f.shapes import *
-from t3f.decompositions import *
\ No newline at end of file
+from t3f.decompositions import *
+from t3f.streaming import *
+from t3f import optimizers
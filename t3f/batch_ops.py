@@ -1,18 +1,31 @@
+import numpy as np
 import tensorflow as tf
 
 from t3f.tensor_train_base import TensorTrainBase
+from t3f.tensor_train import TensorTrain
 from t3f.tensor_train_batch import TensorTrainBatch
 from t3f import ops
+from t3f import shapes
 
 
-def concat_along_batch_dim(tt_list):
+def concat_along_batch_dim(tt_list, pad_ranks=False):
   """Concat all TensorTrainBatch objects along batch dimension.
 
   Args:
     tt_list: a list of TensorTrainBatch objects.
+    pad_ranks: bool, if True, the objects can have different TT-ranks (known
+      on the compilation stage), the TT-cores are padded with zeros up to the
+      largest TT-ranks (see `pad_tt_ranks`) and the list can contain
+      TensorTrain objects as batches of size 1. The TT-ranks of the elements
+      before padding are stored in the result, see `element_tt_ranks`.
 
   Returns:
     TensorTrainBatch
+
+  Raises:
+    ValueError if the objects are not TensorTrainBatch, if their shapes do not
+      coincide, or if their TT-ranks do not coincide and pad_ranks is False or
+      are not known on the compilation stage.
   """
   ndims = tt_list[0].ndims()
 
@@ -20,6 +33,24 @@ def concat_along_batch_dim(tt_list):
     # Not a list but just one element, nothing to concat.
     return tt_list
 
+  if pad_ranks:
+    tt_list = [shapes.expand_batch_dim(tt) if isinstance(tt, TensorTrain)
+               else tt for tt in tt_list]
+    for tt in tt_list:
+      if not tt.get_tt_ranks().is_fully_defined():
+        raise ValueError('TT-ranks of all TT-objects should be known on the '
+                         'compilation stage to pad them, got %s' % tt)
+    max_ranks = np.max([tt.get_tt_ranks().as_list() for tt in tt_list], axis=0)
+    # The TT-ranks of the elements before padding, batch_size x (d+1).
+    element_ranks = []
+    for tt in tt_list:
+      curr_ranks = getattr(tt, '_element_tt_ranks', None)
+      if curr_ranks is None:
+        curr_ranks = tf.constant([tt.get_tt_ranks().as_list()], dtype=tf.int32)
+        curr_ranks = tf.tile(curr_ranks, (shapes.lazy_batch_size(tt), 1))
+      element_ranks.append(curr_ranks)
+    tt_list = [pad_tt_ranks(tt, max_ranks) for tt in tt_list]
+
   for batch_idx in range(len(tt_list)):
     if not isinstance(tt_list[batch_idx], TensorTrainBatch):
       raise ValueError('All objects in the list should be TTBatch objects, got '
@@ -45,8 +76,11 @@ def concat_along_batch_dim(tt_list):
     # The batch sizes are not defined and you can't sum Nones.
     batch_size = None
 
-  return TensorTrainBatch(res_cores, tt_list[0].get_raw_shape(),
-                          tt_list[0].get_tt_ranks(), batch_size)
+  res = TensorTrainBatch(res_cores, tt_list[0].get_raw_shape(),
+                         tt_list[0].get_tt_ranks(), batch_size)
+  if pad_ranks:
+    res._element_tt_ranks = tf.concat(element_ranks, axis=0)
+  return res
 
 
 def multiply_along_batch_dim(batch_tt, weights):
@@ -183,3 +217,126 @@ def pairwise_flat_inner(tt_1, tt_2, matrix=None):
   # Squeeze to make the result of size batch_size x batch_size instead of
   # batch_size x batch_size x 1 x 1.
   return tf.squeeze(res)
+
+
+def pad_tt_ranks(tt, tt_ranks):
+  """Pads the TT-cores with zeros to increase the TT-ranks.
+
+  The padded object represents the same tensor (or batch of tensors), the
+  additional rows and columns of the TT-cores are zero. Allows to store
+  TT-objects of different TT-ranks in a single TensorTrainBatch, see
+  `concat_along_batch_dim(..., pad_ranks=True)`, the original TT-ranks of the
+  elements can be recovered with `element_tt_ranks` and the padding can be
+  removed with `compact_tt_ranks`.
+
+  Args:
+    tt: `TensorTrain` or `TensorTrainBatch`.
+    tt_ranks: a list of d+1 numbers, the new TT-ranks.
+
+  Returns:
+    The same type as `tt` with TT-ranks `tt_ranks`.
+
+  Raises:
+    ValueError if the length of tt_ranks is not d+1, if the first or the last
+      TT-rank is not 1, or if a TT-rank of `tt` known on the compilation stage
+      is larger than the corresponding element of tt_ranks.
+  """
+  ndims = tt.ndims()
+  tt_ranks = [int(r) for r in tt_ranks]
+  if len(tt_ranks) != ndims + 1:
+    raise ValueError('tt_ranks should be a list of %d numbers, got %s.' %
+                     (ndims + 1, tt_ranks))
+  if tt_ranks[0] != 1 or tt_ranks[-1] != 1:
+    raise ValueError('The first and the last TT-ranks should be 1, got %s.' %
+                     tt_ranks)
+  static_ranks = tt.get_tt_ranks().as_list()
+  for static_rank, rank in zip(static_ranks, tt_ranks):
+    if static_rank is not None and static_rank > rank:
+      raise ValueError('Can not pad TT-ranks %s to smaller TT-ranks %s.' %
+                       (static_ranks, tt_ranks))
+  is_batch = isinstance(tt, TensorTrainBatch)
+  curr_ranks = shapes.lazy_tt_ranks(tt)
+  tt_cores = []
+  for core_idx in range(ndims):
+    curr_core = tt.tt_cores[core_idx]
+    left_pad = tt_ranks[core_idx] - curr_ranks[core_idx]
+    right_pad = tt_ranks[core_idx + 1] - curr_ranks[core_idx + 1]
+    paddings = [[0, left_pad]] + [[0, 0]] * (curr_core.get_shape().ndims - 2 -
+                                             int(is_batch))
+    paddings += [[0, right_pad]]
+    if is_batch:
+      paddings = [[0, 0]] + paddings
+    tt_cores.append(tf.pad(curr_core, paddings))
+  if is_batch:
+    res = TensorTrainBatch(tt_cores, tt.get_raw_shape(), tt_ranks,
+                           tt.batch_size)
+    # The padding does not change the TT-ranks of the elements.
+    res._element_tt_ranks = getattr(tt, '_element_tt_ranks', None)
+    return res
+  else:
+    return TensorTrain(tt_cores, tt.get_raw_shape(), tt_ranks)
+
+
+def element_tt_ranks(tt):
+  """Computes the TT-ranks of each element of a batch without the zero padding.
+
+  For a batch created with `concat_along_batch_dim(..., pad_ranks=True)` (or
+  a subset of it taken with `tt[start:stop]`) returns the TT-ranks of the
+  elements before padding, which are stored in the batch. For other batches
+  (e.g. after `t3f.round`) the TT-rank r_k of an element is inferred as the
+  index of the last nonzero slice core_{k-1}[..., r_k - 1] of its TT-core
+  plus 1 (but at least 1), which is smaller than the actual TT-rank if some
+  of the slices are zero.
+
+  Args:
+    tt: `TensorTrainBatch`.
+
+  Returns:
+    tf.Tensor of shape batch_size x (d+1) with the TT-ranks.
+  """
+  stored_ranks = getattr(tt, '_element_tt_ranks', None)
+  if stored_ranks is not None:
+    return stored_ranks
+  ndims = tt.ndims()
+  batch_size = shapes.lazy_batch_size(tt)
+  ones = tf.ones((batch_size,), dtype=tf.int32)
+  res = [ones]
+  for core_idx in range(ndims - 1):
+    curr_core = tt.tt_cores[core_idx]
+    # batch_size x r_k, True if the slice is nonzero.
+    curr_rank = tf.shape(curr_core)[-1]
+    slices = tf.reshape(curr_core, (batch_size, -1, curr_rank))
+    is_nonzero = tf.reduce_any(tf.not_equal(slices, 0), axis=1)
+    last_nonzero = tf.argmax(tf.cast(tf.reverse(is_nonzero, [1]), tf.int32),
+                             axis=1)
+    last_nonzero = tf.cast(last_nonzero, tf.int32)
+    rank = tf.where(tf.reduce_any(is_nonzero, axis=1),
+                    curr_rank - last_nonzero, ones)
+    res.append(rank)
+  res.append(ones)
+  return tf.stack(res, axis=1)
+
+
+def compact_tt_ranks(tt):
+  """Removes the zero padding common to all the elements of a batch.
+
+  Reduces the TT-ranks of the batch to the largest `element_tt_ranks` of its
+  elements, e.g. after selecting a subset of a padded batch. The TT-ranks of
+  the result are not known on the compilation stage.
+
+  Args:
+    tt: `TensorTrainBatch`.
+
+  Returns:
+    `TensorTrainBatch` representing the same tensors.
+  """
+  ndims = tt.ndims()
+  element_ranks = element_tt_ranks(tt)
+  ranks = tf.reduce_max(element_ranks, axis=0)
+  tt_cores = []
+  for core_idx in range(ndims):
+    curr_core = tt.tt_cores[core_idx]
+    tt_cores.append(curr_core[:, :ranks[core_idx], ..., :ranks[core_idx + 1]])
+  res = TensorTrainBatch(tt_cores, tt.get_raw_shape(), None, tt.batch_size)
+  res._element_tt_ranks = getattr(tt, '_element_tt_ranks', None)
+  return res
@@ -1,9 +1,13 @@
 import numpy as np
 import tensorflow as tf
 
+from t3f.tensor_train import TensorTrain
+from t3f.tensor_train_batch import TensorTrainBatch
 from t3f import ops
 from t3f import batch_ops
+from t3f import decompositions
 from t3f import initializers
+from t3f import shapes
 
 
 class BatchOpsTest(tf.test.TestCase):
@@ -156,6 +160,80 @@ class BatchOpsTest(tf.test.TestCase):
           res_desired_val[i, j] = curr_val
       self.assertAllClose(res_desired_val, res_actual_val)
 
+  def testConcatPadRanks(self):
+    # Test concating TT-objects of different TT-ranks.
+    shape = (2, 3, 4, 2)
+    first = initializers.random_tensor(shape, tt_rank=2)
+    second = initializers.random_tensor_batch(shape, tt_rank=(1, 2, 3, 1, 1),
+                                              batch_size=2)
+    third = initializers.random_tensor(shape, tt_rank=(1, 1, 4, 2, 1))
+    with self.assertRaises(ValueError):
+      batch_ops.concat_along_batch_dim((first, second, third))
+    with self.test_session() as sess:
+      first = TensorTrain(sess.run(first.tt_cores))
+      second = TensorTrainBatch(sess.run(second.tt_cores))
+      third = TensorTrain(sess.run(third.tt_cores))
+      res = batch_ops.concat_along_batch_dim((first, second, third),
+                                             pad_ranks=True)
+      self.assertEqual(4, res.batch_size)
+      self.assertEqual([1, 2, 4, 2, 1], res.get_tt_ranks().as_list())
+      desired = np.concatenate((sess.run(ops.full(first))[np.newaxis],
+                                sess.run(ops.full(second)),
+                                sess.run(ops.full(third))[np.newaxis]))
+      self.assertAllClose(desired, sess.run(ops.full(res)))
+      element_ranks = sess.run(batch_ops.element_tt_ranks(res))
+      self.assertAllEqual([[1, 2, 2, 2, 1], [1, 2, 3, 1, 1], [1, 2, 3, 1, 1],
+                           [1, 1, 4, 2, 1]], element_ranks)
+
+      # Batch operations work on the padded batch.
+      flat_desired = desired.reshape(4, -1)
+      self.assertAllClose(flat_desired.dot(flat_desired.T),
+                          sess.run(batch_ops.pairwise_flat_inner(res, res)))
+      rounded = decompositions.round(res, max_tt_rank=4)
+      self.assertAllClose(desired, sess.run(ops.full(rounded)), atol=1e-5,
+                          rtol=1e-5)
+
+      # Compaction of a subset.
+      compact = batch_ops.compact_tt_ranks(res[1:3])
+      compact_val, compact_ranks = sess.run([ops.full(compact),
+                                             shapes.tt_ranks(compact)])
+      self.assertAllEqual([1, 2, 3, 1, 1], compact_ranks)
+      self.assertAllClose(desired[1:3], compact_val)
+
+  def testElementTTRanksZeroSlices(self):
+    # The stored TT-ranks do not depend on the values of the TT-cores.
+    shape = (2, 3, 4)
+    first = initializers.random_tensor(shape, tt_rank=2)
+    second = initializers.random_tensor(shape, tt_rank=3)
+    with self.test_session() as sess:
+      first_cores = sess.run(first.tt_cores)
+      # The last slice of the first TT-core is zero, the TT-rank is still 2.
+      first_cores[0][..., -1] = 0
+      first = TensorTrain(first_cores)
+      second = TensorTrain(sess.run(second.tt_cores))
+      res = batch_ops.concat_along_batch_dim((first, second), pad_ranks=True)
+      element_ranks = sess.run(batch_ops.element_tt_ranks(res))
+      self.assertAllEqual([[1, 2, 2, 1], [1, 3, 3, 1]], element_ranks)
+      element_ranks = sess.run(batch_ops.element_tt_ranks(res[:1]))
+      self.assertAllEqual([[1, 2, 2, 1]], element_ranks)
+      # Without the stored TT-ranks they are inferred from the zero slices.
+      inferred = TensorTrainBatch(res.tt_cores)
+      element_ranks = sess.run(batch_ops.element_tt_ranks(inferred))
+      self.assertAllEqual([[1, 1, 2, 1], [1, 3, 3, 1]], element_ranks)
+
+  def testPadTTRanks(self):
+    tt = initializers.random_matrix(((2, 3), (3, 2)), tt_rank=2)
+    padded = batch_ops.pad_tt_ranks(tt, (1, 5, 1))
+    self.assertEqual([1, 5, 1], padded.get_tt_ranks().as_list())
+    with self.test_session() as sess:
+      tt_val, padded_val = sess.run([ops.full(tt), ops.full(padded)])
+      self.assertAllClose(tt_val, padded_val)
+    with self.assertRaises(ValueError):
+      batch_ops.pad_tt_ranks(tt, (1, 1, 1))
+    with self.assertRaises(ValueError):
+      batch_ops.pad_tt_ranks(tt, (1, 5, 5, 1))
+
+
 if __name__ == "__main__":
   tf.test.main()
 
@@ -4,9 +4,12 @@ import tensorflow as tf
 from t3f.tensor_train import TensorTrain
 from t3f.tensor_train_batch import TensorTrainBatch
 from t3f import shapes
+from t3f import linalg
+from t3f import utils
 
 
-def to_tt_matrix(mat, shape, max_tt_rank=10, epsilon=None):
+def to_tt_matrix(mat, shape, max_tt_rank=10, epsilon=None,
+                 svd_backend=None):
   """Converts a given matrix or vector to a TT-matrix.
 
   The matrix dimensions should factorize into d numbers.
@@ -46,6 +49,8 @@ def to_tt_matrix(mat, shape, max_tt_rank=10, epsilon=None):
       the TT-ranks of the result undefined on the compilation stage
       (e.g. res.get_tt_ranks() will return None, but t3f.tt_ranks(res).eval()
       will work).
+    svd_backend: (Optional) the name of the `t3f.linalg` SVD backend, by
+      default the backend of the current `t3f.linalg.svd_backend` scope.
 
   Returns:
     `TensorTrain` object containing a TT-matrix.
@@ -74,7 +79,7 @@ def to_tt_matrix(mat, shape, max_tt_rank=10, epsilon=None):
   tens = tf.transpose(tens, transpose_idx)
   new_shape = np.prod(shape, axis=0)
   tens = tf.reshape(tens, new_shape)
-  tt_tens = to_tt_tensor(tens, max_tt_rank, epsilon)
+  tt_tens = to_tt_tensor(tens, max_tt_rank, epsilon, svd_backend)
   tt_cores = []
   static_tt_ranks = tt_tens.get_tt_ranks()
   dynamic_tt_ranks = shapes.tt_ranks(tt_tens)
@@ -93,8 +98,7 @@ def to_tt_matrix(mat, shape, max_tt_rank=10, epsilon=None):
   return TensorTrain(tt_cores, shape, tt_tens.get_tt_ranks())
 
 
-# TODO: implement epsilon.
-def to_tt_tensor(tens, max_tt_rank=10, epsilon=None):
+def to_tt_tensor(tens, max_tt_rank=10, epsilon=None, svd_backend=None):
   """Converts a given tf.Tensor to a TT-tensor of the same shape.
 
   Args:
@@ -122,6 +126,8 @@ def to_tt_tensor(tens, max_tt_rank=10, epsilon=None):
       the TT-ranks of the result undefined on the compilation stage
       (e.g. res.get_tt_ranks() will return None, but t3f.tt_ranks(res).eval()
       will work).
+    svd_backend: (Optional) the name of the `t3f.linalg` SVD backend, by
+      default the backend of the current `t3f.linalg.svd_backend` scope.
 
   Returns:
     `TensorTrain` object containing a TT-tensor.
@@ -137,16 +143,10 @@ def to_tt_tensor(tens, max_tt_rank=10, epsilon=None):
   dynamic_shape = tf.shape(tens)
   # Raises ValueError if ndims is not defined.
   d = static_shape.__len__()
-  max_tt_rank = np.array(max_tt_rank).astype(np.int32)
-  if max_tt_rank < 1:
-    raise ValueError('Maximum TT-rank should be greater or equal to 1.')
+  max_tt_rank = utils.max_tt_rank_vector(max_tt_rank, d)
   if epsilon is not None and epsilon < 0:
     raise ValueError('Epsilon should be non-negative.')
-  if max_tt_rank.size == 1:
-    max_tt_rank = (max_tt_rank * np.ones(d+1)).astype(np.int32)
-  elif max_tt_rank.size != d + 1:
-    raise ValueError('max_tt_rank should be a number or a vector of size (d+1) '
-                     'where d is the number of dimensions (rank) of the tensor.')
+  delta = _truncation_delta(tf.norm(tens), epsilon, d)
   ranks = [1] * (d + 1)
   tt_cores = []
   are_tt_ranks_defined = True
@@ -159,18 +159,13 @@ def to_tt_tensor(tens, max_tt_rank=10, epsilon=None):
     columns = tens.get_shape()[1].value
     if columns is None:
       columns = tf.shape(tens)[1]
-    s, u, v = tf.svd(tens, full_matrices=False)
-    if max_tt_rank[core_idx + 1] == 1:
-      ranks[core_idx + 1] = 1
-    else:
-      try:
-        ranks[core_idx + 1] = min(max_tt_rank[core_idx + 1], rows, columns)
-      except TypeError:
-        # Some of the values are undefined on the compilation stage and thus
-        # they are tf.tensors instead of values.
-        min_dim = tf.minimum(rows, columns)
-        ranks[core_idx + 1] = tf.minimum(max_tt_rank[core_idx + 1], min_dim)
-        are_tt_ranks_defined = False
+    s, u, v = linalg.svd(tens,
+                         _svd_rank_hint(max_tt_rank[core_idx + 1], delta),
+                         svd_backend)
+    ranks[core_idx + 1] = _truncation_rank(s, max_tt_rank[core_idx + 1], rows,
+                                           columns, delta)
+    if isinstance(ranks[core_idx + 1], tf.Tensor):
+      are_tt_ranks_defined = False
     u = u[:, 0:ranks[core_idx + 1]]
     s = s[0:ranks[core_idx + 1]]
     v = v[:, 0:ranks[core_idx + 1]]
@@ -187,8 +182,154 @@ def to_tt_tensor(tens, max_tt_rank=10, epsilon=None):
   return TensorTrain(tt_cores, static_shape, ranks)
 
 
+def to_tt_matrix_batch(mat, shape, max_tt_rank=10, epsilon=None,
+                       svd_backend=None):
+  """Converts a batch of matrices (or vectors) into a batch of TT-matrices.
+
+  All the matrices are decomposed at once with batched SVDs, so the graph is
+  of the same size as the graph of `to_tt_matrix` for a single matrix.
+
+  Args:
+    mat: three dimensional tf.Tensor (a batch of matrices).
+    shape: two dimensional array (np.array or list of lists), the tensor shape
+      of the matrices, see `to_tt_matrix`.
+    max_tt_rank: a number or a list of numbers, the maximal TT-ranks of the
+      result, see `to_tt_matrix`.
+    epsilon: a floating point number or None, see `to_tt_matrix`. The TT-ranks
+      are common for the batch, so each TT-rank is the largest TT-rank needed
+      to approximate any of the matrices with the relative error `epsilon`.
+    svd_backend: (Optional) the name of the `t3f.linalg` SVD backend, by
+      default the backend of the current `t3f.linalg.svd_backend` scope.
+
+  Returns:
+    `TensorTrainBatch` object containing TT-matrices.
+
+  Raises:
+    ValueError if max_tt_rank is less than 0, if max_tt_rank is not a number and
+      not a vector of length d + 1 where d is the number of dimensions (rank) of
+      the input tensor, if epsilon is less than 0.
+  """
+  mat = tf.convert_to_tensor(mat)
+  # In case the shape is immutable.
+  shape = list(shape)
+  # In case shape represents a vector, e.g. [None, [2, 2, 2]]
+  if shape[0] is None:
+    shape[0] = np.ones(len(shape[1])).astype(int)
+  # In case shape represents a vector, e.g. [[2, 2, 2], None]
+  if shape[1] is None:
+    shape[1] = np.ones(len(shape[0])).astype(int)
+
+  shape = np.array(shape)
+  batch_size = mat.get_shape()[0].value
+  if batch_size is None:
+    batch_size = tf.shape(mat)[0]
+  tens = tf.reshape(mat, np.concatenate(([-1], shape.flatten())))
+  d = len(shape[0])
+  # transpose_idx = 0, 1, d+1, 2, d+2 ...
+  transpose_idx = np.arange(2 * d).reshape(2, d).T.flatten()
+  transpose_idx = np.concatenate(([0], transpose_idx + 1)).astype(int)
+  tens = tf.transpose(tens, transpose_idx)
+  new_shape = np.prod(shape, axis=0)
+  tens = tf.reshape(tens, np.concatenate(([-1], new_shape)))
+  tt_tens = to_tt_tensor_batch(tens, max_tt_rank, epsilon, svd_backend)
+  tt_cores = []
+  static_tt_ranks = tt_tens.get_tt_ranks()
+  dynamic_tt_ranks = shapes.tt_ranks(tt_tens)
+  for core_idx in range(d):
+    curr_core = tt_tens.tt_cores[core_idx]
+    curr_rank = static_tt_ranks[core_idx].value
+    if curr_rank is None:
+      curr_rank = dynamic_tt_ranks[core_idx]
+    next_rank = static_tt_ranks[core_idx + 1].value
+    if next_rank is None:
+      next_rank = dynamic_tt_ranks[core_idx + 1]
+    curr_core_new_shape = (batch_size, curr_rank, shape[0, core_idx],
+                           shape[1, core_idx], next_rank)
+    curr_core = tf.reshape(curr_core, curr_core_new_shape)
+    tt_cores.append(curr_core)
+  return TensorTrainBatch(tt_cores, shape, tt_tens.get_tt_ranks(),
+                          tt_tens.batch_size)
+
+
+def to_tt_tensor_batch(tens, max_tt_rank=10, epsilon=None, svd_backend=None):
+  """Converts a batch of tensors (the first dimension) into a batch of TT.
+
+  All the tensors are decomposed at once with batched SVDs, so the graph is
+  of the same size as the graph of `to_tt_tensor` for a single tensor.
+
+  Args:
+    tens: tf.Tensor of shape B x n_1 x ... x n_d.
+    max_tt_rank: a number or a list of numbers, the maximal TT-ranks of the
+      result, see `to_tt_tensor`.
+    epsilon: a floating point number or None, see `to_tt_tensor`. The TT-ranks
+      are common for the batch, so each TT-rank is the largest TT-rank needed
+      to approximate any of the tensors with the relative error `epsilon`.
+    svd_backend: (Optional) the name of the `t3f.linalg` SVD backend, by
+      default the backend of the current `t3f.linalg.svd_backend` scope.
+
+  Returns:
+    `TensorTrainBatch` object containing TT-tensors.
+
+  Raises:
+    ValueError if the rank (number of dimensions) of the input tensor is
+      not defined, if max_tt_rank is less than 0, if max_tt_rank is not a number
+      and not a vector of length d + 1 where d is the number of dimensions (rank)
+      of the tensors, if epsilon is less than 0.
+  """
+  tens = tf.convert_to_tensor(tens)
+  static_shape = tens.get_shape()
+  dynamic_shape = tf.shape(tens)
+  # Raises ValueError if ndims is not defined.
+  d = static_shape.__len__() - 1
+  max_tt_rank = utils.max_tt_rank_vector(max_tt_rank, d)
+  if epsilon is not None and epsilon < 0:
+    raise ValueError('Epsilon should be non-negative.')
+  batch_size = static_shape[0].value
+  if batch_size is None:
+    batch_size = dynamic_shape[0]
+  norms = tf.norm(tf.reshape(tens, (batch_size, -1)), axis=1)
+  delta = _truncation_delta(norms, epsilon, d)
+  ranks = [1] * (d + 1)
+  tt_cores = []
+  are_tt_ranks_defined = True
+  for core_idx in range(d - 1):
+    curr_mode = static_shape[core_idx + 1].value
+    if curr_mode is None:
+      curr_mode = dynamic_shape[core_idx + 1]
+    rows = ranks[core_idx] * curr_mode
+    tens = tf.reshape(tens, [batch_size, rows, -1])
+    columns = tens.get_shape()[2].value
+    if columns is None:
+      columns = tf.shape(tens)[2]
+    s, u, v = linalg.svd(tens,
+                         _svd_rank_hint(max_tt_rank[core_idx + 1], delta),
+                         svd_backend)
+    # The TT-ranks are shared by all the tensors in the batch, so the largest
+    # of the ranks required by the tensors is used.
+    ranks[core_idx + 1] = _truncation_rank(s, max_tt_rank[core_idx + 1], rows,
+                                           columns, delta)
+    if isinstance(ranks[core_idx + 1], tf.Tensor):
+      are_tt_ranks_defined = False
+    u = u[:, :, 0:ranks[core_idx + 1]]
+    s = s[:, 0:ranks[core_idx + 1]]
+    v = v[:, :, 0:ranks[core_idx + 1]]
+    core_shape = (batch_size, ranks[core_idx], curr_mode, ranks[core_idx + 1])
+    tt_cores.append(tf.reshape(u, core_shape))
+    tens = tf.expand_dims(s, -1) * tf.matrix_transpose(v)
+  last_mode = static_shape[-1].value
+  if last_mode is None:
+    last_mode = dynamic_shape[-1]
+  core_shape = (batch_size, ranks[d - 1], last_mode, ranks[d])
+  tt_cores.append(tf.reshape(tens, core_shape))
+  if not are_tt_ranks_defined:
+    ranks = None
+  return TensorTrainBatch(tt_cores, static_shape[1:], ranks,
+                          static_shape[0].value)
+
+
 # TODO: rename round so not to shadow python.round?
-def round(tt, max_tt_rank=None, epsilon=None):
+def round(tt, max_tt_rank=None, epsilon=None, svd_backend=None,
+          qr_backend=None):
   """TT-rounding procedure, returns a TT object with smaller TT-ranks.
 
   Args:
@@ -202,6 +343,7 @@ def round(tt, max_tt_rank=None, epsilon=None):
         `max_tt_rank = r`
       and
         `max_tt_rank = r * np.ones(d-1)`
+      None (default) or np.inf mean that the TT-ranks are not restricted.
     epsilon: a floating point number or None
       If the TT-ranks are not restricted (`max_tt_rank=np.inf`), then
       the result would be guarantied to be `epsilon` close to `tt`
@@ -216,6 +358,10 @@ def round(tt, max_tt_rank=None, epsilon=None):
       the TT-ranks of the result undefined on the compilation stage
       (e.g. res.get_tt_ranks() will return None, but t3f.tt_ranks(res).eval()
       will work).
+    svd_backend: (Optional) the name of the `t3f.linalg` SVD backend, by
+      default the backend of the current `t3f.linalg.svd_backend` scope.
+    qr_backend: (Optional) the name of the `t3f.linalg` QR backend, by
+      default the backend of the current `t3f.linalg.qr_backend` scope.
 
   Returns:
     `TensorTrain` object containing a TT-tensor.
@@ -226,32 +372,28 @@ def round(tt, max_tt_rank=None, epsilon=None):
       the input tensor, if epsilon is less than 0.
   """
   if isinstance(tt, TensorTrainBatch):
-    return _round_batch_tt(tt, max_tt_rank, epsilon)
+    return _round_batch_tt(tt, max_tt_rank, epsilon, svd_backend, qr_backend)
   else:
-    return _round_tt(tt, max_tt_rank, epsilon)
+    return _round_tt(tt, max_tt_rank, epsilon, svd_backend, qr_backend)
 
 
-def _round_tt(tt, max_tt_rank, epsilon):
+def _round_tt(tt, max_tt_rank, epsilon, svd_backend, qr_backend):
   """Internal function that rounds a TensorTrain (not batch).
 
   See t3f.round for details.
   """
   ndims = tt.ndims()
-  max_tt_rank = np.array(max_tt_rank).astype(np.int32)
-  if max_tt_rank < 1:
-    raise ValueError('Maximum TT-rank should be greater or equal to 1.')
+  max_tt_rank = utils.max_tt_rank_vector(max_tt_rank, ndims)
   if epsilon is not None and epsilon < 0:
     raise ValueError('Epsilon should be non-negative.')
-  if max_tt_rank.size == 1:
-    max_tt_rank = (max_tt_rank * np.ones(ndims + 1)).astype(np.int32)
-  elif max_tt_rank.size != ndims + 1:
-    raise ValueError('max_tt_rank should be a number or a vector of size (d+1) '
-                     'where d is the number of dimensions (rank) of the tensor.')
   raw_shape = shapes.lazy_raw_shape(tt)
 
-  tt_cores = orthogonalize_tt_cores(tt).tt_cores
+  tt_cores = orthogonalize_tt_cores(tt, qr_backend=qr_backend).tt_cores
   # Copy cores references so we can change the cores.
   tt_cores = list(tt_cores)
+  # The TT-cores are left-orthogonal, so the norm of the TT-object is the norm
+  # of its last TT-core.
+  delta = _truncation_delta(tf.norm(tt_cores[-1]), epsilon, ndims)
 
   ranks = [1] * (ndims + 1)
   are_tt_ranks_defined = True
@@ -270,18 +412,13 @@ def _round_tt(tt, max_tt_rank, epsilon):
     rows = curr_core.get_shape()[0].value
     if rows is None:
       rows = tf.shape(curr_core)[0]
-    if max_tt_rank[core_idx] == 1:
-      ranks[core_idx] = 1
-    else:
-      try:
-        ranks[core_idx] = min(max_tt_rank[core_idx], rows, columns)
-      except TypeError:
-        # Some of the values are undefined on the compilation stage and thus
-        # they are tf.tensors instead of values.
-        min_dim = tf.minimum(rows, columns)
-        ranks[core_idx] = tf.minimum(max_tt_rank[core_idx], min_dim)
-        are_tt_ranks_defined = False
-    s, u, v = tf.svd(curr_core, full_matrices=False)
+    s, u, v = linalg.svd(curr_core,
+                         _svd_rank_hint(max_tt_rank[core_idx], delta),
+                         svd_backend)
+    ranks[core_idx] = _truncation_rank(s, max_tt_rank[core_idx], rows, columns,
+                                       delta)
+    if isinstance(ranks[core_idx], tf.Tensor):
+      are_tt_ranks_defined = False
     u = u[:, 0:ranks[core_idx]]
     s = s[0:ranks[core_idx]]
     v = v[:, 0:ranks[core_idx]]
@@ -303,31 +440,31 @@ def _round_tt(tt, max_tt_rank, epsilon):
   tt_cores[0] = tf.reshape(tt_cores[0], core_shape)
   if not are_tt_ranks_defined:
     ranks = None
-  return TensorTrain(tt_cores, tt.get_raw_shape(), ranks)
+  res = TensorTrain(tt_cores, tt.get_raw_shape(), ranks)
+  # The TT-cores are the right singular vectors.
+  res._orthogonality = 'right'
+  return res
 
 
-def _round_batch_tt(tt, max_tt_rank, epsilon):
+def _round_batch_tt(tt, max_tt_rank, epsilon, svd_backend, qr_backend):
   """Internal function that rounds a TensorTrainBatch.
 
   See t3f.round for details.
   """
   ndims = tt.ndims()
-  max_tt_rank = np.array(max_tt_rank).astype(np.int32)
-  if max_tt_rank < 1:
-    raise ValueError('Maximum TT-rank should be greater or equal to 1.')
+  max_tt_rank = utils.max_tt_rank_vector(max_tt_rank, ndims)
   if epsilon is not None and epsilon < 0:
     raise ValueError('Epsilon should be non-negative.')
-  if max_tt_rank.size == 1:
-    max_tt_rank = (max_tt_rank * np.ones(ndims + 1)).astype(np.int32)
-  elif max_tt_rank.size != ndims + 1:
-    raise ValueError('max_tt_rank should be a number or a vector of size (d+1) '
-                     'where d is the number of dimensions (rank) of the tensor.')
   raw_shape = shapes.lazy_raw_shape(tt)
   batch_size = shapes.lazy_batch_size(tt)
 
-  tt_cores = orthogonalize_tt_cores(tt).tt_cores
+  tt_cores = orthogonalize_tt_cores(tt, qr_backend=qr_backend).tt_cores
   # Copy cores references so we can change the cores.
   tt_cores = list(tt_cores)
+  # The TT-cores are left-orthogonal, so the norms of the TT-objects are the
+  # norms of their last TT-cores.
+  last_core = tf.reshape(tt_cores[-1], (batch_size, -1))
+  delta = _truncation_delta(tf.norm(last_core, axis=1), epsilon, ndims)
 
   ranks = [1] * (ndims + 1)
   are_tt_ranks_defined = True
@@ -346,18 +483,15 @@ def _round_batch_tt(tt, max_tt_rank, epsilon):
     rows = curr_core.get_shape()[1].value
     if rows is None:
       rows = tf.shape(curr_core)[1]
-    if max_tt_rank[core_idx] == 1:
-      ranks[core_idx] = 1
-    else:
-      try:
-        ranks[core_idx] = min(max_tt_rank[core_idx], rows, columns)
-      except TypeError:
-        # Some of the values are undefined on the compilation stage and thus
-        # they are tf.tensors instead of values.
-        min_dim = tf.minimum(rows, columns)
-        ranks[core_idx] = tf.minimum(max_tt_rank[core_idx], min_dim)
-        are_tt_ranks_defined = False
-    s, u, v = tf.svd(curr_core, full_matrices=False)
+    s, u, v = linalg.svd(curr_core,
+                         _svd_rank_hint(max_tt_rank[core_idx], delta),
+                         svd_backend)
+    # The TT-ranks are shared by all the objects in the batch, so the largest
+    # of the ranks required by the objects is used.
+    ranks[core_idx] = _truncation_rank(s, max_tt_rank[core_idx], rows, columns,
+                                       delta)
+    if isinstance(ranks[core_idx], tf.Tensor):
+      are_tt_ranks_defined = False
     u = u[:, :, 0:ranks[core_idx]]
     s = s[:, 0:ranks[core_idx]]
     v = v[:, :, 0:ranks[core_idx]]
@@ -379,36 +513,393 @@ def _round_batch_tt(tt, max_tt_rank, epsilon):
   tt_cores[0] = tf.reshape(tt_cores[0], core_shape)
   if not are_tt_ranks_defined:
     ranks = None
-  return TensorTrainBatch(tt_cores, tt.get_raw_shape(), ranks, batch_size=tt.batch_size)
+  res = TensorTrainBatch(tt_cores, tt.get_raw_shape(), ranks,
+                         batch_size=tt.batch_size)
+  # The TT-cores are the right singular vectors.
+  res._orthogonality = 'right'
+  return res
+
+
+def randomized_round(tt, max_tt_rank, epsilon=None, oversampling=10,
+                     method='randomize_then_orthogonalize', seed=None):
+  """Randomized TT-rounding procedure, returns a TT object with smaller TT-ranks.
 
+  Replaces the SVDs of the large TT-cores in `round` with random sketches:
+  the TT-object is projected onto the range of its products with a random
+  Gaussian TT-object (or a random Gaussian matrix) with TT-ranks
+  max_tt_rank + oversampling, and the (small) result is rounded to max_tt_rank
+  with the deterministic `round`. See
+    Al Daas et al., Randomized algorithms for rounding in the Tensor-Train
+    format, 2021.
+  The methods are
+    'randomize_then_orthogonalize': computes the contractions of the
+      TT-object with a random TT-tensor of TT-ranks l = R + oversampling right
+      to left and orthogonalizes the sketched TT-cores left to right.
+      O(d n r l (r + l)) operations and no orthogonalization of the
+      TT-object.
+    'orthogonalize_then_randomize': right-to-left orthogonalizes the TT-object
+      and then sketches its TT-cores left to right with random Gaussian
+      matrices. O(d n r^3) operations, same as in `round`, but the SVDs of
+      n r x r matrices are replaced with matrix products and QRs.
+  Both are much faster than `round` when the TT-ranks of tt are much larger
+  than max_tt_rank (e.g. for sums of many TT-objects).
 
-def orthogonalize_tt_cores(tt, left_to_right=True):
+  Args:
+    tt: `TensorTrain` or `TensorTrainBatch` object, TT-tensor or TT-matrix
+    max_tt_rank: a number or a list of numbers, see `t3f.round`.
+    epsilon: a floating point number or None, see `t3f.round`.
+    oversampling: int, the TT-ranks of the sketch are max_tt_rank +
+      oversampling.
+    method: 'randomize_then_orthogonalize' or 'orthogonalize_then_randomize'.
+    seed: Python integer, used to create the random sketch. See
+      `tf.set_random_seed` for behavior.
+
+  Returns:
+    `TensorTrain` or `TensorTrainBatch` object (the same as `tt`).
+
+  Raises:
+    ValueError if max_tt_rank is less than 0, if max_tt_rank is not a number and
+      not a vector of length d + 1 where d is the number of dimensions (rank) of
+      the input tensor, if epsilon or oversampling is less than 0, or if the
+      method is unknown.
+  """
+  ndims = tt.ndims()
+  max_tt_rank = utils.max_tt_rank_vector(max_tt_rank, ndims)
+  if oversampling < 0:
+    raise ValueError('Oversampling should be non-negative.')
+  if method not in ('randomize_then_orthogonalize',
+                    'orthogonalize_then_randomize'):
+    raise ValueError('Unknown method "%s", should be either '
+                     '"randomize_then_orthogonalize" or '
+                     '"orthogonalize_then_randomize".' % method)
+
+  # The TT-ranks of the sketch.
+  sketch_ranks = np.minimum(max_tt_rank.astype(np.int64) + oversampling,
+                            np.iinfo(np.int32).max).astype(np.int32)
+  sketch_ranks[0] = sketch_ranks[-1] = 1
+  static_ranks = tt.get_tt_ranks()
+  if static_ranks.is_fully_defined():
+    # Sketching with a larger TT-rank than the TT-rank of tt is useless.
+    sketch_ranks = np.minimum(sketch_ranks, static_ranks.as_list())
+
+  is_batch = isinstance(tt, TensorTrainBatch)
+  batch_str = 'o' if is_batch else ''
+  if method == 'orthogonalize_then_randomize':
+    tt = orthogonalize_tt_cores(tt, left_to_right=False)
+  raw_shape = shapes.lazy_raw_shape(tt)
+  ranks = shapes.lazy_tt_ranks(tt)
+  modes = []
+  for core_idx in range(ndims):
+    curr_mode = raw_shape[0][core_idx]
+    if tt.is_tt_matrix():
+      curr_mode *= raw_shape[1][core_idx]
+    modes.append(curr_mode)
+
+  def random_normal(shape, core_idx):
+    curr_seed = None if seed is None else seed + core_idx
+    return tf.random_normal(shape, dtype=tt.dtype, seed=curr_seed)
+
+  if method == 'randomize_then_orthogonalize':
+    # right_parts[k] is the contraction of the TT-cores k, ..., d-1 of tt and
+    # of a random TT-tensor (the same for all the batch elements), it is of
+    # size [batch_size] x r_k x l_k.
+    right_parts = [None] * (ndims + 1)
+    right_parts[ndims] = tf.ones((1, 1), dtype=tt.dtype)
+    einsum_str = '{0}aib,cid,{1}bd->{0}ac'
+    for core_idx in range(ndims - 1, 0, -1):
+      curr_core = tf.reshape(tt.tt_cores[core_idx],
+                             _core_shape(tt, ranks[core_idx], modes[core_idx],
+                                         ranks[core_idx + 1]))
+      random_core = random_normal((sketch_ranks[core_idx], modes[core_idx],
+                                   sketch_ranks[core_idx + 1]), core_idx)
+      right_str = batch_str if core_idx < ndims - 1 else ''
+      curr_einsum_str = einsum_str.format(batch_str, right_str)
+      right_parts[core_idx] = tf.einsum(curr_einsum_str, curr_core,
+                                        random_core, right_parts[core_idx + 1])
+
+  # Left to right: sketch the current TT-core, orthogonalize the sketch and
+  # project the TT-core onto it.
+  new_ranks = [1] * (ndims + 1)
+  are_tt_ranks_defined = True
+  tt_cores = []
+  # The projection of the first TT-cores of tt onto the computed TT-cores,
+  # of size [batch_size] x new_ranks[k] x ranks[k].
+  left_factor = None
+  for core_idx in range(ndims):
+    curr_core = tf.reshape(tt.tt_cores[core_idx],
+                           _core_shape(tt, ranks[core_idx], -1,
+                                       ranks[core_idx + 1]))
+    if left_factor is not None:
+      curr_core = tf.einsum('{0}ab,{0}bic->{0}aic'.format(batch_str),
+                            left_factor, curr_core)
+    rows = new_ranks[core_idx] * modes[core_idx]
+    curr_core = tf.reshape(curr_core, _core_shape(tt, rows,
+                                                  ranks[core_idx + 1]))
+    if core_idx == ndims - 1:
+      tt_cores.append(curr_core)
+      break
+    if method == 'randomize_then_orthogonalize':
+      sketch = tf.einsum('{0}ab,{0}bc->{0}ac'.format(batch_str), curr_core,
+                         right_parts[core_idx + 1])
+    else:
+      random_matrix = random_normal((ranks[core_idx + 1],
+                                     sketch_ranks[core_idx + 1]), core_idx)
+      sketch = tf.einsum('{0}ab,bc->{0}ac'.format(batch_str), curr_core,
+                         random_matrix)
+    q, _ = linalg.qr(sketch)
+    try:
+      new_ranks[core_idx + 1] = min(rows, sketch_ranks[core_idx + 1])
+    except TypeError:
+      # Some of the values are undefined on the compilation stage and thus
+      # they are tf.tensors instead of values.
+      new_ranks[core_idx + 1] = tf.minimum(rows, sketch_ranks[core_idx + 1])
+      are_tt_ranks_defined = False
+    tt_cores.append(q)
+    left_factor = tf.matmul(q, curr_core, transpose_a=True)
+
+  for core_idx in range(ndims):
+    core_shape = [new_ranks[core_idx]]
+    if tt.is_tt_matrix():
+      core_shape += [raw_shape[0][core_idx], raw_shape[1][core_idx]]
+    else:
+      core_shape += [raw_shape[0][core_idx]]
+    core_shape += [new_ranks[core_idx + 1]]
+    if is_batch:
+      core_shape = [shapes.lazy_batch_size(tt)] + core_shape
+    tt_cores[core_idx] = tf.reshape(tt_cores[core_idx], core_shape)
+  if not are_tt_ranks_defined:
+    new_ranks = None
+  if is_batch:
+    sketched = TensorTrainBatch(tt_cores, tt.get_raw_shape(), new_ranks,
+                                tt.batch_size)
+  else:
+    sketched = TensorTrain(tt_cores, tt.get_raw_shape(), new_ranks)
+  return round(sketched, max_tt_rank, epsilon)
+
+
+def _core_shape(tt, *shape):
+  """Prepends the batch size to the shape if tt is a `TensorTrainBatch`."""
+  if isinstance(tt, TensorTrainBatch):
+    return (shapes.lazy_batch_size(tt),) + shape
+  else:
+    return shape
+
+
+def orthogonalize_tt_cores(tt, left_to_right=True, qr_backend=None):
   """Orthogonalize TT-cores of a TT-object.
 
   Args:
     tt: TenosorTrain or a TensorTrainBatch.
     left_to_right: bool, the direction of orthogonalization.
+    qr_backend: (Optional) the name of the `t3f.linalg` QR backend, by
+      default the backend of the current `t3f.linalg.qr_backend` scope.
+
+  The result is cached in `tt`, so orthogonalizing the same object again
+  with the same QR backend and in the same graph and control flow context
+  (e.g. in `round` and then in `frobenius_norm`) reuses the QR
+  decompositions, and a TT-object that is already orthogonal in the
+  requested direction (see `tt.orthogonality`) is returned as is.
 
   Returns:
     The same type as the input `tt` (TenosorTrain or a TensorTrainBatch).
   """
+  orthogonality = 'left' if left_to_right else 'right'
+  if tt.orthogonality == orthogonality:
+    return tt
+  cache = tt._cache()
+  cache_key = _orthogonalization_cache_key(orthogonality, qr_backend)
+  if cache_key is not None and cache_key in cache:
+    return cache[cache_key]
   if isinstance(tt, TensorTrainBatch):
     if left_to_right:
-      return _orthogonalize_batch_tt_cores_left_to_right(tt)
+      res = _orthogonalize_batch_tt_cores_left_to_right(tt, qr_backend)
     else:
-      raise NotImplementedError('Batch right to left orthogonalization is not '
-                                'supported yet.')
+      res = _orthogonalize_batch_tt_cores_right_to_left(tt, qr_backend)
   else:
     if left_to_right:
-      return _orthogonalize_tt_cores_left_to_right(tt)
+      res = _orthogonalize_tt_cores_left_to_right(tt, qr_backend)
     else:
-      return _orthogonalize_tt_cores_right_to_left(tt)
+      res = _orthogonalize_tt_cores_right_to_left(tt, qr_backend)
+  res._orthogonality = orthogonality
+  if cache_key is not None:
+    cache[cache_key] = res
+  return res
+
+
+def _orthogonalization_cache_key(orthogonality, qr_backend):
+  """Returns the key of the cached orthogonalization or None if uncacheable.
+
+  The cached tensors can be reused only with the same QR backend and in the
+  same graph and control flow context (e.g. not inside another `tf.cond` or
+  `tf.while_loop`). Inside `tf.control_dependencies` the orthogonalization is
+  not cached since the cached tensors would bypass the dependencies.
+  """
+  graph = tf.get_default_graph()
+  if graph._control_dependencies_stack:
+    return None
+  if qr_backend is None:
+    qr_backend = linalg.get_qr_backend()
+  return (orthogonality, qr_backend, graph, graph._get_control_flow_context())
 
 
-def _orthogonalize_tt_cores_left_to_right(tt):
+def to_mixed_canonical(tt, center, qr_backend=None):
+  """Converts a TT-object into the mixed-canonical form.
+
+  In the mixed-canonical form with the orthogonality center `center` the
+  TT-cores to the left of the center are left-orthogonal, the TT-cores to the
+  right of the center are right-orthogonal, and the TT-core `center` carries
+  the norm of the TT-object. Use `move_orthogonality_center` to move the
+  center afterwards, which is cheaper than converting again.
+
+  Args:
+    tt: `TensorTrain` or `TensorTrainBatch`.
+    center: int in [0, d-1], the index of the non-orthogonal TT-core.
+    qr_backend: (Optional) the name of the `t3f.linalg` QR backend, by
+      default the backend of the current `t3f.linalg.qr_backend` scope.
+
+  Returns:
+    The same type as the input `tt` representing the same tensor(s).
+
+  Raises:
+    ValueError if center is not in [0, d-1].
+  """
+  ndims = tt.ndims()
+  if center < 0 or center >= ndims:
+    raise ValueError('center should be in [0, %d], got %d.' %
+                     (ndims - 1, center))
+  tt_cores = list(tt.tt_cores)
+  for core_idx in range(center):
+    _orthogonalize_core_left(tt, tt_cores, core_idx, qr_backend)
+  for core_idx in range(ndims - 1, center, -1):
+    _orthogonalize_core_right(tt, tt_cores, core_idx, qr_backend)
+  return _replace_tt_cores(tt, tt_cores, center)
+
+
+def move_orthogonality_center(tt, center, new_center, qr_backend=None):
+  """Moves the orthogonality center of a TT-object in the mixed-canonical form.
+
+  Costs one QR of a TT-core per site the center moves by, e.g.
+    tt = t3f.to_mixed_canonical(tt, 0)
+    for center in range(d - 1):
+      tt = t3f.move_orthogonality_center(tt, center, center + 1)
+      ...
+  does d - 1 QRs in total, as much as a single `to_mixed_canonical` call.
+
+  Args:
+    tt: `TensorTrain` or `TensorTrainBatch` in the mixed-canonical form with
+      the orthogonality center `center` (see `to_mixed_canonical`).
+    center: int in [0, d-1], the current orthogonality center.
+    new_center: int in [0, d-1], the new orthogonality center.
+    qr_backend: (Optional) the name of the `t3f.linalg` QR backend, by
+      default the backend of the current `t3f.linalg.qr_backend` scope.
+
+  Returns:
+    The same type as the input `tt` in the mixed-canonical form with the
+    orthogonality center `new_center`.
+
+  Raises:
+    ValueError if center or new_center is not in [0, d-1].
+  """
+  ndims = tt.ndims()
+  for curr_center in (center, new_center):
+    if curr_center < 0 or curr_center >= ndims:
+      raise ValueError('The orthogonality center should be in [0, %d], got '
+                       '%d.' % (ndims - 1, curr_center))
+  tt_cores = list(tt.tt_cores)
+  for core_idx in range(center, new_center):
+    _orthogonalize_core_left(tt, tt_cores, core_idx, qr_backend)
+  for core_idx in range(center, new_center, -1):
+    _orthogonalize_core_right(tt, tt_cores, core_idx, qr_backend)
+  return _replace_tt_cores(tt, tt_cores, new_center)
+
+
+def _lazy_shape(tensor):
+  """Returns the list of static dimensions or scalar tf.Tensors if unknown."""
+  static_shape = tensor.get_shape().as_list()
+  dynamic_shape = tf.shape(tensor)
+  return [dim if dim is not None else dynamic_shape[i]
+          for i, dim in enumerate(static_shape)]
+
+
+def _orthogonalize_core_left(tt, tt_cores, core_idx, qr_backend):
+  """Makes the TT-core left-orthogonal, R goes into the next TT-core.
+
+  Args:
+    tt: `TensorTrain` or `TensorTrainBatch`, the owner of the TT-cores.
+    tt_cores: list of the TT-cores, updated in place.
+    core_idx: the index of the TT-core to orthogonalize, in [0, d-2].
+    qr_backend: the name of the `t3f.linalg` QR backend or None.
+  """
+  num_batch_dims = 1 if isinstance(tt, TensorTrainBatch) else 0
+  curr_shape = _lazy_shape(tt_cores[core_idx])
+  next_shape = _lazy_shape(tt_cores[core_idx + 1])
+  rank = curr_shape[-1]
+  curr_core = tf.reshape(tt_cores[core_idx], _core_shape(tt, -1, rank))
+  curr_core, triang = linalg.qr(curr_core, qr_backend)
+  # The TT-rank can decrease if the TT-core has less rows than columns.
+  new_rank = _lazy_shape(triang)[-2]
+  tt_cores[core_idx] = tf.reshape(curr_core, curr_shape[:-1] + [new_rank])
+  next_core = tf.reshape(tt_cores[core_idx + 1], _core_shape(tt, rank, -1))
+  next_core = tf.matmul(triang, next_core)
+  new_next_shape = (next_shape[:num_batch_dims] + [new_rank] +
+                    next_shape[num_batch_dims + 1:])
+  tt_cores[core_idx + 1] = tf.reshape(next_core, new_next_shape)
+
+
+def _orthogonalize_core_right(tt, tt_cores, core_idx, qr_backend):
+  """Makes the TT-core right-orthogonal, L goes into the previous TT-core.
+
+  Args:
+    tt: `TensorTrain` or `TensorTrainBatch`, the owner of the TT-cores.
+    tt_cores: list of the TT-cores, updated in place.
+    core_idx: the index of the TT-core to orthogonalize, in [1, d-1].
+    qr_backend: the name of the `t3f.linalg` QR backend or None.
+  """
+  num_batch_dims = 1 if isinstance(tt, TensorTrainBatch) else 0
+  curr_shape = _lazy_shape(tt_cores[core_idx])
+  prev_shape = _lazy_shape(tt_cores[core_idx - 1])
+  rank = curr_shape[num_batch_dims]
+  curr_core = tf.reshape(tt_cores[core_idx], _core_shape(tt, rank, -1))
+  # LQ decomposition as a QR decomposition of the transposed TT-core.
+  curr_core, triang = linalg.qr(tf.matrix_transpose(curr_core), qr_backend)
+  new_rank = _lazy_shape(triang)[-2]
+  new_curr_shape = (curr_shape[:num_batch_dims] + [new_rank] +
+                    curr_shape[num_batch_dims + 1:])
+  tt_cores[core_idx] = tf.reshape(tf.matrix_transpose(curr_core),
+                                  new_curr_shape)
+  prev_core = tf.reshape(tt_cores[core_idx - 1], _core_shape(tt, -1, rank))
+  prev_core = tf.matmul(prev_core, triang, transpose_b=True)
+  tt_cores[core_idx - 1] = tf.reshape(prev_core, prev_shape[:-1] + [new_rank])
+
+
+def _replace_tt_cores(tt, tt_cores, center):
+  """Creates a TT-object of the same type and shape as tt from the TT-cores.
+
+  Args:
+    tt: `TensorTrain` or `TensorTrainBatch`.
+    tt_cores: list of the TT-cores in the mixed-canonical form.
+    center: the orthogonality center of the TT-cores.
+
+  Returns:
+    The same type as `tt`.
+  """
+  if isinstance(tt, TensorTrainBatch):
+    res = TensorTrainBatch(tt_cores, tt.get_raw_shape(),
+                           batch_size=tt.batch_size)
+  else:
+    res = TensorTrain(tt_cores, tt.get_raw_shape())
+  if center == tt.ndims() - 1:
+    res._orthogonality = 'left'
+  elif center == 0:
+    res._orthogonality = 'right'
+  return res
+
+
+def _orthogonalize_tt_cores_left_to_right(tt, qr_backend=None):
   """Orthogonalize TT-cores of a TT-object in the left to right order.
   Args:
     tt: TenosorTrain or a TensorTrainBatch.
+    qr_backend: the name of the `t3f.linalg` QR backend or None.
   Returns:
     The same type as the input `tt` (TenosorTrain or a TensorTrainBatch).
   """
@@ -435,7 +926,7 @@ def _orthogonalize_tt_cores_left_to_right(tt):
 
     qr_shape = (curr_rank * curr_mode, next_rank)
     curr_core = tf.reshape(curr_core, qr_shape)
-    curr_core, triang = tf.qr(curr_core)
+    curr_core, triang = linalg.qr(curr_core, qr_backend)
     if triang.get_shape().is_fully_defined():
       triang_shape = triang.get_shape().as_list()
     else:
@@ -462,11 +953,12 @@ def _orthogonalize_tt_cores_left_to_right(tt):
   return TensorTrain(tt_cores, tt.get_raw_shape())
 
 
-def _orthogonalize_batch_tt_cores_left_to_right(tt):
+def _orthogonalize_batch_tt_cores_left_to_right(tt, qr_backend=None):
   """Orthogonalize TT-cores of a batch TT-object in the left to right order.
 
   Args:
     tt: TensorTrainBatch.
+    qr_backend: the name of the `t3f.linalg` QR backend or None.
 
   Returns:
     TensorTrainBatch
@@ -496,7 +988,7 @@ def _orthogonalize_batch_tt_cores_left_to_right(tt):
 
     qr_shape = (batch_size, curr_rank * curr_mode, next_rank)
     curr_core = tf.reshape(curr_core, qr_shape)
-    curr_core, triang = tf.qr(curr_core)
+    curr_core, triang = linalg.qr(curr_core, qr_backend)
     if triang.get_shape().is_fully_defined():
       triang_shape = triang.get_shape().as_list()
     else:
@@ -526,11 +1018,12 @@ def _orthogonalize_batch_tt_cores_left_to_right(tt):
   return TensorTrainBatch(tt_cores, tt.get_raw_shape(), batch_size=batch_size)
 
 
-def _orthogonalize_tt_cores_right_to_left(tt):
+def _orthogonalize_tt_cores_right_to_left(tt, qr_backend=None):
   """Orthogonalize TT-cores of a TT-object in the right to left order.
 
   Args:
     tt: TenosorTrain or a TensorTrainBatch.
+    qr_backend: the name of the `t3f.linalg` QR backend or None.
 
   Returns:
     The same type as the input `tt` (TenosorTrain or a TensorTrainBatch).
@@ -558,7 +1051,7 @@ def _orthogonalize_tt_cores_right_to_left(tt):
 
     qr_shape = (prev_rank, curr_mode * curr_rank)
     curr_core = tf.reshape(curr_core, qr_shape)
-    curr_core, triang = tf.qr(tf.transpose(curr_core))
+    curr_core, triang = linalg.qr(tf.transpose(curr_core), qr_backend)
     curr_core = tf.transpose(curr_core)
     triang = tf.transpose(triang)
     if triang.get_shape().is_fully_defined():
@@ -585,3 +1078,140 @@ def _orthogonalize_tt_cores_right_to_left(tt):
   tt_cores[0] = tf.reshape(tt_cores[0], first_core_shape)
   # TODO: infer the tt_ranks.
   return TensorTrain(tt_cores, tt.get_raw_shape())
+
+
+def _orthogonalize_batch_tt_cores_right_to_left(tt, qr_backend=None):
+  """Orthogonalize TT-cores of a batch TT-object in the right to left order.
+
+  Args:
+    tt: TensorTrainBatch.
+    qr_backend: the name of the `t3f.linalg` QR backend or None.
+
+  Returns:
+    TensorTrainBatch
+  """
+  # Right to left orthogonalization.
+  ndims = tt.ndims()
+  raw_shape = shapes.lazy_raw_shape(tt)
+  tt_ranks = shapes.lazy_tt_ranks(tt)
+  prev_rank = tt_ranks[ndims]
+  batch_size = shapes.lazy_batch_size(tt)
+
+  # Copy cores references so we can change the cores.
+  tt_cores = list(tt.tt_cores)
+  for core_idx in range(ndims - 1, 0, -1):
+    curr_core = tt_cores[core_idx]
+    # TT-ranks could have changed on the previous iteration, so `tt_ranks` can
+    # be outdated for the current TT-rank, but should be valid for the next
+    # TT-rank.
+    curr_rank = prev_rank
+    prev_rank = tt_ranks[core_idx]
+    if tt.is_tt_matrix():
+      curr_mode_left = raw_shape[0][core_idx]
+      curr_mode_right = raw_shape[1][core_idx]
+      curr_mode = curr_mode_left * curr_mode_right
+    else:
+      curr_mode = raw_shape[0][core_idx]
+
+    qr_shape = (batch_size, prev_rank, curr_mode * curr_rank)
+    curr_core = tf.reshape(curr_core, qr_shape)
+    curr_core, triang = linalg.qr(tf.matrix_transpose(curr_core),
+                                  qr_backend)
+    curr_core = tf.matrix_transpose(curr_core)
+    triang = tf.matrix_transpose(triang)
+    if triang.get_shape().is_fully_defined():
+      triang_shape = triang.get_shape().as_list()
+    else:
+      triang_shape = tf.shape(triang)
+    # The TT-rank could have changed: if qr_shape is e.g. 4 x 10, than q would
+    # be of size 4 x 4 and r would be 4 x 10, which means that the next rank
+    # should be changed to 4.
+    prev_rank = triang_shape[2]
+    if tt.is_tt_matrix():
+      new_core_shape = (batch_size, prev_rank, curr_mode_left, curr_mode_right,
+                        curr_rank)
+    else:
+      new_core_shape = (batch_size, prev_rank, curr_mode, curr_rank)
+    tt_cores[core_idx] = tf.reshape(curr_core, new_core_shape)
+
+    prev_core = tf.reshape(tt_cores[core_idx - 1], (batch_size, -1,
+                                                    triang_shape[1]))
+    tt_cores[core_idx - 1] = tf.matmul(prev_core, triang)
+
+  if tt.is_tt_matrix():
+    first_core_shape = (batch_size, 1, raw_shape[0][0], raw_shape[1][0],
+                        prev_rank)
+  else:
+    first_core_shape = (batch_size, 1, raw_shape[0][0], prev_rank)
+  tt_cores[0] = tf.reshape(tt_cores[0], first_core_shape)
+  # TODO: infer the tt_ranks.
+  return TensorTrainBatch(tt_cores, tt.get_raw_shape(), batch_size=batch_size)
+
+
+def _truncation_delta(norm, epsilon, ndims):
+  """Returns the threshold for the singular values tails of each unfolding.
+
+  Truncating each of the d-1 unfoldings with the error at most
+  delta = epsilon / sqrt(d-1) * ||A|| guarantees that the relative error of
+  the result is at most epsilon.
+
+  Args:
+    norm: tf.Tensor, the Frobenius norm of the tensor (or a vector of norms
+      for a batch).
+    epsilon: a floating point number or None.
+    ndims: the number of dimensions d.
+
+  Returns:
+    tf.Tensor of the same shape as norm or None if epsilon is None.
+  """
+  if epsilon is None:
+    return None
+  return epsilon / np.sqrt(max(ndims - 1, 1)) * norm
+
+
+def _svd_rank_hint(max_rank, delta):
+  """Returns the rank hint for `t3f.linalg.svd`.
+
+  The truncation to the error delta needs all the singular values, so the
+  backends that compute a partial SVD (e.g. 'randomized') should compute the
+  full one.
+  """
+  if delta is None:
+    return max_rank
+  return None
+
+
+def _truncation_rank(s, max_rank, rows, columns, delta):
+  """Chooses the rank of the truncated SVD of a matrix (or a batch).
+
+  Args:
+    s: tf.Tensor with the singular values in the decreasing order, or a batch
+      of them.
+    max_rank: the maximal rank.
+    rows: the number of rows of the matrix, a number or a tf.Tensor.
+    columns: the number of columns of the matrix, a number or a tf.Tensor.
+    delta: None or tf.Tensor with the maximal Frobenius norm of the error
+      (or a vector of them for a batch).
+
+  Returns:
+    The rank, a number if it is known on the compilation stage or a tf.Tensor
+    otherwise. For a batch, the maximal rank over the batch.
+  """
+  if max_rank == 1:
+    return 1
+  try:
+    rank = int(min(max_rank, rows, columns))
+  except TypeError:
+    # Some of the values are undefined on the compilation stage and thus
+    # they are tf.tensors instead of values.
+    min_dim = tf.minimum(rows, columns)
+    rank = tf.minimum(max_rank, min_dim)
+  if delta is None:
+    return rank
+  # tail_norms[..., k] is the error of truncating to rank k.
+  tail_norms = tf.sqrt(tf.cumsum(tf.square(s), axis=-1, reverse=True))
+  delta = tf.expand_dims(tf.cast(delta, s.dtype), -1)
+  epsilon_rank = tf.reduce_sum(tf.cast(tail_norms > delta, tf.int32), axis=-1)
+  # The same rank for all the objects in a batch.
+  epsilon_rank = tf.reduce_max(epsilon_rank)
+  return tf.minimum(rank, tf.maximum(epsilon_rank, 1))
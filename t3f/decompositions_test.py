@@ -1,10 +1,26 @@
 import numpy as np
 import tensorflow as tf
 
+from t3f.tensor_train import TensorTrain
+from t3f.tensor_train_batch import TensorTrainBatch
 from t3f import ops
 from t3f import shapes
 from t3f import decompositions
 from t3f import initializers
+from t3f import linalg
+
+
+def _mixed_canonical_errors(tt_cores, center):
+  """Deviations from orthogonality of the TT-cores (numpy, no batch)."""
+  errors = []
+  for core_idx, core in enumerate(tt_cores):
+    if core_idx < center:
+      core = core.reshape(-1, core.shape[-1])
+      errors.append(np.abs(core.T.dot(core) - np.eye(core.shape[1])).max())
+    elif core_idx > center:
+      core = core.reshape(core.shape[0], -1)
+      errors.append(np.abs(core.dot(core.T) - np.eye(core.shape[0])).max())
+  return errors
 
 
 class DecompositionsTest(tf.test.TestCase):
@@ -90,6 +106,194 @@ class DecompositionsTest(tf.test.TestCase):
       dynamic_tt_ranks = shapes.tt_ranks(rounded_tens).eval()
       self.assertAllEqual([1, 2, 2, 8, 3, 1], dynamic_tt_ranks)
 
+  def testTTTensorEpsilon(self):
+    shape = (3, 4, 5, 4)
+    np.random.seed(1)
+    tens = np.random.rand(*shape).astype(np.float32)
+    tf_tens = tf.constant(tens)
+    with self.test_session() as sess:
+      prev_ranks = None
+      for epsilon in [1e-2, 0.1, 0.3]:
+        tt_tens = decompositions.to_tt_tensor(tf_tens, max_tt_rank=np.inf,
+                                              epsilon=epsilon)
+        tt_val, ranks = sess.run([ops.full(tt_tens), shapes.tt_ranks(tt_tens)])
+        rel_error = np.linalg.norm(tt_val - tens) / np.linalg.norm(tens)
+        self.assertLessEqual(rel_error, epsilon)
+        if prev_ranks is not None:
+          self.assertTrue(np.all(ranks <= prev_ranks))
+        prev_ranks = ranks
+
+      # A tensor of low TT-rank is recovered with its TT-ranks.
+      low_rank = initializers.random_tensor(shape, tt_rank=2)
+      low_rank_val = sess.run(ops.full(low_rank))
+      tt_tens = decompositions.to_tt_tensor(tf.constant(low_rank_val),
+                                            max_tt_rank=None, epsilon=1e-3)
+      tt_val, ranks = sess.run([ops.full(tt_tens), shapes.tt_ranks(tt_tens)])
+      self.assertAllEqual([1, 2, 2, 2, 1], ranks)
+      self.assertAllClose(low_rank_val, tt_val, atol=1e-4, rtol=1e-4)
+
+  def testRoundTensorEpsilon(self):
+    shape = (2, 3, 4, 3, 2)
+    tens = initializers.random_tensor(shape, tt_rank=3)
+    with self.test_session() as sess:
+      tens = TensorTrain(sess.run(tens.tt_cores))
+      tens_sum = ops.add(ops.add(tens, tens), tens)
+      # The sum has TT-rank 9, but can be exactly represented with TT-rank 3.
+      rounded = decompositions.round(tens_sum, epsilon=1e-4)
+      sum_val, rounded_val, ranks = sess.run([ops.full(tens_sum),
+                                              ops.full(rounded),
+                                              shapes.tt_ranks(rounded)])
+      self.assertAllEqual([1, 2, 3, 3, 2, 1], ranks)
+      self.assertAllClose(sum_val, rounded_val, atol=1e-4, rtol=1e-4)
+
+      tens = initializers.random_tensor(shape, tt_rank=6)
+      tens = TensorTrain(sess.run(tens.tt_cores))
+      tens_val = sess.run(ops.full(tens))
+      for epsilon in [0.1, 0.5]:
+        rounded = decompositions.round(tens, max_tt_rank=np.inf,
+                                       epsilon=epsilon)
+        rounded_val = sess.run(ops.full(rounded))
+        rel_error = (np.linalg.norm(rounded_val - tens_val) /
+                     np.linalg.norm(tens_val))
+        self.assertLessEqual(rel_error, epsilon)
+      with self.assertRaises(ValueError):
+        decompositions.round(tens, epsilon=-1)
+
+  def testMixedCanonical(self):
+    shape = (2, 3, 4, 3, 2)
+    tens = initializers.random_tensor(shape, tt_rank=(1, 2, 5, 4, 2, 1))
+    with self.test_session() as sess:
+      tens = TensorTrain(sess.run(tens.tt_cores))
+      desired = sess.run(ops.full(tens))
+      for center in range(5):
+        canonical = decompositions.to_mixed_canonical(tens, center)
+        cores_val, full_val = sess.run([canonical.tt_cores,
+                                        ops.full(canonical)])
+        self.assertAllClose(desired, full_val, atol=1e-5, rtol=1e-5)
+        self.assertAllClose(np.zeros(4),
+                            _mixed_canonical_errors(cores_val, center),
+                            atol=1e-5)
+      canonical = decompositions.to_mixed_canonical(tens, 1)
+      for center, new_center in [(1, 4), (4, 0), (0, 2)]:
+        canonical = decompositions.move_orthogonality_center(
+            canonical, center, new_center)
+        cores_val, full_val = sess.run([canonical.tt_cores,
+                                        ops.full(canonical)])
+        self.assertAllClose(desired, full_val, atol=1e-5, rtol=1e-5)
+        self.assertAllClose(np.zeros(4),
+                            _mixed_canonical_errors(cores_val, new_center),
+                            atol=1e-5)
+      with self.assertRaises(ValueError):
+        decompositions.to_mixed_canonical(tens, 5)
+      with self.assertRaises(ValueError):
+        decompositions.move_orthogonality_center(tens, 0, -1)
+
+  def testMoveOrthogonalityCenterCost(self):
+    # Moving the center by one site is a single QR.
+    with tf.Graph().as_default():
+      tens = initializers.random_tensor((2, 3, 4, 3, 2), tt_rank=3)
+      canonical = decompositions.to_mixed_canonical(tens, 2)
+      graph = tf.get_default_graph()
+      num_qr = len([op for op in graph.get_operations() if op.type == 'Qr'])
+      self.assertEqual(4, num_qr)
+      decompositions.move_orthogonality_center(canonical, 2, 3)
+      new_num_qr = len([op for op in graph.get_operations()
+                        if op.type == 'Qr'])
+      self.assertEqual(1, new_num_qr - num_qr)
+
+  def testOrthogonalizeCache(self):
+    with tf.Graph().as_default():
+      tens = initializers.random_tensor((2, 3, 4, 3, 2), tt_rank=3)
+      self.assertIsNone(tens.orthogonality)
+      left = decompositions.orthogonalize_tt_cores(tens)
+      self.assertEqual('left', left.orthogonality)
+      graph = tf.get_default_graph()
+      num_qr = len([op for op in graph.get_operations() if op.type == 'Qr'])
+      # The second orthogonalization is taken from the cache.
+      self.assertIs(left, decompositions.orthogonalize_tt_cores(tens))
+      self.assertIs(left, decompositions.orthogonalize_tt_cores(left))
+      rounded = decompositions.round(tens, max_tt_rank=2)
+      self.assertEqual('right', rounded.orthogonality)
+      self.assertIs(rounded, decompositions.orthogonalize_tt_cores(
+          rounded, left_to_right=False))
+      new_num_qr = len([op for op in graph.get_operations()
+                        if op.type == 'Qr'])
+      self.assertEqual(num_qr, new_num_qr)
+      right = decompositions.to_mixed_canonical(tens, 0)
+      self.assertEqual('right', right.orthogonality)
+      # The cache is not shared between the QR backends and the control flow
+      # contexts, and is not used inside control dependencies.
+      self.assertIsNot(left, decompositions.orthogonalize_tt_cores(
+          tens, qr_backend='numpy'))
+      with linalg.qr_backend('numpy'):
+        self.assertIsNot(left, decompositions.orthogonalize_tt_cores(tens))
+
+      def cond_branch():
+        orth = decompositions.orthogonalize_tt_cores(tens)
+        self.assertIsNot(left, orth)
+        return ops.frobenius_norm(orth)
+
+      tf.cond(tf.constant(True), cond_branch, cond_branch)
+      with tf.control_dependencies([tf.no_op()]):
+        self.assertIsNot(left, decompositions.orthogonalize_tt_cores(tens))
+
+  def testRoundBackends(self):
+    shape = (2, 3, 4, 3, 2)
+    tens = initializers.random_tensor(shape, tt_rank=5)
+    with self.test_session() as sess:
+      tens = TensorTrain(sess.run(tens.tt_cores))
+      desired = sess.run(ops.full(decompositions.round(tens, max_tt_rank=3)))
+      for svd_backend in ['numpy', 'gram']:
+        for qr_backend in ['numpy', 'gram']:
+          rounded = decompositions.round(tens, max_tt_rank=3,
+                                         svd_backend=svd_backend,
+                                         qr_backend=qr_backend)
+          self.assertEqual([1, 2, 3, 3, 2, 1],
+                           rounded.get_tt_ranks().as_list())
+          self.assertAllClose(desired, sess.run(ops.full(rounded)),
+                              atol=1e-4, rtol=1e-4)
+
+  def testRandomizedSVDBackendEpsilon(self):
+    # The first unfolding has the singular values 10 (x4) and 0.5 (x26), the
+    # truncation to epsilon needs the tail that the randomized SVD with
+    # rank 8 + 10 does not compute.
+    np.random.seed(1)
+    u = np.linalg.qr(np.random.randn(30, 30))[0]
+    v = np.linalg.qr(np.random.randn(900, 30))[0]
+    s = np.array([10.0] * 4 + [0.5] * 26)
+    tens = np.dot(u * s, v.T).reshape((30, 30, 30)).astype(np.float32)
+    with self.test_session() as sess:
+      desired = decompositions.to_tt_tensor(tf.constant(tens), max_tt_rank=8,
+                                            epsilon=0.166)
+      actual = decompositions.to_tt_tensor(tf.constant(tens), max_tt_rank=8,
+                                           epsilon=0.166,
+                                           svd_backend='randomized')
+      desired_ranks, actual_ranks = sess.run([shapes.tt_ranks(desired),
+                                              shapes.tt_ranks(actual)])
+      self.assertEqual(8, desired_ranks[1])
+      self.assertAllEqual(desired_ranks, actual_ranks)
+
+  def testRandomizedRoundTensor(self):
+    # The sum of 3 copies of a TT-tensor of TT-rank 3 has TT-rank 9, but can
+    # be exactly represented with TT-rank 3.
+    shape = (2, 3, 4, 3, 2)
+    tens = initializers.random_tensor(shape, tt_rank=3)
+    with self.test_session() as sess:
+      tens = TensorTrain(sess.run(tens.tt_cores))
+      tens_sum = ops.add(ops.add(tens, tens), tens)
+      for method in ['randomize_then_orthogonalize',
+                     'orthogonalize_then_randomize']:
+        rounded = decompositions.randomized_round(tens_sum, max_tt_rank=3,
+                                                  oversampling=2,
+                                                  method=method, seed=1)
+        self.assertEqual([1, 2, 3, 3, 2, 1],
+                         rounded.get_tt_ranks().as_list())
+        sum_val, rounded_val = sess.run([ops.full(tens_sum),
+                                         ops.full(rounded)])
+        self.assertAllClose(sum_val, rounded_val, atol=1e-4, rtol=1e-4)
+      with self.assertRaises(ValueError):
+        decompositions.randomized_round(tens_sum, 3, method='svd')
+
   def testOrthogonalizeLeftToRight(self):
     shape = (2, 4, 3, 3)
     tt_ranks = (1, 5, 2, 17, 1)
@@ -135,6 +339,66 @@ class DecompositionsTest(tf.test.TestCase):
 
 class DecompositionsBatchTest(tf.test.TestCase):
 
+  def testTTTensorBatch(self):
+    shape = (3, 2, 1, 4, 3)
+    np.random.seed(1)
+    tens = np.random.rand(*shape).astype(np.float32)
+    tt_tens = decompositions.to_tt_tensor_batch(tens, max_tt_rank=3)
+    self.assertEqual(3, tt_tens.batch_size)
+    self.assertEqual([1, 2, 2, 3, 1], tt_tens.get_tt_ranks().as_list())
+    with self.test_session() as sess:
+      self.assertAllClose(tens, ops.full(tt_tens).eval())
+      # Try to decompose the same tensors with unknown shape.
+      tf_tens_pl = tf.placeholder(tf.float32, (None, None, 1, 4, None))
+      tt_tens = decompositions.to_tt_tensor_batch(tf_tens_pl, max_tt_rank=3)
+      tt_val, dynamic_tt_ranks = sess.run([ops.full(tt_tens),
+                                           shapes.tt_ranks(tt_tens)],
+                                          {tf_tens_pl: tens})
+      self.assertAllClose(tens, tt_val)
+      self.assertAllEqual([1, 2, 2, 3, 1], dynamic_tt_ranks)
+
+  def testTTTensorBatchEpsilon(self):
+    shape = (3, 4, 5, 4)
+    np.random.seed(1)
+    # A tensor of TT-rank 1 and a random tensor.
+    low_rank = np.einsum('i,j,k,l->ijkl', *[np.random.rand(n) for n in shape])
+    tens = np.stack([low_rank, np.random.rand(*shape)]).astype(np.float32)
+    epsilon = 0.1
+    with self.test_session() as sess:
+      tt_tens = decompositions.to_tt_tensor_batch(tens, max_tt_rank=np.inf,
+                                                  epsilon=epsilon)
+      tt_val, ranks = sess.run([ops.full(tt_tens), shapes.tt_ranks(tt_tens)])
+      for i in range(2):
+        rel_error = (np.linalg.norm(tt_val[i] - tens[i]) /
+                     np.linalg.norm(tens[i]))
+        self.assertLessEqual(rel_error, epsilon)
+      # The TT-ranks are the ones needed for the random tensor.
+      desired = decompositions.to_tt_tensor(tens[1], max_tt_rank=np.inf,
+                                            epsilon=epsilon)
+      self.assertAllEqual(sess.run(shapes.tt_ranks(desired)), ranks)
+
+  def testTTMatrixBatch(self):
+    shape = ((2, 3, 2), (3, 2, 2))
+    np.random.seed(1)
+    mat = np.random.rand(4, 12, 12).astype(np.float32)
+    tt_mat = decompositions.to_tt_matrix_batch(mat, shape, max_tt_rank=100)
+    self.assertTrue(tt_mat.is_tt_matrix())
+    self.assertEqual(4, tt_mat.batch_size)
+    with self.test_session() as sess:
+      self.assertAllClose(mat, ops.full(tt_mat).eval(), atol=1e-5, rtol=1e-5)
+      # Truncated TT-ranks give the same result as to_tt_matrix.
+      tt_mat = decompositions.to_tt_matrix_batch(mat, shape, max_tt_rank=4)
+      for i in range(4):
+        desired = decompositions.to_tt_matrix(mat[i], shape, max_tt_rank=4)
+        self.assertAllClose(sess.run(ops.full(desired)),
+                            sess.run(ops.full(tt_mat[i])), atol=1e-5,
+                            rtol=1e-5)
+      # Vectors.
+      vec = np.random.rand(4, 12, 1).astype(np.float32)
+      tt_vec = decompositions.to_tt_matrix_batch(vec, (shape[0], None),
+                                                 max_tt_rank=100)
+      self.assertAllClose(vec, ops.full(tt_vec).eval(), atol=1e-5, rtol=1e-5)
+
   def testOrthogonalizeLeftToRight(self):
     shape = (2, 4, 3, 3)
     tt_ranks = (1, 5, 2, 17, 1)
@@ -158,6 +422,65 @@ class DecompositionsBatchTest(tf.test.TestCase):
           self.assertAllClose(np.eye(updated_tt_ranks[core_idx + 1]),
                               should_be_eye_val)
 
+  def testOrthogonalizeRightToLeft(self):
+    shape = (2, 4, 3, 3)
+    tt_ranks = (1, 5, 2, 17, 1)
+    updated_tt_ranks = (1, 5, 2, 3, 1)
+    tens = initializers.random_tensor_batch(shape, tt_rank=tt_ranks,
+                                            batch_size=2)
+    orthogonal = decompositions.orthogonalize_tt_cores(tens,
+                                                       left_to_right=False)
+    with self.test_session() as sess:
+      tens_val, orthogonal_val = sess.run([ops.full(tens), ops.full(orthogonal)])
+      self.assertAllClose(tens_val, orthogonal_val, atol=1e-5, rtol=1e-5)
+      dynamic_tt_ranks = shapes.tt_ranks(orthogonal).eval()
+      self.assertAllEqual(updated_tt_ranks, dynamic_tt_ranks)
+      # Check that the TT-cores are orthogonal.
+      for core_idx in range(1, 4):
+        core_shape = (updated_tt_ranks[core_idx],
+                      shape[core_idx] * updated_tt_ranks[core_idx + 1])
+        for i in range(2):
+          core = tf.reshape(orthogonal.tt_cores[core_idx][i], core_shape)
+          should_be_eye = tf.matmul(core, tf.transpose(core))
+          should_be_eye_val = sess.run(should_be_eye)
+          self.assertAllClose(np.eye(updated_tt_ranks[core_idx]),
+                              should_be_eye_val)
+
+  def testMixedCanonical(self):
+    shape = ((2, 3, 2), (3, 2, 2))
+    tens = initializers.random_matrix_batch(shape, tt_rank=3, batch_size=2)
+    with self.test_session() as sess:
+      tens = TensorTrainBatch(sess.run(tens.tt_cores))
+      desired = sess.run(ops.full(tens))
+      canonical = decompositions.to_mixed_canonical(tens, 1)
+      self.assertTrue(isinstance(canonical, TensorTrainBatch))
+      for center, new_center in [(1, 1), (1, 0), (0, 2)]:
+        canonical = decompositions.move_orthogonality_center(
+            canonical, center, new_center)
+        cores_val, full_val = sess.run([canonical.tt_cores,
+                                        ops.full(canonical)])
+        self.assertAllClose(desired, full_val, atol=1e-5, rtol=1e-5)
+        for batch_idx in range(2):
+          curr_cores = [core[batch_idx] for core in cores_val]
+          self.assertAllClose(
+              np.zeros(2), _mixed_canonical_errors(curr_cores, new_center),
+              atol=1e-5)
+
+  def testRandomizedRoundMatrix(self):
+    shape = ((2, 3, 2), (3, 2, 2))
+    tens = initializers.random_matrix_batch(shape, tt_rank=3, batch_size=3)
+    with self.test_session() as sess:
+      tens = TensorTrainBatch(sess.run(tens.tt_cores))
+      tens_sum = ops.add(tens, tens)
+      for method in ['randomize_then_orthogonalize',
+                     'orthogonalize_then_randomize']:
+        rounded = decompositions.randomized_round(tens_sum, max_tt_rank=3,
+                                                  method=method)
+        self.assertTrue(isinstance(rounded, TensorTrainBatch))
+        sum_val, rounded_val = sess.run([ops.full(tens_sum),
+                                         ops.full(rounded)])
+        self.assertAllClose(sum_val, rounded_val, atol=1e-4, rtol=1e-4)
+
   def testRoundTensor(self):
     shape = (2, 1, 4, 3, 3)
     tens = initializers.random_tensor_batch(shape, tt_rank=15, batch_size=3)
@@ -171,6 +494,58 @@ class DecompositionsBatchTest(tf.test.TestCase):
       dynamic_tt_ranks = shapes.tt_ranks(rounded_tens).eval()
       self.assertAllEqual([1, 2, 2, 8, 3, 1], dynamic_tt_ranks)
 
+  def testRoundTensorEpsilon(self):
+    shape = (2, 3, 4, 3, 2)
+    tens = initializers.random_tensor_batch(shape, tt_rank=6, batch_size=3)
+    epsilon = 0.3
+    with self.test_session() as sess:
+      tens = TensorTrainBatch(sess.run(tens.tt_cores))
+      rounded = decompositions.round(tens, max_tt_rank=5, epsilon=epsilon)
+      self.assertTrue(isinstance(rounded, TensorTrainBatch))
+      tens_val, rounded_val, ranks = sess.run([ops.full(tens),
+                                               ops.full(rounded),
+                                               shapes.tt_ranks(rounded)])
+      self.assertTrue(np.all(ranks <= 5))
+      # Without the TT-rank cap each object in the batch is epsilon close to
+      # the original one.
+      rounded = decompositions.round(tens, max_tt_rank=np.inf, epsilon=epsilon)
+      rounded_val = sess.run(ops.full(rounded))
+      for i in range(3):
+        rel_error = (np.linalg.norm(rounded_val[i] - tens_val[i]) /
+                     np.linalg.norm(tens_val[i]))
+        self.assertLessEqual(rel_error, epsilon)
+
+
+class RoundBenchmark(tf.test.Benchmark):
+
+  def benchmarkRound(self):
+    # Round sums of 4 random TT-tensors with growing TT-ranks to TT-rank 10
+    # with the deterministic and the randomized rounding.
+    shape = (10,) * 8
+    max_tt_rank = 10
+    for rank in (10, 25, 50):
+      tf.reset_default_graph()
+      tens = initializers.random_tensor(shape, tt_rank=rank)
+      for _ in range(3):
+        tens = ops.add(tens, initializers.random_tensor(shape, tt_rank=rank))
+      with tf.Session() as sess:
+        tt_cores = sess.run(tens.tt_cores)
+      # Store the TT-cores in variables to benchmark only the rounding.
+      tens = TensorTrain([tf.Variable(core) for core in tt_cores])
+      rounded = {
+          'deterministic': decompositions.round(tens, max_tt_rank)
+      }
+      for method in ['randomize_then_orthogonalize',
+                     'orthogonalize_then_randomize']:
+        rounded[method] = decompositions.randomized_round(tens, max_tt_rank,
+                                                          method=method)
+      with tf.Session() as sess:
+        sess.run(tf.global_variables_initializer())
+        for name, res in rounded.items():
+          self.run_op_benchmark(sess, res.tt_cores,
+                                min_iters=10,
+                                name='round_%s_rank_%d' % (name, 4 * rank))
+
 
 if __name__ == "__main__":
   tf.test.main()
@@ -0,0 +1,327 @@
+import contextlib
+
+import numpy as np
+import tensorflow as tf
+
+
+# Registered backends, name -> function.
+_SVD_BACKENDS = {}
+_QR_BACKENDS = {}
+# The stacks of the backends chosen by the svd_backend and qr_backend scopes,
+# the first element is the default backend.
+_svd_backend_stack = ['tf']
+_qr_backend_stack = ['tf']
+
+
+def svd(matrix, rank=None, backend=None):
+  """Computes the (thin) SVD of a matrix or a batch of matrices.
+
+  The decomposition is computed by the backend `backend` or, if it is None, by
+  the backend of the innermost `svd_backend` scope (by default 'tf').
+  The available backends are
+    'tf': tf.svd.
+    'numpy': np.linalg.svd (LAPACK gesdd) in a tf.py_func. A workaround for
+      the NaN bugs in tf.svd, see
+      https://github.com/tensorflow/tensorflow/issues/8905
+    'gram': eigendecomposition of the Gram matrix of the smaller side, i.e.
+      A^T A for a tall-skinny matrix A. The cheapest for strongly rectangular
+      matrices, but the squared condition number makes the small singular
+      values (below sqrt(machine epsilon) * s_max) inaccurate.
+    'randomized': randomized SVD (Halko et al., 2011) with rank + 10
+      singular triplets. Falls back to 'tf' if `rank` is None, is not known
+      on the compilation stage or is not much smaller than the matrix.
+
+  Args:
+    matrix: tf.Tensor of shape [..., M, N].
+    rank: (Optional) the number of singular triplets that will be used, a
+      hint for the backends that can compute a partial SVD. None means that
+      all the singular values are needed (e.g. for truncation to a given
+      error).
+    backend: (Optional) a string, the name of a registered backend.
+
+  Returns:
+    A tuple (s, u, v) in the order of tf.svd:
+      s: the singular values, tf.Tensor of shape [..., K] in the decreasing
+        order,
+      u: the left singular vectors, tf.Tensor of shape [..., M, K],
+      v: the right singular vectors, tf.Tensor of shape [..., N, K],
+    where K = min(M, N), or fewer than that for the 'randomized' backend.
+
+  Raises:
+    ValueError if the backend is not registered.
+  """
+  if backend is None:
+    backend = _svd_backend_stack[-1]
+  _check_backend(backend, _SVD_BACKENDS, 'SVD')
+  return _SVD_BACKENDS[backend](matrix, rank)
+
+
+def qr(matrix, backend=None):
+  """Computes the reduced QR decomposition of a matrix or a batch of matrices.
+
+  The decomposition is computed by the backend `backend` or, if it is None, by
+  the backend of the innermost `qr_backend` scope (by default 'tf').
+  The available backends are
+    'tf': tf.qr.
+    'numpy': np.linalg.qr in a tf.py_func.
+    'gram': Cholesky QR, R is the Cholesky factor of the Gram matrix A^T A.
+      Fast for tall-skinny matrices, but only accurate for well conditioned
+      ones. Falls back to 'tf' if the matrix is not known to be tall.
+
+  Args:
+    matrix: tf.Tensor of shape [..., M, N].
+    backend: (Optional) a string, the name of a registered backend.
+
+  Returns:
+    A tuple (q, r) in the order of tf.qr:
+      q: tf.Tensor of shape [..., M, K] with orthonormal columns,
+      r: upper triangular tf.Tensor of shape [..., K, N],
+    where K = min(M, N).
+
+  Raises:
+    ValueError if the backend is not registered.
+  """
+  if backend is None:
+    backend = _qr_backend_stack[-1]
+  _check_backend(backend, _QR_BACKENDS, 'QR')
+  return _QR_BACKENDS[backend](matrix)
+
+
+def register_svd_backend(name, svd_fn):
+  """Registers (or replaces) an SVD backend.
+
+  Args:
+    name: a string, the name of the backend.
+    svd_fn: a function svd_fn(matrix, rank) with the arguments and the return
+      values of `t3f.linalg.svd`.
+  """
+  _SVD_BACKENDS[name] = svd_fn
+
+
+def register_qr_backend(name, qr_fn):
+  """Registers (or replaces) a QR backend.
+
+  Args:
+    name: a string, the name of the backend.
+    qr_fn: a function qr_fn(matrix) with the return values of
+      `t3f.linalg.qr`.
+  """
+  _QR_BACKENDS[name] = qr_fn
+
+
+def set_svd_backend(name):
+  """Sets the default SVD backend (used outside of `svd_backend` scopes).
+
+  Raises:
+    ValueError if the backend is not registered.
+  """
+  _check_backend(name, _SVD_BACKENDS, 'SVD')
+  _svd_backend_stack[0] = name
+
+
+def set_qr_backend(name):
+  """Sets the default QR backend (used outside of `qr_backend` scopes).
+
+  Raises:
+    ValueError if the backend is not registered.
+  """
+  _check_backend(name, _QR_BACKENDS, 'QR')
+  _qr_backend_stack[0] = name
+
+
+def get_svd_backend():
+  """Returns the name of the SVD backend used in the current scope."""
+  return _svd_backend_stack[-1]
+
+
+def get_qr_backend():
+  """Returns the name of the QR backend used in the current scope."""
+  return _qr_backend_stack[-1]
+
+
+@contextlib.contextmanager
+def svd_backend(name):
+  """Context manager that chooses the SVD backend for the ops created inside.
+
+  Example:
+    >>> with t3f.linalg.svd_backend('numpy'):
+    ...   tt = t3f.round(tt, max_tt_rank=10)
+
+  Args:
+    name: a string, the name of a registered backend, or None to keep the
+      current backend.
+
+  Raises:
+    ValueError if the backend is not registered.
+  """
+  if name is None:
+    name = get_svd_backend()
+  _check_backend(name, _SVD_BACKENDS, 'SVD')
+  _svd_backend_stack.append(name)
+  try:
+    yield
+  finally:
+    _svd_backend_stack.pop()
+
+
+@contextlib.contextmanager
+def qr_backend(name):
+  """Context manager that chooses the QR backend for the ops created inside.
+
+  Args:
+    name: a string, the name of a registered backend, or None to keep the
+      current backend.
+
+  Raises:
+    ValueError if the backend is not registered.
+  """
+  if name is None:
+    name = get_qr_backend()
+  _check_backend(name, _QR_BACKENDS, 'QR')
+  _qr_backend_stack.append(name)
+  try:
+    yield
+  finally:
+    _qr_backend_stack.pop()
+
+
+def _check_backend(name, backends, kind):
+  if name not in backends:
+    raise ValueError('Unknown %s backend "%s", available backends are %s.' %
+                     (kind, name, sorted(backends.keys())))
+
+
+def _static_sizes(matrix):
+  """Returns the static (M, N, K = min(M, N)) of a matrix, None if unknown."""
+  rows, columns = matrix.get_shape()[-2:].as_list()
+  if rows is None or columns is None:
+    return rows, columns, None
+  return rows, columns, min(rows, columns)
+
+
+def _tf_svd(matrix, rank):
+  del rank
+  return tf.svd(matrix, full_matrices=False)
+
+
+def _numpy_svd(matrix, rank):
+  del rank
+  dtype = matrix.dtype
+
+  def np_svd(a):
+    u, s, vh = np.linalg.svd(a, full_matrices=False)
+    # Converting numpy order of v dims to TF order.
+    v = np.swapaxes(vh, -1, -2)
+    np_dtype = dtype.as_numpy_dtype
+    return s.astype(np_dtype), u.astype(np_dtype), v.astype(np_dtype)
+
+  s, u, v = tf.py_func(np_svd, [matrix], [dtype, dtype, dtype])
+  batch_shape = matrix.get_shape()[:-2]
+  rows, columns, min_dim = _static_sizes(matrix)
+  s.set_shape(batch_shape.concatenate([min_dim]))
+  u.set_shape(batch_shape.concatenate([rows, min_dim]))
+  v.set_shape(batch_shape.concatenate([columns, min_dim]))
+  return s, u, v
+
+
+def _gram_svd(matrix, rank):
+  del rank
+
+  def tall_svd(a):
+    # A^T A = V S^2 V^T, U = A V S^-1.
+    gram = tf.matmul(a, a, transpose_a=True)
+    eigvals, v = tf.self_adjoint_eig(gram)
+    # Eigenvalues are in the increasing order.
+    s = tf.sqrt(tf.maximum(tf.reverse(eigvals, [-1]), 0))
+    v = tf.reverse(v, [-1])
+    av = tf.matmul(a, v)
+    # The singular vectors of the zero singular values are set to zero.
+    safe_s = tf.where(s > 0, s, tf.ones_like(s))
+    u = av * tf.expand_dims(tf.where(s > 0, 1.0 / safe_s,
+                                     tf.zeros_like(s)), -2)
+    return s, u, v
+
+  def wide_svd(a):
+    s, v, u = tall_svd(tf.matrix_transpose(a))
+    return s, u, v
+
+  rows, columns, _ = _static_sizes(matrix)
+  if rows is not None and columns is not None:
+    if rows >= columns:
+      return tall_svd(matrix)
+    else:
+      return wide_svd(matrix)
+  dynamic_shape = tf.shape(matrix)
+  is_tall = dynamic_shape[-2] >= dynamic_shape[-1]
+  return tf.cond(is_tall, lambda: tall_svd(matrix), lambda: wide_svd(matrix))
+
+
+def _randomized_svd(matrix, rank, oversampling=10, power_iterations=1):
+  _, columns, min_dim = _static_sizes(matrix)
+  try:
+    sketch_size = int(rank) + oversampling
+  except TypeError:
+    # The rank is unknown on the compilation stage.
+    return _tf_svd(matrix, rank)
+  if min_dim is None or sketch_size >= min_dim:
+    return _tf_svd(matrix, rank)
+  batch_shape = tf.shape(matrix)[:-2]
+  omega_shape = tf.concat((batch_shape, [columns, sketch_size]), axis=0)
+  omega = tf.random_normal(omega_shape, dtype=matrix.dtype)
+  q, _ = tf.qr(tf.matmul(matrix, omega))
+  for _ in range(power_iterations):
+    q, _ = tf.qr(tf.matmul(matrix, q, transpose_a=True))
+    q, _ = tf.qr(tf.matmul(matrix, q))
+  # The SVD of the small sketch_size x N matrix Q^T A.
+  s, u_small, v = tf.svd(tf.matmul(q, matrix, transpose_a=True),
+                         full_matrices=False)
+  return s, tf.matmul(q, u_small), v
+
+
+def _tf_qr(matrix):
+  return tf.qr(matrix)
+
+
+def _numpy_qr(matrix):
+  dtype = matrix.dtype
+
+  def np_qr(a):
+    np_dtype = dtype.as_numpy_dtype
+    if a.ndim == 2:
+      q, r = np.linalg.qr(a)
+      return q.astype(np_dtype), r.astype(np_dtype)
+    # Old NumPy versions do not support batches.
+    batch_shape = a.shape[:-2]
+    a = a.reshape((-1,) + a.shape[-2:])
+    qs, rs = zip(*[np.linalg.qr(a_i) for a_i in a])
+    q = np.stack(qs).reshape(batch_shape + qs[0].shape)
+    r = np.stack(rs).reshape(batch_shape + rs[0].shape)
+    return q.astype(np_dtype), r.astype(np_dtype)
+
+  q, r = tf.py_func(np_qr, [matrix], [dtype, dtype])
+  batch_shape = matrix.get_shape()[:-2]
+  rows, columns, min_dim = _static_sizes(matrix)
+  q.set_shape(batch_shape.concatenate([rows, min_dim]))
+  r.set_shape(batch_shape.concatenate([min_dim, columns]))
+  return q, r
+
+
+def _gram_qr(matrix):
+  rows, columns, _ = _static_sizes(matrix)
+  if rows is None or columns is None or rows < columns:
+    return _tf_qr(matrix)
+  # A^T A = R^T R, Q = A R^-1, i.e. Q^T is the solution of R^T Q^T = A^T.
+  gram = tf.matmul(matrix, matrix, transpose_a=True)
+  chol = tf.cholesky(gram)
+  q_transposed = tf.matrix_triangular_solve(chol, tf.matrix_transpose(matrix),
+                                            lower=True)
+  return tf.matrix_transpose(q_transposed), tf.matrix_transpose(chol)
+
+
+register_svd_backend('tf', _tf_svd)
+register_svd_backend('numpy', _numpy_svd)
+register_svd_backend('gram', _gram_svd)
+register_svd_backend('randomized', _randomized_svd)
+register_qr_backend('tf', _tf_qr)
+register_qr_backend('numpy', _numpy_qr)
+register_qr_backend('gram', _gram_qr)
@@ -0,0 +1,117 @@
+import numpy as np
+import tensorflow as tf
+
+from t3f import linalg
+
+
+class LinalgTest(tf.test.TestCase):
+
+  def _matrices(self):
+    np.random.seed(1)
+    return [np.random.rand(7, 4).astype(np.float32),
+            np.random.rand(4, 7).astype(np.float32),
+            np.random.rand(3, 6, 5).astype(np.float32)]
+
+  def testSVD(self):
+    with self.test_session() as sess:
+      for backend in ['tf', 'numpy', 'gram']:
+        for matrix in self._matrices():
+          s, u, v = linalg.svd(tf.constant(matrix), backend=backend)
+          min_dim = min(matrix.shape[-2:])
+          self.assertEqual(matrix.shape[:-2] + (min_dim,),
+                           tuple(s.get_shape().as_list()))
+          s_val, u_val, v_val = sess.run([s, u, v])
+          desired_s = np.linalg.svd(matrix, compute_uv=False)
+          self.assertAllClose(desired_s, s_val, atol=1e-4, rtol=1e-4)
+          us = u_val * np.expand_dims(s_val, -2)
+          self.assertAllClose(matrix, np.matmul(us, np.swapaxes(v_val, -1, -2)),
+                              atol=1e-4, rtol=1e-4)
+
+  def testSVDUnknownShape(self):
+    with self.test_session() as sess:
+      for backend in ['numpy', 'gram']:
+        for matrix in self._matrices()[:2]:
+          matrix_pl = tf.placeholder(tf.float32, (None, None))
+          s = linalg.svd(matrix_pl, backend=backend)[0]
+          s_val = sess.run(s, {matrix_pl: matrix})
+          desired_s = np.linalg.svd(matrix, compute_uv=False)
+          self.assertAllClose(desired_s, s_val, atol=1e-4, rtol=1e-4)
+
+  def testNumpySVDDoesNotUseTfSVD(self):
+    with tf.Graph().as_default():
+      linalg.svd(tf.zeros((5, 3)), backend='numpy')
+      op_types = [op.type for op in tf.get_default_graph().get_operations()]
+      self.assertNotIn('Svd', op_types)
+
+  def testRandomizedSVD(self):
+    np.random.seed(1)
+    low_rank = np.random.rand(40, 3).dot(np.random.rand(3, 30))
+    low_rank = low_rank.astype(np.float32)
+    with self.test_session() as sess:
+      s, u, v = linalg.svd(tf.constant(low_rank), rank=3,
+                           backend='randomized')
+      # rank + oversampling singular triplets.
+      self.assertEqual([13], s.get_shape().as_list())
+      s_val, u_val, v_val = sess.run([s, u, v])
+      desired_s = np.linalg.svd(low_rank, compute_uv=False)
+      self.assertAllClose(desired_s[:3], s_val[:3], atol=1e-3, rtol=1e-4)
+      reconstruction = (u_val[:, :3] * s_val[:3]).dot(v_val[:, :3].T)
+      self.assertAllClose(low_rank, reconstruction, atol=1e-3, rtol=1e-4)
+      # Without a rank hint the full SVD is computed.
+      s = linalg.svd(tf.constant(low_rank), backend='randomized')[0]
+      self.assertEqual([30], s.get_shape().as_list())
+
+  def testQR(self):
+    with self.test_session() as sess:
+      for backend in ['tf', 'numpy', 'gram']:
+        for matrix in self._matrices():
+          q, r = linalg.qr(tf.constant(matrix), backend=backend)
+          min_dim = min(matrix.shape[-2:])
+          self.assertEqual(matrix.shape[:-1] + (min_dim,),
+                           tuple(q.get_shape().as_list()))
+          q_val, r_val = sess.run([q, r])
+          self.assertAllClose(matrix, np.matmul(q_val, r_val), atol=1e-4,
+                              rtol=1e-4)
+          should_be_eye = np.matmul(np.swapaxes(q_val, -1, -2), q_val)
+          self.assertAllClose(np.broadcast_to(np.eye(min_dim),
+                                              should_be_eye.shape),
+                              should_be_eye, atol=1e-4, rtol=1e-4)
+          self.assertAllClose(np.triu(r_val), r_val)
+
+  def testBackendScopes(self):
+    self.assertEqual('tf', linalg.get_svd_backend())
+    with linalg.svd_backend('numpy'):
+      self.assertEqual('numpy', linalg.get_svd_backend())
+      with linalg.svd_backend(None):
+        self.assertEqual('numpy', linalg.get_svd_backend())
+      with linalg.svd_backend('gram'):
+        self.assertEqual('gram', linalg.get_svd_backend())
+      self.assertEqual('numpy', linalg.get_svd_backend())
+    self.assertEqual('tf', linalg.get_svd_backend())
+    with linalg.qr_backend('gram'):
+      self.assertEqual('gram', linalg.get_qr_backend())
+    self.assertEqual('tf', linalg.get_qr_backend())
+    with self.assertRaises(ValueError):
+      with linalg.svd_backend('unknown'):
+        pass
+    with self.assertRaises(ValueError):
+      linalg.qr(tf.zeros((3, 3)), backend='unknown')
+
+  def testRegisterBackend(self):
+    calls = []
+
+    def svd_fn(matrix, rank):
+      calls.append(rank)
+      return tf.svd(matrix)
+
+    linalg.register_svd_backend('test', svd_fn)
+    try:
+      with linalg.svd_backend('test'):
+        linalg.svd(tf.zeros((3, 3)), rank=2)
+      self.assertEqual([2], calls)
+    finally:
+      del linalg._SVD_BACKENDS['test']
+
+
+if __name__ == "__main__":
+  tf.test.main()
@@ -1,3 +1,4 @@
+import numpy as np
 import tensorflow as tf
 
 from t3f.tensor_train_base import TensorTrainBase
@@ -6,6 +7,7 @@ from t3f.tensor_train_batch import TensorTrainBatch
 from t3f import shapes
 from t3f import utils
 from t3f import decompositions
+from t3f import linalg
 
 
 # TODO: add complexities to the comments.
@@ -13,6 +15,9 @@ from t3f import decompositions
 def full(tt):
   """Converts a TensorTrain into a regular tensor or matrix (tf.Tensor).
 
+  The TT-cores are contracted in the order chosen by `full_contraction_plan`,
+  which keeps the intermediate tensors small for uneven TT-ranks.
+
   Args:
     tt: `TensorTrain` or `TensorTrainBatch` object.
 
@@ -27,6 +32,80 @@ def full(tt):
     return _full_tt(tt)
 
 
+def full_contraction_plan(tt):
+  """Chooses the order in which `full` contracts the TT-cores.
+
+  `full` contracts the TT-cores [0, split) from left to right, the TT-cores
+  [split, d) from right to left, and then multiplies the two results.
+  split = d - 1 is the plain left to right order and split = 1 is the right
+  to left order. The split is chosen to minimize the size of the largest
+  intermediate tensor (including the result) and then the number of FLOPs.
+
+  Args:
+    tt: `TensorTrain` or `TensorTrainBatch` object.
+
+  Returns:
+    None if the TT-ranks or the shape of `tt` are not known on the compilation
+    stage (in which case `full` contracts the cores from left to right),
+    or a dict with the keys
+      'order': 'left_to_right', 'right_to_left', or 'split'
+      'split': the index of the first TT-core contracted from the right
+      'flops': the number of floating point operations of the contraction
+      'peak_size': the number of elements in the largest intermediate tensor
+  """
+  static_ranks = tt.get_tt_ranks()
+  raw_shape = tt.get_raw_shape()
+  if not static_ranks.is_fully_defined():
+    return None
+  if not all(s.is_fully_defined() for s in raw_shape):
+    return None
+  num_dims = tt.ndims()
+  ranks = static_ranks.as_list()
+  modes = np.prod([s.as_list() for s in raw_shape], axis=0)
+  batch_size = getattr(tt, 'batch_size', None)
+  if batch_size is None:
+    # TensorTrain or unknown batch size, the cost is reported per object.
+    batch_size = 1
+
+  if num_dims == 1:
+    return {'order': 'left_to_right', 'split': 1, 'flops': 0,
+            'peak_size': batch_size * modes[0]}
+
+  best_plan = None
+  for split in range(num_dims - 1, 0, -1):
+    flops = 0
+    peak_size = 0
+    # Left part: (m_0 ... m_k-1) x r_k matrix times r_k x (m_k r_k+1) matrix.
+    left_size = modes[0]
+    for core_idx in range(1, split):
+      flops += 2 * left_size * ranks[core_idx] * modes[core_idx] * \
+               ranks[core_idx + 1]
+      left_size *= modes[core_idx]
+      peak_size = max(peak_size, left_size * ranks[core_idx + 1])
+    # Right part: (r_k m_k) x r_k+1 matrix times r_k+1 x (m_k+1 ... m_d-1).
+    right_size = modes[-1]
+    for core_idx in range(num_dims - 2, split - 1, -1):
+      flops += 2 * ranks[core_idx] * modes[core_idx] * ranks[core_idx + 1] * \
+               right_size
+      right_size *= modes[core_idx]
+      peak_size = max(peak_size, ranks[core_idx] * right_size)
+    flops += 2 * left_size * ranks[split] * right_size
+    peak_size = max(peak_size, left_size * right_size)
+
+    if split == num_dims - 1:
+      order = 'left_to_right'
+    elif split == 1:
+      order = 'right_to_left'
+    else:
+      order = 'split'
+    plan = {'order': order, 'split': split, 'flops': int(batch_size * flops),
+            'peak_size': int(batch_size * peak_size)}
+    if best_plan is None or (plan['peak_size'], plan['flops']) < \
+        (best_plan['peak_size'], best_plan['flops']):
+      best_plan = plan
+  return best_plan
+
+
 def _full_tt(tt):
   """Converts a TensorTrain into a regular tensor or matrix (tf.Tensor).
 
@@ -41,11 +120,22 @@ def _full_tt(tt):
   shape = shapes.lazy_shape(tt)
   raw_shape = shapes.lazy_raw_shape(tt)
 
+  plan = full_contraction_plan(tt)
+  split = num_dims if plan is None else plan['split']
   res = tt.tt_cores[0]
-  for i in range(1, num_dims):
+  for i in range(1, split):
     res = tf.reshape(res, (-1, ranks[i]))
     curr_core = tf.reshape(tt.tt_cores[i], (ranks[i], -1))
     res = tf.matmul(res, curr_core)
+  if split < num_dims:
+    right = tt.tt_cores[-1]
+    for i in range(num_dims - 2, split - 1, -1):
+      right = tf.reshape(right, (ranks[i + 1], -1))
+      curr_core = tf.reshape(tt.tt_cores[i], (-1, ranks[i + 1]))
+      right = tf.matmul(curr_core, right)
+    res = tf.reshape(res, (-1, ranks[split]))
+    right = tf.reshape(right, (ranks[split], -1))
+    res = tf.matmul(res, right)
   if tt.is_tt_matrix():
     intermediate_shape = []
     for i in range(num_dims):
@@ -77,12 +167,23 @@ def _full_tt_batch(tt):
   shape = shapes.lazy_shape(tt)
   raw_shape = shapes.lazy_raw_shape(tt)
 
+  plan = full_contraction_plan(tt)
+  split = num_dims if plan is None else plan['split']
   res = tt.tt_cores[0]
   batch_size = shapes.lazy_batch_size(tt)
-  for i in range(1, num_dims):
+  for i in range(1, split):
     res = tf.reshape(res, (batch_size, -1, ranks[i]))
     curr_core = tf.reshape(tt.tt_cores[i], (batch_size, ranks[i], -1))
     res = tf.einsum('oqb,obw->oqw', res, curr_core)
+  if split < num_dims:
+    right = tt.tt_cores[-1]
+    for i in range(num_dims - 2, split - 1, -1):
+      right = tf.reshape(right, (batch_size, ranks[i + 1], -1))
+      curr_core = tf.reshape(tt.tt_cores[i], (batch_size, -1, ranks[i + 1]))
+      right = tf.einsum('oqb,obw->oqw', curr_core, right)
+    res = tf.reshape(res, (batch_size, -1, ranks[split]))
+    right = tf.reshape(right, (batch_size, ranks[split], -1))
+    res = tf.einsum('oqb,obw->oqw', res, right)
   if tt.is_tt_matrix():
     intermediate_shape = [batch_size]
     for i in range(num_dims):
@@ -245,31 +346,133 @@ def dense_tt_matmul(matrix_a, tt_matrix_b):
   return tf.transpose(tt_dense_matmul(b_t, a_t))
 
 
+def _tt_matrix_slices(tt_matrix, idx, axis):
+  """Computes the dense rows (or columns) of a TT-matrix at the given indices.
+
+  A row (column) of a TT-matrix is a TT-tensor with the TT-cores sliced at the
+  multi-index of the row (column), so it costs O(len(idx) * size * r) instead
+  of computing the full matrix.
+
+  Args:
+    tt_matrix: `TensorTrain` or `TensorTrainBatch` object containing a
+      TT-matrix (a batch of TT-matrices) of size M x N.
+    idx: int64 tf.Tensor of size U with linear indices of the rows (or
+      columns).
+    axis: 0 to compute the rows and 1 to compute the columns.
+
+  Returns:
+    tf.Tensor of size U x N (or U x M for columns), or
+    U x (batch_size * N) (U x (batch_size * M)) for `TensorTrainBatch`.
+  """
+  is_batch = isinstance(tt_matrix, TensorTrainBatch)
+  raw_shape = shapes.lazy_raw_shape(tt_matrix)
+  ranks = shapes.lazy_tt_ranks(tt_matrix)
+  multi_idx = utils.unravel_index(idx, tf.cast(raw_shape[axis], tf.int64))
+  num_slices = tf.size(idx)
+  slice_cores = []
+  for core_idx in range(tt_matrix.ndims()):
+    curr_core = tt_matrix.tt_cores[core_idx]
+    # Move the sliced axis to the front to use tf.gather.
+    if is_batch:
+      perm = (2 + axis, 0, 1, 3 - axis, 4)
+    else:
+      perm = (1 + axis, 0, 2 - axis, 3)
+    curr_core = tf.transpose(curr_core, perm)
+    curr_core = tf.gather(curr_core, multi_idx[:, core_idx])
+    if is_batch:
+      # Merge the slices and batch dimensions.
+      curr_core = tf.reshape(curr_core, (-1, ranks[core_idx],
+                                         raw_shape[1 - axis][core_idx],
+                                         ranks[core_idx + 1]))
+    slice_cores.append(curr_core)
+  slices = full(TensorTrainBatch(slice_cores))
+  return tf.reshape(slices, (num_slices, -1))
+
+
 def sparse_tt_matmul(sparse_matrix_a, tt_matrix_b):
   """Multiplies a sparse matrix by a TT-matrix, returns a regular matrix.
 
+  Only the rows of the TT-matrix that correspond to the nonzero columns of the
+  sparse matrix are computed, so the complexity is proportional to the number
+  of nonzeros (not to the size of the matrices).
+
   Args:
     sparse_matrix_a: tf.SparseTensor of size M x N
-    tt_matrix_b: `TensorTrain` object containing a TT-matrix of size N x P
+    tt_matrix_b: `TensorTrain` or `TensorTrainBatch` object containing a
+      TT-matrix (a batch of TT-matrices) of size N x P
 
   Returns
-    tf.Tensor of size M x P
+    tf.Tensor of size M x P, or batch_size x M x P if tt_matrix_b is a
+      `TensorTrainBatch`.
+
+  Raises:
+    ValueError if tt_matrix_b is not a TT-matrix.
   """
-  raise NotImplementedError
+  if not isinstance(tt_matrix_b, TensorTrainBase) or \
+      not tt_matrix_b.is_tt_matrix():
+    raise ValueError('The second argument should be a TT-matrix')
+  is_batch = isinstance(tt_matrix_b, TensorTrainBatch)
+  indices = tf.cast(sparse_matrix_a.indices, tf.int64)
+  # Compute each needed row of B once.
+  rows_idx, remapped_idx = tf.unique(indices[:, 1], out_idx=tf.int64)
+  b_rows = _tt_matrix_slices(tt_matrix_b, rows_idx, axis=0)
+  num_rows = tf.size(rows_idx, out_type=tf.int64)
+  remapped_a = tf.SparseTensor(tf.stack((indices[:, 0], remapped_idx), axis=1),
+                               sparse_matrix_a.values,
+                               (sparse_matrix_a.dense_shape[0], num_rows))
+  res = tf.sparse_tensor_dense_matmul(remapped_a, b_rows)
+  b_shape = shapes.lazy_shape(tt_matrix_b)
+  a_rows = sparse_matrix_a.dense_shape[0]
+  if is_batch:
+    batch_size = shapes.lazy_batch_size(tt_matrix_b)
+    res = tf.reshape(res, (a_rows, batch_size, b_shape[-1]))
+    return tf.transpose(res, (1, 0, 2))
+  else:
+    return tf.reshape(res, (a_rows, b_shape[-1]))
 
 
 # TODO: add flag `return_type = (TT | dense)`?
 def tt_sparse_matmul(tt_matrix_a, sparse_matrix_b):
   """Multiplies a TT-matrix by a sparse matrix, returns a regular matrix.
 
+  Only the columns of the TT-matrix that correspond to the nonzero rows of the
+  sparse matrix are computed, so the complexity is proportional to the number
+  of nonzeros (not to the size of the matrices).
+
   Args:
-    tt_matrix_a: `TensorTrain` object containing a TT-matrix of size M x N
+    tt_matrix_a: `TensorTrain` or `TensorTrainBatch` object containing a
+      TT-matrix (a batch of TT-matrices) of size M x N
     sparse_matrix_b: tf.SparseTensor of size N x P
 
   Returns
-    tf.Tensor of size M x P
+    tf.Tensor of size M x P, or batch_size x M x P if tt_matrix_a is a
+      `TensorTrainBatch`.
+
+  Raises:
+    ValueError if tt_matrix_a is not a TT-matrix.
   """
-  raise NotImplementedError
+  if not isinstance(tt_matrix_a, TensorTrainBase) or \
+      not tt_matrix_a.is_tt_matrix():
+    raise ValueError('The first argument should be a TT-matrix')
+  is_batch = isinstance(tt_matrix_a, TensorTrainBatch)
+  indices = tf.cast(sparse_matrix_b.indices, tf.int64)
+  # Compute each needed column of A once.
+  cols_idx, remapped_idx = tf.unique(indices[:, 0], out_idx=tf.int64)
+  a_cols = _tt_matrix_slices(tt_matrix_a, cols_idx, axis=1)
+  num_cols = tf.size(cols_idx, out_type=tf.int64)
+  remapped_b = tf.SparseTensor(tf.stack((remapped_idx, indices[:, 1]), axis=1),
+                               sparse_matrix_b.values,
+                               (num_cols, sparse_matrix_b.dense_shape[1]))
+  # (A_cols B)^T = B^T A_cols^T, where A_cols^T is U x M.
+  res = tf.sparse_tensor_dense_matmul(remapped_b, a_cols, adjoint_a=True)
+  a_shape = shapes.lazy_shape(tt_matrix_a)
+  b_cols = sparse_matrix_b.dense_shape[1]
+  if is_batch:
+    batch_size = shapes.lazy_batch_size(tt_matrix_a)
+    res = tf.reshape(res, (b_cols, batch_size, a_shape[1]))
+    return tf.transpose(res, (1, 2, 0))
+  else:
+    return tf.transpose(res)
 
 
 def matmul(a, b):
@@ -292,6 +495,8 @@ def matmul(a, b):
     If at least one of the arguments is a `TensorTrainBatch` object, returns
       a `TensorTrainBatch` object containing a batch of TT-matrices of size
       M x P.
+    If one of the arguments is a tf.SparseTensor and the other one is a
+      `TensorTrainBatch`, returns tf.Tensor of size batch_size x M x P.
     Otherwise, returns tf.Tensor of size M x P.
   """
 #   TODO: is it safe to check types? What if a class is derived from TT?
@@ -301,15 +506,190 @@ def matmul(a, b):
     return tt_dense_matmul(a, b)
   elif isinstance(a, tf.Tensor) and isinstance(b, TensorTrain):
     return dense_tt_matmul(a, b)
-  elif isinstance(a, TensorTrain) and isinstance(b, tf.SparseTensor):
+  elif isinstance(a, TensorTrainBase) and isinstance(b, tf.SparseTensor):
     return tt_sparse_matmul(a, b)
-  elif isinstance(a, tf.SparseTensor) and isinstance(b, TensorTrain):
+  elif isinstance(a, tf.SparseTensor) and isinstance(b, TensorTrainBase):
     return sparse_tt_matmul(a, b)
   else:
     raise ValueError('Argument types are not supported in matmul: %s x %s' %
                      (a, b))
 
 
+def _zip_up(tt_a, tt_b, einsum_str, res_raw_shape, res_lazy_raw_shape,
+            max_tt_rank, svd_backend=None):
+  """Computes a rank-truncated product of the TT-cores of tt_a and tt_b.
+
+  Zip-up algorithm: the TT-cores of the product are computed left to right
+  and truncated by SVD on the fly. On each step the remainder
+  R_k-1 x r^a_k-1 x r^b_k-1 (that links the truncated result with the not
+  yet processed TT-cores) is contracted with the current TT-cores of tt_a and
+  tt_b, and the result is split by the SVD into the next TT-core of the product
+  and the next remainder. The product TT-cores with ranks r^a * r^b are never
+  built, the largest tensor is of size R n m r^a r^b.
+
+  Args:
+    tt_a: `TensorTrain` or `TensorTrainBatch` object.
+    tt_b: `TensorTrain` or `TensorTrainBatch` object.
+    einsum_str: the contraction of the remainder with a TT-core of tt_a and
+      a TT-core of tt_b without the batch indices, e.g. 'xac,aijb,cjkd->xikbd'
+      for the matrix-by-matrix product. The remainder indices should go first
+      and the ranks of tt_a and tt_b last in the result.
+    res_raw_shape: the raw shape of the product (a tuple of TensorShapes).
+    res_lazy_raw_shape: the raw shape of the product as returned by
+      `shapes.lazy_raw_shape`.
+    max_tt_rank: a vector of length d+1 with the maximal TT-ranks, the values
+      larger than the maximal int32 mean that the TT-ranks are not restricted.
+    svd_backend: the name of the `t3f.linalg` SVD backend or None.
+
+  Returns:
+    `TensorTrain` or `TensorTrainBatch` if any of the arguments is a
+    `TensorTrainBatch`, with TT-ranks at most max_tt_rank.
+  """
+  ndims = tt_a.ndims()
+  max_tt_rank = np.minimum(max_tt_rank, np.iinfo(np.int32).max)
+  max_tt_rank = max_tt_rank.astype(np.int32)
+  # Convert BatchSize 1 batch into TT object to simplify broadcasting.
+  tt_a = shapes.squeeze_batch_dim(tt_a)
+  tt_b = shapes.squeeze_batch_dim(tt_b)
+  is_a_batch = isinstance(tt_a, TensorTrainBatch)
+  is_b_batch = isinstance(tt_b, TensorTrainBatch)
+  is_res_batch = is_a_batch or is_b_batch
+  if is_a_batch:
+    batch_size = shapes.lazy_batch_size(tt_a)
+  if is_b_batch:
+    batch_size = shapes.lazy_batch_size(tt_b)
+  a_ranks = shapes.lazy_tt_ranks(tt_a)
+  b_ranks = shapes.lazy_tt_ranks(tt_b)
+  inputs_str, output_str = einsum_str.split('->')
+  rest_str, a_str, b_str = inputs_str.split(',')
+  mode_sizes = []
+  for core_idx in range(ndims):
+    mode_sizes.append(1)
+    for ax in range(len(res_lazy_raw_shape)):
+      mode_sizes[-1] *= res_lazy_raw_shape[ax][core_idx]
+
+  rest = tf.ones((1, 1, 1), dtype=tt_a.dtype)
+  is_rest_batch = False
+  ranks = [1] * (ndims + 1)
+  are_tt_ranks_defined = True
+  tt_cores = []
+  for core_idx in range(ndims):
+    curr_einsum_str = '{}{},{}{},{}{}->{}{}'.format(
+        'o' if is_rest_batch else '', rest_str, 'o' if is_a_batch else '',
+        a_str, 'o' if is_b_batch else '', b_str, 'o' if is_res_batch else '',
+        output_str)
+    is_rest_batch = is_res_batch
+    curr_core = tf.einsum(curr_einsum_str, rest, tt_a.tt_cores[core_idx],
+                          tt_b.tt_cores[core_idx])
+    rows = ranks[core_idx] * mode_sizes[core_idx]
+    columns = a_ranks[core_idx + 1] * b_ranks[core_idx + 1]
+    if is_res_batch:
+      curr_core = tf.reshape(curr_core, (batch_size, rows, columns))
+    else:
+      curr_core = tf.reshape(curr_core, (rows, columns))
+    if core_idx == ndims - 1:
+      # The last TT-core has only one column and needs no truncation.
+      tt_cores.append(curr_core)
+      break
+    try:
+      ranks[core_idx + 1] = min(max_tt_rank[core_idx + 1], rows, columns)
+    except TypeError:
+      # Some of the values are undefined on the compilation stage and thus
+      # they are tf.tensors instead of values.
+      min_dim = tf.minimum(rows, columns)
+      ranks[core_idx + 1] = tf.minimum(max_tt_rank[core_idx + 1], min_dim)
+      are_tt_ranks_defined = False
+    s, u, v = linalg.svd(curr_core, max_tt_rank[core_idx + 1], svd_backend)
+    u = u[..., 0:ranks[core_idx + 1]]
+    s = s[..., 0:ranks[core_idx + 1]]
+    v = v[..., 0:ranks[core_idx + 1]]
+    tt_cores.append(u)
+    # rest = diag(s) v^T
+    rest = tf.expand_dims(s, -1) * tf.matrix_transpose(v)
+    rest_shape = (ranks[core_idx + 1], a_ranks[core_idx + 1],
+                  b_ranks[core_idx + 1])
+    if is_res_batch:
+      rest_shape = (batch_size,) + rest_shape
+    rest = tf.reshape(rest, rest_shape)
+
+  for core_idx in range(ndims):
+    core_shape = [s[core_idx] for s in res_lazy_raw_shape]
+    core_shape = [ranks[core_idx]] + core_shape + [ranks[core_idx + 1]]
+    if is_res_batch:
+      core_shape = [batch_size] + core_shape
+    tt_cores[core_idx] = tf.reshape(tt_cores[core_idx], core_shape)
+  if not are_tt_ranks_defined:
+    ranks = None
+  if is_res_batch:
+    return TensorTrainBatch(tt_cores, res_raw_shape, ranks, batch_size)
+  else:
+    return TensorTrain(tt_cores, res_raw_shape, ranks)
+
+
+def matmul_round(tt_matrix_a, tt_matrix_b, max_tt_rank=10, epsilon=None,
+                 svd_backend=None, qr_backend=None):
+  """Multiplies two TT-matrices and rounds the result.
+
+  Equivalent to round(tt_tt_matmul(a, b), max_tt_rank, epsilon), but never
+  builds the TT-cores of the product with the TT-ranks r_a * r_b. Instead,
+  the product is computed left to right with truncation to the TT-ranks
+  2 * max_tt_rank on each step (zip-up algorithm) and the result is rounded
+  once more to max_tt_rank, which makes the truncation close to the optimal
+  one.
+  The complexity is O(d R n^2 m r_a r_b (R + r_a + r_b)) instead of
+  O(d n m (r_a r_b)^3) of the rounding of the explicit product.
+
+  Args:
+    tt_matrix_a: `TensorTrain` or `TensorTrainBatch` object containing
+      a TT-matrix (a batch of TT-matrices) of size M x N
+    tt_matrix_b: `TensorTrain` or `TensorTrainBatch` object containing
+      a TT-matrix (a batch of TT-matrices) of size N x P
+    max_tt_rank: a number or a list of numbers, see `t3f.round`.
+    epsilon: a floating point number or None, see `t3f.round`.
+    svd_backend: (Optional) the name of the `t3f.linalg` SVD backend, by
+      default the backend of the current `t3f.linalg.svd_backend` scope.
+    qr_backend: (Optional) the name of the `t3f.linalg` QR backend, by
+      default the backend of the current `t3f.linalg.qr_backend` scope.
+
+  Returns
+    `TensorTrain` object containing a TT-matrix of size M x P if both arguments
+      are `TensorTrain`s
+    `TensorTrainBatch` if any of the arguments is a `TensorTrainBatch`
+
+  Raises:
+    ValueError is the arguments are not TT matrices or if their sizes are not
+    appropriate for a matrix-by-matrix multiplication, or if max_tt_rank is
+    not valid.
+  """
+  if not isinstance(tt_matrix_a, TensorTrainBase) or \
+      not isinstance(tt_matrix_b, TensorTrainBase) or \
+      not tt_matrix_a.is_tt_matrix() or \
+      not tt_matrix_b.is_tt_matrix():
+    raise ValueError('Arguments should be TT-matrices')
+
+  if not shapes.is_batch_broadcasting_possible(tt_matrix_a, tt_matrix_b):
+    raise ValueError('The batch sizes are different and not 1, broadcasting is '
+                     'not available.')
+
+  ndims = tt_matrix_a.ndims()
+  if tt_matrix_b.ndims() != ndims:
+    raise ValueError('Arguments should have the same number of dimensions, '
+                     'got %d and %d instead.' % (ndims, tt_matrix_b.ndims()))
+  max_tt_rank = utils.max_tt_rank_vector(max_tt_rank, ndims)
+
+  res_raw_shape = (tt_matrix_a.get_raw_shape()[0],
+                   tt_matrix_b.get_raw_shape()[1])
+  res_lazy_raw_shape = (shapes.lazy_raw_shape(tt_matrix_a)[0],
+                        shapes.lazy_raw_shape(tt_matrix_b)[1])
+  # Truncating in the sweep is not optimal since the not yet processed part
+  # of the product is not orthogonal, so keep more singular values.
+  res = _zip_up(tt_matrix_a, tt_matrix_b, 'xac,aijb,cjkd->xikbd',
+                res_raw_shape, res_lazy_raw_shape,
+                2 * max_tt_rank.astype(np.int64), svd_backend)
+  return decompositions.round(res, max_tt_rank, epsilon, svd_backend,
+                              qr_backend)
+
+
 def tt_tt_flat_inner(tt_a, tt_b):
   """Inner product between two TT-tensors or TT-matrices along all axis.
 
@@ -385,20 +765,208 @@ def tt_tt_flat_inner(tt_a, tt_b):
 def tt_dense_flat_inner(tt_a, dense_b):
   """Inner product between a TT-tensor (or TT-matrix) and tf.Tensor along all axis.
 
-  The shapes of tt_a and dense_b should coincide.
+  The shapes of tt_a and dense_b should coincide (up to the batch dimension).
+  The dense tensor is contracted with the TT-cores one by one, so apart from
+  dense_b only a remainder of size (r_k * n_k+1 ... n_d-1) is stored.
 
   Args:
-    tt_a: `TensorTrain` object
-    dense_b: tf.Tensor
+    tt_a: `TensorTrain` or `TensorTrainBatch` object
+    dense_b: tf.Tensor of the same shape as tt_a (i.e. a matrix of size M x N
+      for TT-matrices) or with an additional leading batch dimension.
 
   Returns
-    a number
+    a number or a Tensor with numbers for each element in the batch.
     sum of products of all the elements of tt_a and dense_b
+
+  Raises:
+    ValueError if the shapes of the arguments are not compatible.
   """
-  raise NotImplementedError
+  if not isinstance(tt_a, TensorTrainBase):
+    raise ValueError('The first argument should be a TensorTrain or a '
+                     'TensorTrainBatch')
+  ndims = tt_a.ndims()
+  tensor_ndims = 2 if tt_a.is_tt_matrix() else ndims
+  dense_ndims = dense_b.get_shape().ndims
+  if dense_ndims is None:
+    raise ValueError('The number of dimensions of the dense tensor should be '
+                     'known on the compilation stage.')
+  if dense_ndims not in (tensor_ndims, tensor_ndims + 1):
+    raise ValueError('The dense tensor should have %d or %d (with the batch '
+                     'dimension) dimensions, got %d.' %
+                     (tensor_ndims, tensor_ndims + 1, dense_ndims))
+  is_dense_batch = dense_ndims == tensor_ndims + 1
+  is_tt_batch = isinstance(tt_a, TensorTrainBatch)
+  tt_shape = tt_a.get_shape()
+  if is_tt_batch:
+    tt_shape = tt_shape[1:]
+  dense_shape = dense_b.get_shape()
+  if is_dense_batch:
+    dense_shape = dense_shape[1:]
+  if not tt_shape.is_compatible_with(dense_shape):
+    raise ValueError('The shapes of the arguments should coincide, got %s and '
+                     '%s.' % (tt_a.get_shape(), dense_b.get_shape()))
+
+  raw_shape = shapes.lazy_raw_shape(tt_a)
+  ranks = shapes.lazy_tt_ranks(tt_a)
+  tt_batch_str = 'o' if is_tt_batch else ''
+  if tt_a.is_tt_matrix():
+    core_str, rest_str, res_rest_str = 'aijb', 'aixjy', 'bxy'
+  else:
+    core_str, rest_str, res_rest_str = 'aib', 'aix', 'bx'
+  # The remainder of the dense tensor, of size
+  # [batch_size] x r_k x (n_k ... n_d-1) [x (m_k ... m_d-1)].
+  rest = dense_b
+  rest_batch_str = 'o' if is_dense_batch else ''
+  for core_idx in range(ndims):
+    rest_shape = [ranks[core_idx]]
+    for ax in range(len(raw_shape)):
+      # The size of the modes that are left after absorbing the current one.
+      rest_size = 1
+      for i in range(core_idx + 1, ndims):
+        rest_size *= raw_shape[ax][i]
+      rest_shape += [raw_shape[ax][core_idx], rest_size]
+    if rest_batch_str:
+      rest_shape = [-1] + rest_shape
+    rest = tf.reshape(rest, rest_shape)
+    res_batch_str = 'o' if is_tt_batch or rest_batch_str else ''
+    # Simplest example of this operation:
+    # if the argument is a TT-tensor, then it is
+    # rest = tf.einsum('aib,aix->bx', core, rest)
+    einsum_str = '{}{},{}{}->{}{}'.format(tt_batch_str, core_str,
+                                          rest_batch_str, rest_str,
+                                          res_batch_str, res_rest_str)
+    rest = tf.einsum(einsum_str, tt_a.tt_cores[core_idx], rest)
+    rest_batch_str = res_batch_str
+  if rest_batch_str:
+    return tf.reshape(rest, [-1])
+  else:
+    return tf.reshape(rest, [])
+
+
+def _unique_prefixes(mode_indices, mode_sizes):
+  """Finds the distinct prefixes (i_0, ..., i_k) of the indices for each k.
 
+  The prefixes form a trie: the k-th prefix of an index is identified by the
+  (k-1)-th prefix id and i_k, so the distinct k-th prefixes are computed as
+  tf.unique of the keys parent_id * n_k + i_k.
 
-def tt_sparse_flat_inner(tt_a, sparse_b):
+  Args:
+    mode_indices: a list of d int64 tf.Tensors of size N.
+    mode_sizes: a list of d mode sizes.
+
+  Returns:
+    A list of d tuples (keys, idx), where keys are the distinct keys of the
+    k-th prefixes and idx maps each of the N indices into the position of its
+    prefix in keys.
+  """
+  prefixes = []
+  parent_idx = tf.zeros_like(mode_indices[0])
+  for core_idx in range(len(mode_indices)):
+    mode_size = tf.cast(mode_sizes[core_idx], tf.int64)
+    keys, parent_idx = tf.unique(parent_idx * mode_size +
+                                 mode_indices[core_idx],
+                                 out_idx=tf.int64)
+    prefixes.append((keys, parent_idx))
+  return prefixes
+
+
+def gather_nd(tt, indices, share_prefixes=False):
+  """Gathers the elements of a TT-tensor (or TT-matrix) at the given indices.
+
+  Computes the elements one by one as the product of the corresponding slices
+  of the TT-cores (with batched matmuls), without building the full tensor.
+  The complexity is O(N d r^2), where N is the number of indices.
+
+  If share_prefixes is True, the indices are grouped into a trie and each
+  distinct prefix product (the product of the first k TT-core slices) is
+  computed only once, which is much faster when the indices share leading
+  sub-indices (e.g. they are dense in the first modes). See
+  `prefix_sharing_stats` for the number of saved matmuls.
+
+  Example:
+    >>> tt = t3f.random_tensor((3, 4, 5))
+    >>> t3f.gather_nd(tt, [[0, 1, 2], [2, 3, 4]])
+    # Equals to [t3f.full(tt)[0, 1, 2], t3f.full(tt)[2, 3, 4]].
+
+  Args:
+    tt: `TensorTrain` or `TensorTrainBatch` object.
+    indices: int tf.Tensor (or np.array, or list) of size N x d for TT-tensors.
+      For TT-matrices either of size N x 2 with (row, column) indices of the
+      elements in the matrix, or of size N x 2d with multi-indices, the first d
+      columns index the rows of the underlying tensor and the last d columns
+      index the columns.
+    share_prefixes: bool, whether to compute each distinct prefix product only
+      once.
+
+  Returns:
+    tf.Tensor of size N with the elements of tt, or of size batch_size x N if
+    tt is a `TensorTrainBatch`.
+
+  Raises:
+    ValueError if the size of the indices is not compatible with tt.
+  """
+  num_dims = tt.ndims()
+  indices = tf.convert_to_tensor(indices)
+  mode_indices, mode_sizes = utils.gather_nd_mode_indices(tt, indices)
+  is_batch = isinstance(tt, TensorTrainBatch)
+  num_elements = tf.shape(indices)[0]
+  if share_prefixes:
+    prefixes = _unique_prefixes(mode_indices, mode_sizes)
+    # All the prefixes of length 0 are the same.
+    num_prefixes = 1
+  else:
+    num_prefixes = num_elements
+  if is_batch:
+    # The elements of the batch are processed together as a second batch
+    # dimension of the matmuls.
+    batch_size = shapes.lazy_batch_size(tt)
+    elements = tf.ones((num_prefixes, batch_size, 1, 1), dtype=tt.dtype)
+  else:
+    elements = tf.ones((num_prefixes, 1, 1), dtype=tt.dtype)
+  for core_idx in range(num_dims):
+    curr_core = utils.gather_core_slices(tt, core_idx, mode_sizes[core_idx])
+    if share_prefixes:
+      # Multiply each distinct parent prefix by the next core slice.
+      keys = prefixes[core_idx][0]
+      mode_size = tf.cast(mode_sizes[core_idx], tf.int64)
+      elements = tf.gather(elements, keys // mode_size)
+      core_slices = tf.gather(curr_core, keys % mode_size)
+    else:
+      core_slices = tf.gather(curr_core, mode_indices[core_idx])
+    elements = tf.matmul(elements, core_slices)
+  if share_prefixes:
+    elements = tf.gather(elements, prefixes[-1][1])
+  if is_batch:
+    return tf.transpose(tf.reshape(elements, (num_elements, batch_size)))
+  else:
+    return tf.reshape(elements, [num_elements])
+
+
+def prefix_sharing_stats(tt, indices):
+  """Counts the matmuls gather_nd does with and without sharing the prefixes.
+
+  Args:
+    tt: `TensorTrain` or `TensorTrainBatch` object.
+    indices: int tf.Tensor (or np.array, or list), see `gather_nd`.
+
+  Returns:
+    A tuple of two int64 scalar tf.Tensors: the number of TT-core slice matmuls
+    with share_prefixes=True (the number of distinct prefixes summed over all
+    the lengths), and the number of matmuls without sharing (N * d).
+
+  Raises:
+    ValueError if the size of the indices is not compatible with tt.
+  """
+  indices = tf.convert_to_tensor(indices)
+  mode_indices, mode_sizes = utils.gather_nd_mode_indices(tt, indices)
+  prefixes = _unique_prefixes(mode_indices, mode_sizes)
+  num_shared = tf.add_n([tf.size(keys, out_type=tf.int64)
+                         for keys, _ in prefixes])
+  num_naive = tf.size(mode_indices[0], out_type=tf.int64) * tt.ndims()
+  return num_shared, num_naive
+
+
+def tt_sparse_flat_inner(tt_a, sparse_b, share_prefixes=False):
   """Inner product between a TT-tensor (or TT-matrix) and tf.SparseTensor along all axis.
 
   The shapes of tt_a and sparse_b should coincide.
@@ -406,53 +974,15 @@ def tt_sparse_flat_inner(tt_a, sparse_b):
   Args:
     tt_a: `TensorTrain` object
     sparse_b: tf.SparseTensor
+    share_prefixes: bool, whether to compute each distinct prefix product of
+      the TT-core slices only once, see `gather_nd`.
 
   Returns
     a number
     sum of products of all the elements of tt_a and sparse_b
   """
-  if sparse_b.indices.get_shape().is_fully_defined():
-    num_elements = sparse_b.indices.get_shape()[0]
-  else:
-    num_elements = tf.shape(sparse_b.indices)[0]
-  tt_a_elements = tf.ones((num_elements, 1, 1))
-  a_shape = shapes.lazy_raw_shape(tt_a)
-  a_ranks = shapes.lazy_tt_ranks(tt_a)
-  if tt_a.is_tt_matrix():
-    # TODO: use t3f.shape is safer??
-    tensor_shape = tt_a.get_raw_shape()
-    row_idx_linear = tf.cast(sparse_b.indices[:, 0], tf.int64)
-    row_idx = utils.unravel_index(row_idx_linear, tf.cast(tensor_shape[0], tf.int64))
-    col_idx_linear = tf.cast(sparse_b.indices[:, 1], tf.int64)
-    col_idx = utils.unravel_index(col_idx_linear, tf.cast(tensor_shape[1], tf.int64))
-    for core_idx in range(tt_a.ndims()):
-      # TODO: probably a very slow way to do it, wait for a reasonable gather
-      # implementation
-      # https://github.com/tensorflow/tensorflow/issues/206
-      curr_core = tt_a.tt_cores[core_idx]
-      left_rank = a_ranks[core_idx]
-      right_rank = a_ranks[core_idx + 1]
-      curr_core = tf.transpose(curr_core, (1, 2, 0, 3))
-      curr_core_shape = (a_shape[0][core_idx]*a_shape[1][core_idx], left_rank,
-                         right_rank)
-      curr_core = tf.reshape(curr_core, curr_core_shape)
-      # Ravel multiindex (row_idx[:, core_idx], col_idx[:, core_idx]) into
-      # a linear index to use tf.gather that supports only first dimensional
-      # gather.
-      curr_elements_idx = row_idx[:, core_idx] * tensor_shape[1][core_idx]
-      curr_elements_idx += col_idx[:, core_idx]
-      core_slices = tf.gather(curr_core, curr_elements_idx)
-      tt_a_elements = tf.matmul(tt_a_elements, core_slices)
-  else:
-    for core_idx in range(tt_a.ndims()):
-      curr_elements_idx = sparse_b.indices[:, core_idx]
-      # TODO: probably a very slow way to do it, wait for a reasonable gather
-      # implementation
-      # https://github.com/tensorflow/tensorflow/issues/206
-      curr_core = tt_a.tt_cores[core_idx]
-      curr_core = tf.transpose(curr_core, (1, 0, 2))
-      core_slices = tf.gather(curr_core, curr_elements_idx)
-      tt_a_elements = tf.matmul(tt_a_elements, core_slices)
+  tt_a_elements = gather_nd(tt_a, sparse_b.indices,
+                            share_prefixes=share_prefixes)
   tt_a_elements = tf.reshape(tt_a_elements, (1, -1))
   sparse_b_elements = tf.reshape(sparse_b.values, (-1, 1))
   result = tf.matmul(tt_a_elements, sparse_b_elements)
@@ -464,17 +994,21 @@ def tt_sparse_flat_inner(tt_a, sparse_b):
 def dense_tt_flat_inner(dense_a, tt_b):
   """Inner product between a tf.Tensor and TT-tensor (or TT-matrix) along all axis.
 
-  The shapes of dense_a and tt_b should coincide.
+  The shapes of dense_a and tt_b should coincide (up to the batch dimension).
 
   Args:
-    dense_a: tf.Tensor
-    tt_b: `TensorTrain` object
+    dense_a: tf.Tensor of the same shape as tt_b (i.e. a matrix of size M x N
+      for TT-matrices) or with an additional leading batch dimension.
+    tt_b: `TensorTrain` or `TensorTrainBatch` object
 
   Returns
-    a number
+    a number or a Tensor with numbers for each element in the batch.
     sum of products of all the elements of dense_a and tt_b
+
+  Raises:
+    ValueError if the shapes of the arguments are not compatible.
   """
-  raise NotImplementedError
+  return tt_dense_flat_inner(tt_b, dense_a)
 
 
 def sparse_tt_flat_inner(sparse_a, tt_b):
@@ -512,9 +1046,9 @@ def flat_inner(a, b):
 #   TODO: is it safe to check types? What if a class is derived from TT?
   if isinstance(a, TensorTrainBase) and isinstance(b, TensorTrainBase):
     return tt_tt_flat_inner(a, b)
-  elif isinstance(a, TensorTrain) and isinstance(b, tf.Tensor):
+  elif isinstance(a, TensorTrainBase) and isinstance(b, tf.Tensor):
     return tt_dense_flat_inner(a, b)
-  elif isinstance(a, tf.Tensor) and isinstance(b, TensorTrain):
+  elif isinstance(a, tf.Tensor) and isinstance(b, TensorTrainBase):
     return dense_tt_flat_inner(a, b)
   elif isinstance(a, TensorTrain) and isinstance(b, tf.SparseTensor):
     return tt_sparse_flat_inner(a, b)
@@ -728,6 +1262,142 @@ def add(tt_a, tt_b):
     return TensorTrain(tt_cores, tt_a.get_raw_shape(), out_ranks)
 
 
+def add_n(tt_objects, max_tt_rank=None, epsilon=None, pairwise=False):
+  """Returns a TensorTrain corresponding to the sum of several TT-objects.
+
+  The TT-cores of the sum are assembled at once as block-diagonal matrices
+  of the TT-cores of the summands (instead of calling `add` K - 1 times), so
+  the TT-ranks of the result are the sums of the TT-ranks of the summands.
+  If max_tt_rank or epsilon is provided, the result is rounded once.
+  If pairwise is True, the summands are added in a pairwise tree and each of
+  the partial sums is rounded, which bounds the intermediate TT-ranks (by
+  2 * max_tt_rank if it is provided) at the cost of log2(K) roundings
+  instead of one.
+
+  Supports broadcasting: the `TensorTrain` summands are added to each element
+  of the `TensorTrainBatch` summands.
+
+  Args:
+    tt_objects: a list of `TensorTrain` or `TensorTrainBatch` objects, all
+      TT-tensors or all TT-matrices of the same shape.
+    max_tt_rank: a number or a list of numbers, see `t3f.round`.
+    epsilon: a floating point number or None, see `t3f.round`. If both
+      max_tt_rank and epsilon are None, the sum is not rounded.
+    pairwise: bool, whether to add and round the summands pairwise.
+
+  Returns
+    a `TensorTrain` object corresponding to the sum of the arguments if all
+      of them are `TensorTrain`s.
+    OR a `TensorTrainBatch` if at least one of the arguments is
+      `TensorTrainBatch`
+
+  Raises
+    ValueError if the list is empty, if the arguments shapes do not coincide,
+      or if pairwise is True and both max_tt_rank and epsilon are None.
+  """
+  tt_objects = list(tt_objects)
+  if len(tt_objects) == 0:
+    raise ValueError('The list of TT-objects should not be empty.')
+  is_rounded = max_tt_rank is not None or epsilon is not None
+  if pairwise and not is_rounded:
+    raise ValueError('Pairwise summation requires max_tt_rank or epsilon.')
+  first = tt_objects[0]
+  for tt in tt_objects[1:]:
+    if tt.is_tt_matrix() != first.is_tt_matrix():
+      raise ValueError('The arguments should be all TT-tensors or all '
+                       'TT-matrices')
+    if tt.get_raw_shape() != first.get_raw_shape():
+      raise ValueError('The arguments should have the same shape.')
+    if tt.ndims() != first.ndims():
+      raise ValueError('The arguments should have the same number of '
+                       'dimensions.')
+    if not shapes.is_batch_broadcasting_possible(tt, first):
+      raise ValueError('The batch sizes are different and not 1, '
+                       'broadcasting is not available.')
+
+  if pairwise:
+    while len(tt_objects) > 1:
+      next_level = []
+      for i in range(0, len(tt_objects) - 1, 2):
+        curr_sum = _add_n(tt_objects[i:i + 2])
+        next_level.append(decompositions.round(curr_sum, max_tt_rank,
+                                               epsilon))
+      if len(tt_objects) % 2 == 1:
+        next_level.append(tt_objects[-1])
+      tt_objects = next_level
+    return tt_objects[0]
+
+  res = _add_n(tt_objects)
+  if is_rounded:
+    res = decompositions.round(res, max_tt_rank, epsilon)
+  return res
+
+
+def _add_n(tt_objects):
+  """Internal function that assembles the TT-cores of the sum.
+
+  See t3f.add_n for details.
+  """
+  first = tt_objects[0]
+  ndims = first.ndims()
+  batch_tts = [tt for tt in tt_objects if isinstance(tt, TensorTrainBatch)]
+  is_batch_case = len(batch_tts) > 0
+  batch_size = None
+  if is_batch_case:
+    # Use the batch size of a not broadcastable batch if there is one.
+    batch_tt = batch_tts[0]
+    for tt in batch_tts:
+      if tt.batch_size != 1:
+        batch_tt = tt
+    batch_size = shapes.lazy_batch_size(batch_tt)
+    static_batch_size = batch_tt.batch_size
+    tt_objects = [shapes.expand_batch_dim(tt) for tt in tt_objects]
+  all_ranks = [shapes.lazy_tt_ranks(tt) for tt in tt_objects]
+  left_axis = 1 if is_batch_case else 0
+  right_axis = left_axis + (3 if first.is_tt_matrix() else 2)
+  num_axes = right_axis + 1
+
+  tt_cores = []
+  for core_idx in range(ndims):
+    curr_cores = []
+    for tt in tt_objects:
+      curr_core = tt.tt_cores[core_idx]
+      if is_batch_case and tt.batch_size == 1 and static_batch_size != 1:
+        curr_core = tf.tile(curr_core, [batch_size] + [1] * (num_axes - 1))
+      curr_cores.append(curr_core)
+    if core_idx == 0:
+      curr_core = tf.concat(curr_cores, axis=right_axis)
+    elif core_idx == ndims - 1:
+      curr_core = tf.concat(curr_cores, axis=left_axis)
+    else:
+      # Pad each TT-core with zeros along the right TT-rank to put it into
+      # its block of the block-diagonal TT-core.
+      right_ranks = [ranks[core_idx + 1] for ranks in all_ranks]
+      total_right_rank = sum(right_ranks)
+      offset = 0
+      for i in range(len(curr_cores)):
+        paddings = [[0, 0]] * num_axes
+        paddings[right_axis] = [offset,
+                                total_right_rank - offset - right_ranks[i]]
+        curr_cores[i] = tf.pad(curr_cores[i], paddings)
+        offset += right_ranks[i]
+      curr_core = tf.concat(curr_cores, axis=left_axis)
+    tt_cores.append(curr_core)
+
+  out_ranks = [1]
+  for core_idx in range(1, ndims):
+    curr_rank = 0
+    for tt in tt_objects:
+      curr_rank += tt.get_tt_ranks()[core_idx]
+    out_ranks.append(curr_rank)
+  out_ranks.append(1)
+  if is_batch_case:
+    return TensorTrainBatch(tt_cores, first.get_raw_shape(), out_ranks,
+                            static_batch_size)
+  else:
+    return TensorTrain(tt_cores, first.get_raw_shape(), out_ranks)
+
+
 def multiply(tt_left, right):
   """Returns a TensorTrain corresponding to element-wise product tt_left * right.
 
@@ -789,6 +1459,61 @@ def multiply(tt_left, right):
                             tt_left.batch_size)
 
 
+def multiply_round(tt_left, tt_right, max_tt_rank=10, epsilon=None,
+                   svd_backend=None, qr_backend=None):
+  """Computes the element-wise product of two TT-objects and rounds it.
+
+  Equivalent to round(multiply(tt_left, tt_right), max_tt_rank, epsilon), but
+  never builds the TT-cores of the product with the TT-ranks r_a * r_b, see
+  `matmul_round` for details of the algorithm.
+
+  Args:
+    tt_left: `TensorTrain` or `TensorTrainBatch`, TT-tensor or TT-matrix
+    tt_right: `TensorTrain` or `TensorTrainBatch`, TT-tensor or TT-matrix of
+      the same shape.
+    max_tt_rank: a number or a list of numbers, see `t3f.round`.
+    epsilon: a floating point number or None, see `t3f.round`.
+    svd_backend: (Optional) the name of the `t3f.linalg` SVD backend, by
+      default the backend of the current `t3f.linalg.svd_backend` scope.
+    qr_backend: (Optional) the name of the `t3f.linalg` QR backend, by
+      default the backend of the current `t3f.linalg.qr_backend` scope.
+
+  Returns
+    a `TensorTrain` object corresponding to the element-wise product of the
+      arguments if both arguments are `TensorTrain`s.
+    OR a `TensorTrainBatch` if at least one of the arguments is
+      `TensorTrainBatch`
+
+  Raises
+    ValueError if the arguments are not TT-objects, if the arguments shapes do
+      not coincide, or if max_tt_rank is not valid.
+  """
+  if not isinstance(tt_left, TensorTrainBase) or \
+      not isinstance(tt_right, TensorTrainBase):
+    raise ValueError('The arguments should be TT-objects.')
+  if tt_left.is_tt_matrix() != tt_right.is_tt_matrix():
+    raise ValueError('The arguments should be both TT-tensors or both '
+                     'TT-matrices')
+  if tt_left.get_raw_shape() != tt_right.get_raw_shape():
+    raise ValueError('The arguments should have the same shape.')
+  if not shapes.is_batch_broadcasting_possible(tt_left, tt_right):
+    raise ValueError('The batch sizes are different and not 1, broadcasting is '
+                     'not available.')
+  max_tt_rank = utils.max_tt_rank_vector(max_tt_rank, tt_left.ndims())
+
+  if tt_left.is_tt_matrix():
+    einsum_str = 'xac,aijb,cijd->xijbd'
+  else:
+    einsum_str = 'xac,aib,cid->xibd'
+  # Truncating in the sweep is not optimal since the not yet processed part
+  # of the product is not orthogonal, so keep more singular values.
+  res = _zip_up(tt_left, tt_right, einsum_str, tt_left.get_raw_shape(),
+                shapes.lazy_raw_shape(tt_left),
+                2 * max_tt_rank.astype(np.int64), svd_backend)
+  return decompositions.round(res, max_tt_rank, epsilon, svd_backend,
+                              qr_backend)
+
+
 def frobenius_norm_squared(tt, differentiable=False):
   """Frobenius norm squared of a TensorTrain (sum of squares of all elements).
 
@@ -817,15 +1542,22 @@ def frobenius_norm_squared(tt, differentiable=False):
                                  curr_core)
     return running_prod[0, 0]
   else:
-    orth_tt = decompositions.orthogonalize_tt_cores(tt, left_to_right=True)
-    # All the cores of orth_tt except the last one are orthogonal, hence
-    # the Frobenius norm of orth_tt equals to the norm of the last core.
+    if tt.orthogonality == 'right':
+      # All the cores except the first one are orthogonal, hence the Frobenius
+      # norm of tt equals to the norm of the first core.
+      norm_core = tt.tt_cores[0]
+    else:
+      # The orthogonalization is cached in tt, so it is done only once.
+      orth_tt = decompositions.orthogonalize_tt_cores(tt, left_to_right=True)
+      # All the cores of orth_tt except the last one are orthogonal, hence
+      # the Frobenius norm of orth_tt equals to the norm of the last core.
+      norm_core = orth_tt.tt_cores[-1]
     if hasattr(tt, 'batch_size'):
       batch_size = shapes.lazy_batch_size(tt)
-      last_core = tf.reshape(orth_tt.tt_cores[-1], (batch_size, -1))
-      return tf.norm(last_core, axis=1) ** 2
+      norm_core = tf.reshape(norm_core, (batch_size, -1))
+      return tf.norm(norm_core, axis=1) ** 2
     else:
-      return tf.norm(orth_tt.tt_cores[-1]) ** 2
+      return tf.norm(norm_core) ** 2
 
 
 def frobenius_norm(tt, epsilon=1e-5, differentiable=False):
@@ -885,13 +1617,18 @@ def transpose(tt_matrix):
 def quadratic_form(A, b, c):
   """Computes the quadratic form b^t A c where A is a TT-matrix (or a batch).
 
+  If b and c are TT-vectors, the TT-cores of b, A, and c are contracted in a
+  single left-to-right sweep that stores only a r_b x r_A x r_c tensor, which
+  costs O(d r^3 n^2) instead of O(d r^4 n^2) of the explicit
+  flat_inner(A, b c^T).
+
   Args:
     A: `TensorTrain` object containing a TT-matrix or `TensorTrainBatch`
       with a batch of TT-matrices.
     b: `TensorTrain` object containing a TT-vector or `TensorTrainBatch`
-      with a batch of TT-vectors.
+      with a batch of TT-vectors, or a dense tf.Tensor vector of size M x 1.
     c: `TensorTrain` object containing a TT-vector or `TensorTrainBatch`
-      with a batch of TT-vectors.
+      with a batch of TT-vectors, or a dense tf.Tensor vector of size N x 1.
 
   Returns:
     A number, the value of the quadratic form if all the arguments are
@@ -901,19 +1638,88 @@ def quadratic_form(A, b, c):
 
   Raises:
     ValueError if the argument is not a TT-matrix or if the shapes are
-      not consistent.
+      not consistent, or if A is a `TensorTrainBatch` and b or c is dense.
   """
   if not isinstance(A, TensorTrainBase) or not A.is_tt_matrix():
     raise ValueError('The arguments should be a TT-matrix.')
 
-  # TODO: support tf.Tensor as b and c.
-  if not isinstance(b, TensorTrainBase) or not b.is_tt_matrix():
-    raise ValueError('The arguments should be a TT-matrix.')
-  if not isinstance(c, TensorTrainBase) or not c.is_tt_matrix():
-    raise ValueError('The arguments should be a TT-matrix.')
+  for vec in (b, c):
+    if isinstance(vec, TensorTrainBase):
+      if not vec.is_tt_matrix():
+        raise ValueError('The arguments should be a TT-matrix.')
+      if vec.ndims() != A.ndims():
+        raise ValueError('The arguments should have the same number of '
+                         'dimensions, got %d and %d instead.' %
+                         (A.ndims(), vec.ndims()))
+      if not shapes.is_batch_broadcasting_possible(A, vec):
+        raise ValueError('The batch sizes are different and not 1, '
+                         'broadcasting is not available.')
+    elif not isinstance(vec, tf.Tensor):
+      raise ValueError('The arguments should be a TT-matrix or a tf.Tensor.')
+
+  if isinstance(b, tf.Tensor) or isinstance(c, tf.Tensor):
+    # Multiply A by the dense vector and take the inner product with the
+    # other one.
+    if not isinstance(A, TensorTrain):
+      raise ValueError('Batches of TT-matrices with dense vectors are not '
+                       'supported.')
+    if isinstance(c, tf.Tensor):
+      matvec = tt_dense_matmul(A, c)
+      other = b
+    else:
+      matvec = tt_dense_matmul(transpose(A), b)
+      other = c
+    if isinstance(other, tf.Tensor):
+      return tf.reduce_sum(other * matvec)
+    else:
+      return tt_dense_flat_inner(other, matvec)
 
-  # TODO: make a more efficient implementation taylored for this case.
-  return flat_inner(A, tt_tt_matmul(b, transpose(c)))
+  if not shapes.is_batch_broadcasting_possible(b, c):
+    raise ValueError('The batch sizes are different and not 1, broadcasting is '
+                     'not available.')
+  is_b_same_as_c = b is c
+  is_batch_input = any(isinstance(tt, TensorTrainBatch) for tt in (A, b, c))
+  # Convert BatchSize 1 batch into TT object to simplify broadcasting.
+  A = shapes.squeeze_batch_dim(A)
+  b = shapes.squeeze_batch_dim(b)
+  c = b if is_b_same_as_c else shapes.squeeze_batch_dim(c)
+  is_A_batch = isinstance(A, TensorTrainBatch)
+  is_b_batch = isinstance(b, TensorTrainBatch)
+  is_c_batch = isinstance(c, TensorTrainBatch)
+  # The environment (the contraction of the first k TT-cores of b, A, and c)
+  # is a tensor of size [batch_size] x r_b x r_A x r_c. The first ranks are 1,
+  # so the sweep starts from a (not batch) tensor of ones.
+  env = tf.ones((1, 1, 1), dtype=A.dtype)
+  is_env_batch = False
+  for core_idx in range(A.ndims()):
+    # Remove the column dimension of the TT-vectors.
+    b_core = tf.squeeze(b.tt_cores[core_idx], axis=[-2])
+    if is_b_same_as_c:
+      c_core = b_core
+    else:
+      c_core = tf.squeeze(c.tt_cores[core_idx], axis=[-2])
+    # Simplest example of this operation:
+    # if all the arguments are not batches, then it is
+    # env = tf.einsum('abc,aid,bijf,cjg->dfg', env, b_core, A_core, c_core)
+    for core, is_core_batch, einsum_str in (
+        (b_core, is_b_batch, '{}abc,{}aid->{}bcid'),
+        (A.tt_cores[core_idx], is_A_batch, '{}bcid,{}bijf->{}cdjf'),
+        (c_core, is_c_batch, '{}cdjf,{}cjg->{}dfg')):
+      env_batch_str = 'o' if is_env_batch else ''
+      core_batch_str = 'o' if is_core_batch else ''
+      is_env_batch = is_env_batch or is_core_batch
+      res_batch_str = 'o' if is_env_batch else ''
+      einsum_str = einsum_str.format(env_batch_str, core_batch_str,
+                                     res_batch_str)
+      env = tf.einsum(einsum_str, env, core)
+  # Remove only the (rank 1) r_b, r_A, and r_c dimensions to keep the batch
+  # dimension even if the batch size is 1 or unknown.
+  if is_env_batch:
+    return tf.reshape(env, [-1])
+  elif is_batch_input:
+    return tf.reshape(env, [1])
+  else:
+    return env[0, 0, 0]
 
 
 def cast(tt_a, dtype):
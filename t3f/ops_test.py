@@ -6,6 +6,7 @@ from t3f.tensor_train_batch import TensorTrainBatch
 from t3f import ops
 from t3f import shapes
 from t3f import initializers
+from t3f import decompositions
 
 
 class TTTensorTest(tf.test.TestCase):
@@ -38,6 +39,35 @@ class TTTensorTest(tf.test.TestCase):
         actual = ops.full(tf_tens)
         self.assertAllClose(desired, actual.eval())
 
+  def testFullContractionPlan(self):
+    # The TT-ranks grow to the right, so it's cheaper to start from the last
+    # TT-cores.
+    np.random.seed(1)
+    tt_ranks = (1, 1, 1, 16, 1)
+    tt_cores = []
+    for core_idx in range(4):
+      curr_shape = (tt_ranks[core_idx], 4, tt_ranks[core_idx + 1])
+      tt_cores.append(np.random.rand(*curr_shape).astype(np.float32))
+    tf_tens = TensorTrain(tt_cores)
+    plan = ops.full_contraction_plan(tf_tens)
+    self.assertEqual('split', plan['order'])
+    self.assertEqual(2, plan['split'])
+    self.assertEqual(256, plan['peak_size'])
+    desired = np.einsum('aib,bjc,ckd,dle->ijkl', *tt_cores)
+    with self.test_session():
+      self.assertAllClose(desired, ops.full(tf_tens).eval())
+
+    # Decreasing TT-ranks, the default left to right order is the best one.
+    plan = ops.full_contraction_plan(initializers.random_tensor(
+        (4, 4, 4, 4), tt_rank=(1, 16, 4, 1, 1)))
+    self.assertEqual('left_to_right', plan['order'])
+
+    # Unknown TT-ranks, no plan.
+    pl_1 = tf.placeholder(tf.float32, (1, 4, None))
+    pl_2 = tf.placeholder(tf.float32, (None, 4, 1))
+    tt = TensorTrain([pl_1, pl_2])
+    self.assertIsNone(ops.full_contraction_plan(tt))
+
   def testFlatInnerTTTensbyTTTens(self):
     # Inner product between two TT-tensors.
     shape_list = ((2, 2),
@@ -80,6 +110,55 @@ class TTTensorTest(tf.test.TestCase):
             res_desired_val = tt_1_val.flatten()[sparse_flat_indices].dot(values)
             self.assertAllClose(res_actual_val, res_desired_val)
 
+  def testGatherNd(self):
+    # Gather elements of a TT-tensor.
+    shape = (2, 3, 4)
+    np.random.seed(1)
+    flat_indices = np.random.choice(np.prod(shape), 10)
+    indices = np.vstack(np.unravel_index(flat_indices, shape)).transpose()
+    tt = initializers.random_tensor(shape, tt_rank=3)
+    with self.test_session() as sess:
+      res_actual = ops.gather_nd(tt, indices)
+      res_shared = ops.gather_nd(tt, indices, share_prefixes=True)
+      res_actual_val, res_shared_val, tt_val = sess.run([res_actual,
+                                                         res_shared,
+                                                         ops.full(tt)])
+      self.assertAllClose(tt_val.flatten()[flat_indices], res_actual_val)
+      self.assertAllClose(tt_val.flatten()[flat_indices], res_shared_val)
+      with self.assertRaises(ValueError):
+        ops.gather_nd(tt, indices[:, :2])
+
+  def testPrefixSharingStats(self):
+    # All the elements of a 3 x 4 x 5 tensor have 3 + 12 + 60 distinct
+    # prefixes.
+    shape = (3, 4, 5)
+    indices = np.array(list(np.ndindex(*shape)))
+    tt = initializers.random_tensor(shape, tt_rank=2)
+    with self.test_session() as sess:
+      num_shared, num_naive = sess.run(ops.prefix_sharing_stats(tt, indices))
+      self.assertEqual(75, num_shared)
+      self.assertEqual(180, num_naive)
+
+  def testFlatInnerTTTensbyDenseTens(self):
+    # Inner product between a TT-tensor and a dense tensor.
+    shape_list = ((2, 2),
+                  (2, 3, 4),
+                  (4, 2, 5, 2))
+    rank_list = (1, 2)
+    np.random.seed(1)
+    with self.test_session() as sess:
+      for shape in shape_list:
+        for rank in rank_list:
+          tt_1 = initializers.random_tensor(shape, tt_rank=rank)
+          dense_2 = tf.constant(np.random.randn(*shape).astype(np.float32))
+          res_actual = ops.flat_inner(tt_1, dense_2)
+          res_actual2 = ops.flat_inner(dense_2, tt_1)
+          res_desired = tf.reduce_sum(ops.full(tt_1) * dense_2)
+          res = sess.run([res_actual, res_actual2, res_desired])
+          res_actual_val, res_actual2_val, res_desired_val = res
+          self.assertAllClose(res_actual_val, res_desired_val, rtol=1e-5)
+          self.assertAllClose(res_actual2_val, res_desired_val, rtol=1e-5)
+
   def testAdd(self):
     # Sum two TT-tensors.
     tt_a = initializers.random_tensor((2, 1, 3, 4), tt_rank=2)
@@ -93,6 +172,43 @@ class TTTensorTest(tf.test.TestCase):
       self.assertAllClose(res_actual_val, res_desired_val)
       self.assertAllClose(res_actual2_val, res_desired_val)
 
+  def testAddN(self):
+    # Sum several TT-tensors.
+    shape = (2, 1, 3, 4)
+    tt_ranks = [2, [1, 2, 4, 3, 1], 1, 3]
+    with self.test_session() as sess:
+      tts = [initializers.random_tensor(shape, tt_rank=r) for r in tt_ranks]
+      tts = [TensorTrain(cores) for cores in sess.run([tt.tt_cores
+                                                       for tt in tts])]
+      res = ops.add_n(tts)
+      self.assertEqual([1, 8, 10, 9, 1], res.get_tt_ranks().as_list())
+      res_rounded = ops.add_n(tts, max_tt_rank=2)
+      res_pairwise = ops.add_n(tts, max_tt_rank=2, pairwise=True)
+      self.assertEqual([1, 2, 2, 2, 1], res_rounded.get_tt_ranks().as_list())
+      self.assertEqual([1, 2, 2, 2, 1], res_pairwise.get_tt_ranks().as_list())
+      res_exact = ops.add_n(tts, max_tt_rank=12, pairwise=True)
+      # Rounding with epsilon only.
+      res_eps = ops.add_n(tts, epsilon=0.1)
+      res_eps_pairwise = ops.add_n(tts, epsilon=0.1, pairwise=True)
+      res_desired = tf.add_n([ops.full(tt) for tt in tts])
+      to_run = [ops.full(res), ops.full(res_exact), ops.full(res_eps),
+                ops.full(res_eps_pairwise), res_desired]
+      res_val, res_exact_val, res_eps_val, res_eps_pairwise_val, \
+          res_desired_val = sess.run(to_run)
+      self.assertAllClose(res_val, res_desired_val)
+      self.assertAllClose(res_exact_val, res_desired_val, atol=1e-5,
+                          rtol=1e-5)
+      desired_norm = np.linalg.norm(res_desired_val)
+      eps_err = np.linalg.norm(res_eps_val - res_desired_val)
+      self.assertLessEqual(eps_err, 0.1 * desired_norm + 1e-5)
+      eps_pairwise_err = np.linalg.norm(res_eps_pairwise_val - res_desired_val)
+      # Each of the two levels of the pairwise tree adds its own error.
+      self.assertLessEqual(eps_pairwise_err, 0.3 * desired_norm + 1e-5)
+      with self.assertRaises(ValueError):
+        ops.add_n([])
+      with self.assertRaises(ValueError):
+        ops.add_n(tts, pairwise=True)
+
   def testMultiply(self):
     # Multiply two TT-tensors.
     tt_a = initializers.random_tensor((1, 2, 3, 4), tt_rank=2)
@@ -106,6 +222,35 @@ class TTTensorTest(tf.test.TestCase):
       self.assertAllClose(res_actual_val, res_desired_val)
       self.assertAllClose(res_actual2_val, res_desired_val)
 
+  def testMultiplyRound(self):
+    # Element-wise product of TT-tensors with rounding.
+    shape = (2, 3, 4, 3, 2)
+    with self.test_session() as sess:
+      tt_a = initializers.random_tensor(shape, tt_rank=3)
+      tt_b = initializers.random_tensor(shape, tt_rank=3)
+      tt_a = TensorTrain(sess.run(tt_a.tt_cores))
+      tt_b = TensorTrain(sess.run(tt_b.tt_cores))
+      res_desired = ops.full(tt_a) * ops.full(tt_b)
+      res_exact = ops.multiply_round(tt_a, tt_b, max_tt_rank=9)
+      res_exact_numpy = ops.multiply_round(tt_a, tt_b, max_tt_rank=9,
+                                           svd_backend='numpy',
+                                           qr_backend='numpy')
+      res_rounded = ops.multiply_round(tt_a, tt_b, max_tt_rank=4)
+      res_optimal = decompositions.round(ops.multiply(tt_a, tt_b), 4)
+      self.assertEqual([1, 2, 4, 4, 2, 1],
+                       res_rounded.get_tt_ranks().as_list())
+      to_run = [res_desired, ops.full(res_exact), ops.full(res_rounded),
+                ops.full(res_optimal), ops.full(res_exact_numpy)]
+      desired_val, exact_val, rounded_val, optimal_val, exact_numpy_val = \
+          sess.run(to_run)
+      exact_err = np.linalg.norm(exact_val - desired_val)
+      self.assertLess(exact_err, 1e-4 * np.linalg.norm(desired_val))
+      exact_numpy_err = np.linalg.norm(exact_numpy_val - desired_val)
+      self.assertLess(exact_numpy_err, 1e-4 * np.linalg.norm(desired_val))
+      rounded_err = np.linalg.norm(rounded_val - desired_val)
+      optimal_err = np.linalg.norm(optimal_val - desired_val)
+      self.assertLess(rounded_err, 1.5 * optimal_err)
+
   def testMultiplyByNumber(self):
     # Multiply a tensor by a number.
     tt = initializers.random_tensor((1, 2, 3), tt_rank=(1, 2, 3, 1))
@@ -139,6 +284,26 @@ class TTTensorTest(tf.test.TestCase):
           self.assertAllClose(norm_actual_val, norm_desired_val, atol=1e-5,
                               rtol=1e-5)
 
+  def testFrobeniusNormOrthogonal(self):
+    # The norm of an orthogonal TT-tensor is the norm of a single TT-core.
+    with self.test_session() as sess:
+      tt = initializers.random_tensor((2, 3, 4, 3), tt_rank=3)
+      tt = TensorTrain(sess.run(tt.tt_cores))
+      rounded = decompositions.round(tt, max_tt_rank=2)
+      orth_tt = decompositions.orthogonalize_tt_cores(tt)
+      graph = tf.get_default_graph()
+      num_qr = len([op for op in graph.get_operations() if op.type == 'Qr'])
+      norms = [ops.frobenius_norm(rounded), ops.frobenius_norm(orth_tt),
+               ops.frobenius_norm(tt)]
+      new_num_qr = len([op for op in graph.get_operations()
+                        if op.type == 'Qr'])
+      self.assertEqual(num_qr, new_num_qr)
+      norms_val, rounded_val, tt_val = sess.run([norms, ops.full(rounded),
+                                                 ops.full(tt)])
+      self.assertAllClose(np.linalg.norm(rounded_val), norms_val[0])
+      self.assertAllClose(np.linalg.norm(tt_val), norms_val[1])
+      self.assertAllClose(np.linalg.norm(tt_val), norms_val[2])
+
   def testCastFloat(self):
     # Test cast function for float tt-tensors.
     tt_x = initializers.random_tensor((2, 3, 2), tt_rank=2)
@@ -248,6 +413,38 @@ class TTMatrixTest(tf.test.TestCase):
       res_actual_val, res_desired_val = sess.run([res_actual, res_desired])
       self.assertAllClose(res_actual_val, res_desired_val, atol=1e-4, rtol=1e-4)
 
+  def testTTMatTimesSparseMat(self):
+    # Multiply a TT-matrix by a sparse matrix.
+    inp_shape = (2, 3, 4)
+    out_shape = (3, 4, 3)
+    np.random.seed(1)
+    mat = np.random.rand(np.prod(inp_shape), 5).astype(np.float32)
+    mat[np.random.rand(*mat.shape) < 0.8] = 0
+    indices = np.array(np.nonzero(mat)).transpose()
+    with self.test_session() as sess:
+      sparse_mat = tf.SparseTensor(indices, mat[np.nonzero(mat)], mat.shape)
+      tt_mat = initializers.random_matrix((out_shape, inp_shape), tt_rank=3)
+      res_actual = ops.matmul(tt_mat, sparse_mat)
+      res_desired = tf.matmul(ops.full(tt_mat), mat)
+      res_actual_val, res_desired_val = sess.run([res_actual, res_desired])
+      self.assertAllClose(res_actual_val, res_desired_val)
+
+  def testSparseMatTimesTTMat(self):
+    # Multiply a sparse matrix by a TT-matrix.
+    inp_shape = (2, 3, 4)
+    out_shape = (3, 4, 3)
+    np.random.seed(1)
+    mat = np.random.rand(5, np.prod(inp_shape)).astype(np.float32)
+    mat[np.random.rand(*mat.shape) < 0.8] = 0
+    indices = np.array(np.nonzero(mat)).transpose()
+    with self.test_session() as sess:
+      sparse_mat = tf.SparseTensor(indices, mat[np.nonzero(mat)], mat.shape)
+      tt_mat = initializers.random_matrix((inp_shape, out_shape), tt_rank=3)
+      res_actual = ops.matmul(sparse_mat, tt_mat)
+      res_desired = tf.matmul(mat, ops.full(tt_mat))
+      res_actual_val, res_desired_val = sess.run([res_actual, res_desired])
+      self.assertAllClose(res_actual_val, res_desired_val)
+
   def testFlatInnerTTMatbyTTMat(self):
     # Inner product between two TT-Matrices.
     shape_list = (((2, 2), (3, 4)),
@@ -290,6 +487,77 @@ class TTMatrixTest(tf.test.TestCase):
             res_desired_val = tt_1_val.flatten()[sparse_flat_indices].dot(values)
             self.assertAllClose(res_actual_val, res_desired_val)
 
+  def testGatherNd(self):
+    # Gather elements of a TT-matrix by linear and by multi-indices.
+    tensor_shape = ((2, 3, 4), (2, 2, 2))
+    matrix_shape = (24, 8)
+    np.random.seed(1)
+    flat_indices = np.random.choice(np.prod(matrix_shape), 10)
+    indices = np.vstack(np.unravel_index(flat_indices, matrix_shape))
+    indices = indices.transpose()
+    row_multi = np.vstack(np.unravel_index(indices[:, 0], tensor_shape[0]))
+    col_multi = np.vstack(np.unravel_index(indices[:, 1], tensor_shape[1]))
+    multi_indices = np.vstack((row_multi, col_multi)).transpose()
+    tt = initializers.random_matrix(tensor_shape, tt_rank=3)
+    with self.test_session() as sess:
+      res_linear = ops.gather_nd(tt, indices)
+      res_multi = ops.gather_nd(tt, multi_indices)
+      res_linear_val, res_multi_val, tt_val = sess.run([res_linear, res_multi,
+                                                        ops.full(tt)])
+      self.assertAllClose(tt_val.flatten()[flat_indices], res_linear_val)
+      self.assertAllClose(tt_val.flatten()[flat_indices], res_multi_val)
+      with self.assertRaises(ValueError):
+        ops.gather_nd(tt, indices[:, :1])
+
+  def testFlatInnerTTMatbyDenseMat(self):
+    # Inner product between a TT-matrix and a dense matrix.
+    shape_list = (((2, 2), (3, 4)),
+                  ((2, 3, 4), (2, 2, 2)))
+    rank_list = (1, 2)
+    np.random.seed(1)
+    with self.test_session() as sess:
+      for tensor_shape in shape_list:
+        for rank in rank_list:
+          tt_1 = initializers.random_matrix(tensor_shape, tt_rank=rank)
+          matrix_shape = np.prod(tensor_shape[0]), np.prod(tensor_shape[1])
+          dense_2 = np.random.randn(*matrix_shape).astype(np.float32)
+          dense_2 = tf.constant(dense_2)
+          res_actual = ops.flat_inner(tt_1, dense_2)
+          res_desired = tf.reduce_sum(ops.full(tt_1) * dense_2)
+          res_actual_val, res_desired_val = sess.run([res_actual, res_desired])
+          self.assertAllClose(res_actual_val, res_desired_val, rtol=1e-5)
+
+  def testMatmulRound(self):
+    # Multiply two TT-matrices with rounding.
+    left_shape = ((2, 3, 4, 2), (3, 2, 2, 3))
+    right_shape = ((3, 2, 2, 3), (2, 2, 3, 2))
+    with self.test_session() as sess:
+      tt_a = initializers.random_matrix(left_shape, tt_rank=4)
+      tt_b = initializers.random_matrix(right_shape, tt_rank=4)
+      tt_a = TensorTrain(sess.run(tt_a.tt_cores))
+      tt_b = TensorTrain(sess.run(tt_b.tt_cores))
+      res_desired = ops.full(ops.tt_tt_matmul(tt_a, tt_b))
+      # The TT-ranks of the product are at most 16, so nothing is truncated.
+      res_exact = ops.matmul_round(tt_a, tt_b, max_tt_rank=16)
+      self.assertEqual([1, 4, 16, 4, 1], res_exact.get_tt_ranks().as_list())
+      res_exact_numpy = ops.matmul_round(tt_a, tt_b, max_tt_rank=16,
+                                         svd_backend='numpy',
+                                         qr_backend='numpy')
+      res_rounded = ops.matmul_round(tt_a, tt_b, max_tt_rank=6)
+      res_optimal = decompositions.round(ops.tt_tt_matmul(tt_a, tt_b), 6)
+      self.assertEqual([1, 4, 6, 4, 1], res_rounded.get_tt_ranks().as_list())
+      to_run = [res_desired, ops.full(res_exact), ops.full(res_rounded),
+                ops.full(res_optimal), ops.full(res_exact_numpy)]
+      desired_val, exact_val, rounded_val, optimal_val, exact_numpy_val = \
+          sess.run(to_run)
+      exact_err = np.linalg.norm(exact_val - desired_val)
+      self.assertLess(exact_err, 1e-4 * np.linalg.norm(desired_val))
+      exact_numpy_err = np.linalg.norm(exact_numpy_val - desired_val)
+      self.assertLess(exact_numpy_err, 1e-4 * np.linalg.norm(desired_val))
+      rounded_err = np.linalg.norm(rounded_val - desired_val)
+      optimal_err = np.linalg.norm(optimal_val - desired_val)
+      self.assertLess(rounded_err, 1.5 * optimal_err)
+
   def testFrobeniusNormMatrix(self):
     # Frobenius norm of a TT-matrix.
     shape_list = (((2, 2), (3, 4)),
@@ -341,6 +609,39 @@ class TTMatrixTest(tf.test.TestCase):
           self.assertAllClose(res_actual_val, np.squeeze(res_desired),
                               atol=1e-5, rtol=1e-5)
 
+  def testQuadraticFormSameVector(self):
+    # Test quadratic form b^t A b.
+    tensor_shape = ((2, 3, 4), (2, 3, 4))
+    A = initializers.random_matrix(tensor_shape, tt_rank=3)
+    b = initializers.random_matrix((tensor_shape[0], None), tt_rank=2)
+    with self.test_session() as sess:
+      res_actual = ops.quadratic_form(A, b, b)
+      vars = [res_actual, ops.full(A), ops.full(b)]
+      res_actual_val, A_val, b_val = sess.run(vars)
+      res_desired = b_val.T.dot(A_val).dot(b_val)
+      self.assertAllClose(res_actual_val, np.squeeze(res_desired),
+                          atol=1e-5, rtol=1e-5)
+
+  def testQuadraticFormDense(self):
+    # Test quadratic form with dense vectors.
+    tensor_shape = ((2, 3, 4), (2, 2, 2))
+    np.random.seed(1)
+    b = np.random.randn(24, 1).astype(np.float32)
+    c = np.random.randn(8, 1).astype(np.float32)
+    A = initializers.random_matrix(tensor_shape, tt_rank=3)
+    tt_b = initializers.random_matrix((tensor_shape[0], None), tt_rank=2)
+    tt_c = initializers.random_matrix((tensor_shape[1], None), tt_rank=2)
+    with self.test_session() as sess:
+      res_actual = [ops.quadratic_form(A, tf.constant(b), tf.constant(c)),
+                    ops.quadratic_form(A, tt_b, tf.constant(c)),
+                    ops.quadratic_form(A, tf.constant(b), tt_c)]
+      vars = [res_actual, ops.full(A), ops.full(tt_b), ops.full(tt_c)]
+      res_actual_val, A_val, tt_b_val, tt_c_val = sess.run(vars)
+      res_desired_val = [b.T.dot(A_val).dot(c), tt_b_val.T.dot(A_val).dot(c),
+                         b.T.dot(A_val).dot(tt_c_val)]
+      for actual, desired in zip(res_actual_val, res_desired_val):
+        self.assertAllClose(actual, np.squeeze(desired), atol=1e-4, rtol=1e-4)
+
   def testCastFloat(self):
     # Test cast function for float tt-matrices and vectors.
     
@@ -470,6 +771,26 @@ class TTTensorBatchTest(tf.test.TestCase):
       # The batch_sizes are different.
       ops.flat_inner(tt_1, tt_2)
 
+  def testFlatInnerTTTensbyDenseTensBatch(self):
+    # Inner product between batches of TT-tensors and dense tensors.
+    shape = (2, 3, 4)
+    np.random.seed(1)
+    tt_1 = initializers.random_tensor_batch(shape, tt_rank=2, batch_size=3)
+    tt_2 = initializers.random_tensor(shape, tt_rank=2)
+    dense = np.random.randn(*shape).astype(np.float32)
+    dense_batch = np.random.randn(3, *shape).astype(np.float32)
+    with self.test_session() as sess:
+      res_actual = [ops.flat_inner(tt_1, tf.constant(dense)),
+                    ops.flat_inner(tt_1, tf.constant(dense_batch)),
+                    ops.flat_inner(tf.constant(dense_batch), tt_2)]
+      res_actual_val, tt_1_val, tt_2_val = sess.run([res_actual, ops.full(tt_1),
+                                                     ops.full(tt_2)])
+      res_desired_val = [np.sum(tt_1_val * dense, axis=(1, 2, 3)),
+                         np.sum(tt_1_val * dense_batch, axis=(1, 2, 3)),
+                         np.sum(tt_2_val * dense_batch, axis=(1, 2, 3))]
+      for actual, desired in zip(res_actual_val, res_desired_val):
+        self.assertAllClose(actual, desired, rtol=1e-5)
+
   def testAddSameBatchSize(self):
     # Sum two TT-tensors with the same batch size.
     tt_a = initializers.random_tensor_batch((2, 1, 4), tt_rank=2, batch_size=3)
@@ -498,6 +819,20 @@ class TTTensorBatchTest(tf.test.TestCase):
       self.assertAllClose(res_actual_val, res_desired_val)
       self.assertAllClose(res_actual2_val, res_desired_val)
 
+  def testAddN(self):
+    # Sum several batches of TT-tensors with broadcasting.
+    tt_a = initializers.random_tensor_batch((2, 1, 4), tt_rank=2, batch_size=1)
+    tt_b = initializers.random_tensor_batch((2, 1, 4), tt_rank=[1, 2, 4, 1],
+                                            batch_size=3)
+    tt_c = initializers.random_tensor((2, 1, 4), tt_rank=3)
+    with self.test_session() as sess:
+      res = ops.add_n([tt_a, tt_b, tt_c])
+      self.assertEqual(3, res.batch_size)
+      res_actual = ops.full(res)
+      res_desired = ops.full(tt_a) + ops.full(tt_b) + ops.full(tt_c)
+      res_actual_val, res_desired_val = sess.run([res_actual, res_desired])
+      self.assertAllClose(res_actual_val, res_desired_val)
+
   def testMultiplyByNumber(self):
     # Multiply batch of tensors by a number.
     tt = initializers.random_tensor_batch((1, 2, 3), tt_rank=(1, 2, 3, 1),
@@ -526,6 +861,30 @@ class TTTensorBatchTest(tf.test.TestCase):
       self.assertAllClose(norm_actual_val, norm_desired_val, atol=1e-5,
                           rtol=1e-5)
 
+  def testFullRightToLeft(self):
+    # Full of a batch with TT-ranks growing to the right.
+    tt = initializers.random_tensor_batch((3, 3, 3), tt_rank=(1, 1, 9, 1),
+                                          batch_size=2)
+    self.assertEqual('right_to_left', ops.full_contraction_plan(tt)['order'])
+    with self.test_session() as sess:
+      res_actual = ops.full(tt)
+      res_desired = tf.stack([ops.full(tt[0]), ops.full(tt[1])])
+      res_actual_val, res_desired_val = sess.run([res_actual, res_desired])
+      self.assertAllClose(res_desired_val, res_actual_val)
+
+  def testGatherNd(self):
+    # Gather elements of a batch of TT-tensors.
+    shape = (2, 3, 4)
+    np.random.seed(1)
+    flat_indices = np.random.choice(np.prod(shape), 10)
+    indices = np.vstack(np.unravel_index(flat_indices, shape)).transpose()
+    tt = initializers.random_tensor_batch(shape, tt_rank=3, batch_size=2)
+    with self.test_session() as sess:
+      res_actual = ops.gather_nd(tt, indices)
+      res_actual_val, tt_val = sess.run([res_actual, ops.full(tt)])
+      res_desired_val = tt_val.reshape(2, -1)[:, flat_indices]
+      self.assertAllClose(res_desired_val, res_actual_val)
+
 
 class TTMatrixTestBatch(tf.test.TestCase):
 
@@ -604,6 +963,130 @@ class TTMatrixTestBatch(tf.test.TestCase):
       self.assertAllClose(res_actual_val, res_desired_val)
       self.assertAllClose(res_actual2_val, res_desired_val)
 
+  def testGatherNd(self):
+    # Gather elements of a batch of TT-matrices.
+    tensor_shape = ((2, 3), (2, 2))
+    matrix_shape = (6, 4)
+    np.random.seed(1)
+    flat_indices = np.random.choice(np.prod(matrix_shape), 10)
+    indices = np.vstack(np.unravel_index(flat_indices, matrix_shape))
+    indices = indices.transpose()
+    tt = initializers.random_matrix_batch(tensor_shape, tt_rank=2,
+                                          batch_size=3)
+    with self.test_session() as sess:
+      res_actual = ops.gather_nd(tt, indices)
+      res_shared = ops.gather_nd(tt, indices, share_prefixes=True)
+      res_actual_val, res_shared_val, tt_val = sess.run([res_actual,
+                                                         res_shared,
+                                                         ops.full(tt)])
+      res_desired_val = tt_val.reshape(3, -1)[:, flat_indices]
+      self.assertAllClose(res_desired_val, res_actual_val)
+      self.assertAllClose(res_desired_val, res_shared_val)
+
+  def testTTMatTimesSparseMat(self):
+    # Multiply a batch of TT-matrices by a sparse matrix.
+    inp_shape = (2, 3)
+    out_shape = (3, 2)
+    np.random.seed(1)
+    mat = np.random.rand(np.prod(inp_shape), 4).astype(np.float32)
+    mat[np.random.rand(*mat.shape) < 0.6] = 0
+    indices = np.array(np.nonzero(mat)).transpose()
+    with self.test_session() as sess:
+      sparse_mat = tf.SparseTensor(indices, mat[np.nonzero(mat)], mat.shape)
+      tt_mat = initializers.random_matrix_batch((out_shape, inp_shape),
+                                                tt_rank=2, batch_size=3)
+      res_actual = ops.matmul(tt_mat, sparse_mat)
+      res_desired = tf.einsum('oij,jk->oik', ops.full(tt_mat), mat)
+      res_actual_val, res_desired_val = sess.run([res_actual, res_desired])
+      self.assertAllClose(res_actual_val, res_desired_val)
+
+  def testSparseMatTimesTTMat(self):
+    # Multiply a sparse matrix by a batch of TT-matrices.
+    inp_shape = (2, 3)
+    out_shape = (3, 2)
+    np.random.seed(1)
+    mat = np.random.rand(4, np.prod(inp_shape)).astype(np.float32)
+    mat[np.random.rand(*mat.shape) < 0.6] = 0
+    indices = np.array(np.nonzero(mat)).transpose()
+    with self.test_session() as sess:
+      sparse_mat = tf.SparseTensor(indices, mat[np.nonzero(mat)], mat.shape)
+      tt_mat = initializers.random_matrix_batch((inp_shape, out_shape),
+                                                tt_rank=2, batch_size=3)
+      res_actual = ops.matmul(sparse_mat, tt_mat)
+      res_desired = tf.einsum('ij,ojk->oik', mat, ops.full(tt_mat))
+      res_actual_val, res_desired_val = sess.run([res_actual, res_desired])
+      self.assertAllClose(res_actual_val, res_desired_val)
+
+  def testFlatInnerTTMatbyDenseMat(self):
+    # Inner product between a batch of TT-matrices and a dense matrix.
+    tensor_shape = ((2, 3), (2, 2))
+    np.random.seed(1)
+    tt_1 = initializers.random_matrix_batch(tensor_shape, tt_rank=2,
+                                            batch_size=3)
+    dense = np.random.randn(6, 4).astype(np.float32)
+    with self.test_session() as sess:
+      res_actual = ops.flat_inner(tt_1, tf.constant(dense))
+      res_actual_val, tt_1_val = sess.run([res_actual, ops.full(tt_1)])
+      res_desired_val = np.sum(tt_1_val * dense, axis=(1, 2))
+      self.assertAllClose(res_actual_val, res_desired_val, rtol=1e-5)
+
+  def testQuadraticForm(self):
+    # Test quadratic form with batches and broadcasting.
+    tensor_shape = ((2, 3), (2, 2))
+    A = initializers.random_matrix_batch(tensor_shape, tt_rank=2,
+                                         batch_size=3)
+    A_single = initializers.random_matrix(tensor_shape, tt_rank=2)
+    b = initializers.random_matrix_batch((tensor_shape[0], None), tt_rank=2,
+                                         batch_size=3)
+    c = initializers.random_matrix((tensor_shape[1], None), tt_rank=2)
+    with self.test_session() as sess:
+      res_actual = [ops.quadratic_form(A, b, c),
+                    ops.quadratic_form(A_single, b, c)]
+      vars = [res_actual, ops.full(A), ops.full(A_single), ops.full(b),
+              ops.full(c)]
+      res_actual_val, A_val, A_single_val, b_val, c_val = sess.run(vars)
+      res_desired_val = [np.einsum('oi,oij,j->o', b_val[:, :, 0], A_val,
+                                   c_val[:, 0]),
+                         np.einsum('oi,ij,j->o', b_val[:, :, 0], A_single_val,
+                                   c_val[:, 0])]
+      for actual, desired in zip(res_actual_val, res_desired_val):
+        self.assertAllClose(actual, desired, atol=1e-5, rtol=1e-5)
+
+  def testQuadraticFormBatchSizeOne(self):
+    # The batch dimension is kept for batches of size 1.
+    tensor_shape = ((2, 3), (2, 2))
+    A = initializers.random_matrix_batch(tensor_shape, tt_rank=2,
+                                         batch_size=1)
+    b = initializers.random_matrix((tensor_shape[0], None), tt_rank=2)
+    c = initializers.random_matrix((tensor_shape[1], None), tt_rank=2)
+    with self.test_session() as sess:
+      res_actual = ops.quadratic_form(A, b, c)
+      self.assertEqual([1], res_actual.get_shape().as_list())
+      res_actual_val, A_val, b_val, c_val = sess.run(
+          [res_actual, ops.full(A), ops.full(b), ops.full(c)])
+      res_desired_val = np.einsum('i,oij,j->o', b_val[:, 0], A_val,
+                                  c_val[:, 0])
+      self.assertAllClose(res_actual_val, res_desired_val, atol=1e-5,
+                          rtol=1e-5)
+
+  def testMatmulRound(self):
+    # Multiply a batch of TT-matrices by a TT-matrix with rounding.
+    left_shape = ((2, 3), (3, 2))
+    right_shape = ((3, 2), (2, 2))
+    with self.test_session() as sess:
+      tt_a = initializers.random_matrix_batch(left_shape, tt_rank=2,
+                                              batch_size=3)
+      tt_b = initializers.random_matrix(right_shape, tt_rank=2)
+      tt_a = TensorTrainBatch(sess.run(tt_a.tt_cores))
+      tt_b = TensorTrain(sess.run(tt_b.tt_cores))
+      res_actual = ops.matmul_round(tt_a, tt_b, max_tt_rank=4)
+      self.assertTrue(isinstance(res_actual, TensorTrainBatch))
+      res_desired = ops.tt_tt_matmul(tt_a, tt_b)
+      res_actual_val, res_desired_val = sess.run([ops.full(res_actual),
+                                                  ops.full(res_desired)])
+      self.assertAllClose(res_actual_val, res_desired_val, atol=1e-5,
+                          rtol=1e-5)
+
   def testTranspose(self):
     # Transpose a batch of TT-matrices.
     with self.test_session() as sess:
@@ -642,6 +1125,34 @@ class TTMatrixTestBatch(tf.test.TestCase):
       self.assertAllClose(res_actual_val, res_desired_val)
       self.assertAllClose(res_actual2_val, res_desired_val)
 
+  def testAddN(self):
+    # Sum several batches of TT-matrices.
+    shape = ((2, 1, 4), (2, 2, 2))
+    tts = [initializers.random_matrix_batch(shape, tt_rank=r, batch_size=2)
+           for r in (1, 2, 3)]
+    with self.test_session() as sess:
+      res_actual = ops.full(ops.add_n(tts))
+      res_desired = tf.add_n([ops.full(tt) for tt in tts])
+      res_actual_val, res_desired_val = sess.run([res_actual, res_desired])
+      self.assertAllClose(res_actual_val, res_desired_val)
+
+  def testMultiplyRound(self):
+    # Element-wise product of a batch of TT-matrices and a TT-matrix with
+    # rounding.
+    shape = ((2, 3), (3, 2))
+    with self.test_session() as sess:
+      tt_a = initializers.random_matrix_batch(shape, tt_rank=2, batch_size=3)
+      tt_b = initializers.random_matrix(shape, tt_rank=2)
+      tt_a = TensorTrainBatch(sess.run(tt_a.tt_cores))
+      tt_b = TensorTrain(sess.run(tt_b.tt_cores))
+      res_actual = ops.multiply_round(tt_a, tt_b, max_tt_rank=4)
+      self.assertTrue(isinstance(res_actual, TensorTrainBatch))
+      res_desired = ops.full(tt_a) * ops.full(tt_b)
+      res_actual_val, res_desired_val = sess.run([ops.full(res_actual),
+                                                  res_desired])
+      self.assertAllClose(res_actual_val, res_desired_val, atol=1e-5,
+                          rtol=1e-5)
+
   def testCastFloat(self):
     # Test cast function for float tt-matrices and vectors.
     tt_mat = initializers.random_matrix_batch(((2, 3), (3, 2)), tt_rank=2,
@@ -0,0 +1,419 @@
+import tensorflow as tf
+
+from t3f.tensor_train import TensorTrain
+from t3f import riemannian
+from t3f import variables
+
+
+class RiemannianOptimizer(tf.train.Optimizer):
+  """Base class for the optimizers on the manifold of TT-objects of fixed rank.
+
+  The TT-variables (see `t3f.get_variable`) are updated along the manifold of
+  TT-objects with their TT-ranks: the Riemannian gradient is an element of the
+  tangent space at the current value (a `TangentVector`), the state (e.g.
+  momentum) is stored as tangent vectors, which are moved to the tangent space
+  at the new value by a vector transport, and each step makes a single
+  retraction (see `t3f.retract`) and assigns the TT-cores in place.
+
+  Unlike `tf.train.Optimizer`, `compute_gradients` and `minimize` take a
+  callable loss(*var_list) instead of a loss tensor: the gradients of a loss
+  tensor with respect to the TT-cores of the variables do not give the
+  Riemannian gradient, which is computed by differentiating the loss at the
+  parametrization of the tangent space, see
+    Novikov et al., Automatic differentiation for Riemannian optimization on
+    low-rank matrix and tensor-train manifolds, 2021.
+  The other arguments and the slots (`get_slot`, `get_slot_names`) are the
+  same as in `tf.train.Optimizer`, the slots of the tangent vectors are
+  created for each TT-core of a variable and the scalar slots for its first
+  TT-core.
+
+  The TT-ranks of the variables should be kept by the retraction, i.e.
+  r_k <= n_k r_{k-1} and r_{k-1} <= n_k r_k for all the TT-cores (for
+  TT-matrices n_k is the product of the mode sizes).
+
+  Example:
+    >>> w = t3f.get_variable('w', initializer=t3f.random_tensor(shape, 5))
+    >>> def loss(w):
+    ...   return 0.5 * t3f.frobenius_norm_squared(w - target)
+    >>> opt = t3f.optimizers.RiemannianMomentum(learning_rate=0.1)
+    >>> train_step = opt.minimize(loss, var_list=[w])
+
+  Subclasses implement `_apply_tangent`.
+  """
+
+  def __init__(self, learning_rate, use_locking=False, name='Riemannian'):
+    """Creates the optimizer.
+
+    Args:
+      learning_rate: A Tensor or a floating point value, the step size.
+      use_locking: If True use locks for the update operations.
+      name: The name of the optimizer, used for the state variables.
+    """
+    super(RiemannianOptimizer, self).__init__(use_locking, name)
+    self._learning_rate = learning_rate
+
+  def compute_gradients(self, loss, var_list=None,
+                        gate_gradients=tf.train.Optimizer.GATE_OP,
+                        aggregation_method=None,
+                        colocate_gradients_with_ops=False, grad_loss=None):
+    """Computes the Riemannian gradients of the loss.
+
+    Args:
+      loss: a callable loss(*var_list) that returns a scalar tf.Tensor for
+        TT-objects of the shapes and TT-ranks of the variables. Unlike in
+        `tf.train.Optimizer`, a loss tensor is not supported.
+      var_list: list of TensorTrain variables, defaults to all the
+        TensorTrain variables created by `t3f.get_variable`.
+      gate_gradients: How to gate the computation of gradients, see
+        `tf.train.Optimizer`.
+      aggregation_method: Specifies the method used to combine gradient
+        terms, see `tf.gradients`.
+      colocate_gradients_with_ops: If True, try colocating gradients with the
+        corresponding op.
+      grad_loss: Optional, a tf.Tensor holding the gradient computed for the
+        loss.
+
+    Returns:
+      A list of (TangentVector, TensorTrain variable) pairs, the Riemannian
+      gradients are from the tangent spaces at the current values.
+
+    Raises:
+      ValueError if loss is not callable, if var_list is empty or contains not
+        TensorTrain variables, or if the TT-ranks of a variable can not be
+        kept by the retraction.
+    """
+    if not callable(loss):
+      raise ValueError('The loss should be a callable loss(*var_list), got '
+                       '%s.' % loss)
+    if var_list is None:
+      var_list = tf.get_collection('TensorTrainVariables')
+    var_list = list(var_list)
+    if not var_list:
+      raise ValueError('No TensorTrain variables to optimize.')
+    for var in var_list:
+      if not isinstance(var, TensorTrain) or not var.is_variable():
+        raise ValueError('Expected TensorTrain variables, got %s.' % var)
+      _check_tt_ranks(var)
+    spaces = [riemannian.TangentSpace(var) for var in var_list]
+    # x = sum_k U_1 ... U_{k-1} delta_k V_{k+1} ... V_d with delta_k = 0 for
+    # k < d and delta_d = the last TT-core of the left-orthogonal x. The
+    # right-orthogonal cores V are computed from the same TT-core, so delta_d
+    # is a copy of it: the gradient should not flow into the QR decompositions.
+    deltas = []
+    for space in spaces:
+      curr_deltas = _zero_deltas(space)
+      curr_deltas[-1] = tf.identity(space.left.tt_cores[-1])
+      deltas.append(curr_deltas)
+    points = [riemannian.TangentVector(curr_deltas, space).to_tt()
+              for curr_deltas, space in zip(deltas, spaces)]
+    loss_value = loss(*points)
+    flat_deltas = [delta for curr_deltas in deltas for delta in curr_deltas]
+    flat_grads = tf.gradients(
+        loss_value, flat_deltas, grad_ys=grad_loss,
+        gate_gradients=(gate_gradients == tf.train.Optimizer.GATE_OP),
+        aggregation_method=aggregation_method,
+        colocate_gradients_with_ops=colocate_gradients_with_ops)
+    flat_grads = [grad if grad is not None else tf.zeros_like(delta)
+                  for grad, delta in zip(flat_grads, flat_deltas)]
+    if gate_gradients == tf.train.Optimizer.GATE_GRAPH:
+      flat_grads = tf.tuple(flat_grads)
+    grads_and_vars = []
+    for var, space, curr_deltas in zip(var_list, spaces, deltas):
+      curr_grads = flat_grads[:len(curr_deltas)]
+      flat_grads = flat_grads[len(curr_deltas):]
+      grads_and_vars.append((_gauge_projection(curr_grads, space), var))
+    return grads_and_vars
+
+  def apply_gradients(self, grads_and_vars, global_step=None, name=None):
+    """Makes a step along the Riemannian gradients.
+
+    Args:
+      grads_and_vars: list of (TangentVector, TensorTrain variable) pairs, as
+        returned by `compute_gradients`.
+      global_step: Optional variable to increment by one after the update.
+      name: Optional name for the returned operation.
+
+    Returns:
+      An operation that updates the variables and the optimizer state.
+
+    Raises:
+      ValueError if the TT-ranks of a variable are not known on the
+        compilation stage or can not be kept by the retraction.
+    """
+    grads_and_vars = list(grads_and_vars)
+    with tf.name_scope(name, self.get_name()):
+      new_values = []
+      for grad, var in grads_and_vars:
+        _check_tt_ranks(var)
+        slots = self._get_tt_slots(var)
+        new_var, new_slots = self._apply_tangent(grad, var, slots)
+        new_values.append((var, new_var, slots, new_slots))
+
+      # All the new values are computed from the old ones before assigning.
+      all_new_tensors = []
+      for _, new_var, slots, new_slots in new_values:
+        all_new_tensors += list(new_var.tt_cores)
+        for slot_name in new_slots:
+          all_new_tensors += _as_list(new_slots[slot_name])
+      update_ops = []
+      with tf.control_dependencies(all_new_tensors):
+        for var, new_var, slots, new_slots in new_values:
+          assigned = variables.assign(var, new_var,
+                                      use_locking=self._use_locking)
+          update_ops += [core.op for core in assigned.tt_cores]
+          for slot_name in new_slots:
+            for slot, value in zip(_as_list(slots[slot_name]),
+                                   _as_list(new_slots[slot_name])):
+              update_ops.append(tf.assign(slot, value,
+                                          use_locking=self._use_locking))
+      if global_step is None:
+        return tf.group(*update_ops)
+      with tf.control_dependencies(update_ops):
+        return tf.assign_add(global_step, 1).op
+
+  def minimize(self, loss, global_step=None, var_list=None,
+               gate_gradients=tf.train.Optimizer.GATE_OP,
+               aggregation_method=None, colocate_gradients_with_ops=False,
+               name=None, grad_loss=None):
+    """Adds operations to minimize the loss by updating var_list.
+
+    Args:
+      loss: a callable loss(*var_list), see `compute_gradients`.
+      global_step: Optional variable to increment by one after the update.
+      var_list: list of TensorTrain variables, see `compute_gradients`.
+      gate_gradients: see `compute_gradients`.
+      aggregation_method: see `compute_gradients`.
+      colocate_gradients_with_ops: see `compute_gradients`.
+      name: Optional name for the returned operation.
+      grad_loss: see `compute_gradients`.
+
+    Returns:
+      An operation that updates the variables.
+    """
+    grads_and_vars = self.compute_gradients(
+        loss, var_list, gate_gradients=gate_gradients,
+        aggregation_method=aggregation_method,
+        colocate_gradients_with_ops=colocate_gradients_with_ops,
+        grad_loss=grad_loss)
+    return self.apply_gradients(grads_and_vars, global_step, name)
+
+  def _slot_names(self):
+    """Returns a dict slot name -> True for tangent vectors, False for scalars.
+    """
+    return {}
+
+  def _get_tt_slots(self, var):
+    """Returns (creating if needed) the state variables of a TT-variable.
+
+    The delta cores of the tangent vectors are the slots of the TT-cores of
+    var (they have the same shapes) and the scalars are the slots of its
+    first TT-core, so that `get_slot` and `get_slot_names` work.
+    """
+    slots = {}
+    dtype = var.dtype.base_dtype
+    for slot_name, is_tangent in sorted(self._slot_names().items()):
+      if is_tangent:
+        slots[slot_name] = [self._zeros_slot(core, slot_name, self._name)
+                            for core in var.tt_cores]
+      else:
+        slots[slot_name] = self._get_or_make_slot(
+            var.tt_cores[0], tf.zeros((), dtype=dtype), slot_name, self._name)
+    return slots
+
+  def _apply_tangent(self, grad, var, slots):
+    """Computes the new value of a variable and of its state.
+
+    Args:
+      grad: TangentVector, the Riemannian gradient at var.
+      var: TensorTrain variable.
+      slots: dict of the state variables, tangent vectors are lists of
+        tf.Variables with the delta cores in the tangent space at var.
+
+    Returns:
+      A tuple (new_var, new_slots), the TensorTrain with the new value of var
+      and a dict with the new values of (some of) the slots, the tangent
+      vectors are lists of delta cores in the tangent space at new_var.
+    """
+    raise NotImplementedError()
+
+  def _retract(self, var, direction):
+    """Moves var along the tangent vector keeping its TT-ranks."""
+    return riemannian.retract(var, direction, var.get_tt_ranks().as_list())
+
+  def _transport(self, tangent, new_var):
+    """Moves a tangent vector into the tangent space at new_var."""
+    new_space = riemannian.TangentSpace(new_var)
+    return new_space.transport(tangent, compact=True).deltas
+
+
+class RiemannianGradientDescent(RiemannianOptimizer):
+  """Riemannian gradient descent, x <- R_x(-learning_rate * grad)."""
+
+  def __init__(self, learning_rate, use_locking=False,
+               name='RiemannianGradientDescent'):
+    super(RiemannianGradientDescent, self).__init__(learning_rate, use_locking,
+                                                    name)
+
+  def _apply_tangent(self, grad, var, slots):
+    return self._retract(var, grad * (-self._learning_rate)), {}
+
+
+class RiemannianMomentum(RiemannianOptimizer):
+  """Riemannian gradient descent with momentum.
+
+    m <- momentum * T(m) + grad
+    x <- R_x(-learning_rate * m),
+  where T is the vector transport to the current tangent space.
+  """
+
+  def __init__(self, learning_rate, momentum=0.9, use_locking=False,
+               name='RiemannianMomentum'):
+    super(RiemannianMomentum, self).__init__(learning_rate, use_locking, name)
+    self._momentum = momentum
+
+  def _slot_names(self):
+    return {'momentum': True}
+
+  def _apply_tangent(self, grad, var, slots):
+    prev = riemannian.TangentVector(slots['momentum'], grad.space)
+    momentum = prev * self._momentum + grad
+    new_var = self._retract(var, momentum * (-self._learning_rate))
+    return new_var, {'momentum': self._transport(momentum, new_var)}
+
+
+class RiemannianAdam(RiemannianOptimizer):
+  """Adam-style Riemannian optimizer.
+
+  The first moment is a transported tangent vector and the second moment is
+  the (scalar) squared norm of the Riemannian gradient, see
+    Becigneul and Ganea, Riemannian adaptive optimization methods, 2019.
+
+    m <- beta1 * T(m) + (1 - beta1) * grad
+    v <- beta2 * v + (1 - beta2) * ||grad||^2
+    x <- R_x(-learning_rate * m_hat / (sqrt(v_hat) + epsilon)),
+  where m_hat and v_hat are the bias-corrected moments.
+  """
+
+  def __init__(self, learning_rate=0.001, beta1=0.9, beta2=0.999,
+               epsilon=1e-8, use_locking=False, name='RiemannianAdam'):
+    super(RiemannianAdam, self).__init__(learning_rate, use_locking, name)
+    self._beta1 = beta1
+    self._beta2 = beta2
+    self._epsilon = epsilon
+
+  def _slot_names(self):
+    return {'m': True, 'v': False, 'step': False}
+
+  def _apply_tangent(self, grad, var, slots):
+    space = grad.space
+    prev_m = riemannian.TangentVector(slots['m'], space)
+    m = prev_m * self._beta1 + grad * (1 - self._beta1)
+    v = self._beta2 * slots['v'] + (1 - self._beta2) * space.inner(grad, grad)
+    step = slots['step'] + 1
+    m_hat_coef = 1.0 / (1 - tf.pow(tf.cast(self._beta1, step.dtype), step))
+    v_hat = v / (1 - tf.pow(tf.cast(self._beta2, step.dtype), step))
+    coef = -self._learning_rate * m_hat_coef / (tf.sqrt(v_hat) + self._epsilon)
+    new_var = self._retract(var, m * coef)
+    return new_var, {'m': self._transport(m, new_var), 'v': v, 'step': step}
+
+
+class RiemannianConjugateGradient(RiemannianOptimizer):
+  """Riemannian nonlinear conjugate gradients (Fletcher-Reeves) with a fixed
+  step size.
+
+    beta <- ||grad||^2 / ||prev_grad||^2
+    d <- -grad + beta * T(d), or -grad if it is not a descent direction
+    x <- R_x(learning_rate * d)
+  """
+
+  def __init__(self, learning_rate, use_locking=False,
+               name='RiemannianConjugateGradient'):
+    super(RiemannianConjugateGradient, self).__init__(learning_rate,
+                                                      use_locking, name)
+
+  def _slot_names(self):
+    return {'direction': True, 'grad_norm_sq': False}
+
+  def _apply_tangent(self, grad, var, slots):
+    space = grad.space
+    grad_norm_sq = space.inner(grad, grad)
+    prev_norm_sq = slots['grad_norm_sq']
+    # beta = 0 on the first step.
+    safe_prev_norm_sq = tf.where(prev_norm_sq > 0, prev_norm_sq,
+                                 tf.ones_like(prev_norm_sq))
+    beta = tf.where(prev_norm_sq > 0, grad_norm_sq / safe_prev_norm_sq,
+                    tf.zeros_like(prev_norm_sq))
+    prev_direction = riemannian.TangentVector(slots['direction'], space)
+    direction = prev_direction * beta - grad
+    # Restart with the antigradient if direction is not a descent direction.
+    is_descent = space.inner(grad, direction) < 0
+    beta = tf.where(is_descent, beta, tf.zeros_like(beta))
+    direction = prev_direction * beta - grad
+    new_var = self._retract(var, direction * self._learning_rate)
+    new_slots = {'direction': self._transport(direction, new_var),
+                 'grad_norm_sq': grad_norm_sq}
+    return new_var, new_slots
+
+
+def _check_tt_ranks(var):
+  """Checks that the retraction can keep the TT-ranks of the variable.
+
+  Raises:
+    ValueError if the TT-ranks are not known on the compilation stage or if
+      r_k > n_k r_{k-1} or r_{k-1} > n_k r_k for some TT-core.
+  """
+  if not var.get_tt_ranks().is_fully_defined():
+    raise ValueError('The TT-ranks of the variable should be known on the '
+                     'compilation stage, got %s.' % var)
+  ranks = var.get_tt_ranks().as_list()
+  modes = [1] * var.ndims()
+  for raw_shape in var.get_raw_shape():
+    modes = [mode * n for mode, n in zip(modes, raw_shape.as_list())]
+  # The maximal TT-ranks that the TT-cores of the shape can have.
+  max_ranks = list(ranks)
+  for core_idx in range(var.ndims()):
+    max_ranks[core_idx + 1] = min(max_ranks[core_idx + 1],
+                                  max_ranks[core_idx] * modes[core_idx])
+  for core_idx in range(var.ndims() - 1, -1, -1):
+    max_ranks[core_idx] = min(max_ranks[core_idx],
+                              max_ranks[core_idx + 1] * modes[core_idx])
+  if max_ranks != ranks:
+    raise ValueError('The retraction can not keep the TT-ranks %s of the '
+                     'variable %s, the TT-ranks should be at most %s (e.g. '
+                     'use t3f.round to initialize the variable).' %
+                     (ranks, var, max_ranks))
+
+
+def _zero_deltas(space):
+  """Returns zero delta cores of a tangent vector in the tangent space."""
+  zeros = []
+  for left_core, right_core in zip(space.left.tt_cores, space.right.tt_cores):
+    shape = left_core.get_shape()[:-1].concatenate(right_core.get_shape()[-1:])
+    zeros.append(tf.zeros(shape, dtype=left_core.dtype))
+  return zeros
+
+
+def _gauge_projection(deltas, space):
+  """Makes the delta cores orthogonal to the left-orthogonal TT-cores.
+
+  The gradient with respect to the delta cores is the projection on the tangent
+  space up to the gauge conditions U_k^T delta_k = 0 for k < d.
+
+  Returns:
+    TangentVector.
+  """
+  mode_str = 'ij' if space.point.is_tt_matrix() else 'i'
+  res = []
+  for core_idx, delta in enumerate(deltas):
+    if core_idx < len(deltas) - 1:
+      left_core = space.left.tt_cores[core_idx]
+      einsum_str = 'a{0}c,a{0}b->cb'.format(mode_str)
+      coef = tf.einsum(einsum_str, left_core, delta)
+      einsum_str = 'a{0}c,cb->a{0}b'.format(mode_str)
+      delta -= tf.einsum(einsum_str, left_core, coef)
+    res.append(delta)
+  return riemannian.TangentVector(res, space)
+
+
+def _as_list(value):
+  return value if isinstance(value, list) else [value]
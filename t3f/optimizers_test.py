@@ -0,0 +1,118 @@
+import numpy as np
+import tensorflow as tf
+
+from t3f.tensor_train import TensorTrain
+from t3f import ops
+from t3f import initializers
+from t3f import optimizers
+from t3f import riemannian
+from t3f import variables
+
+
+class OptimizersTest(tf.test.TestCase):
+
+  def testRiemannianGradient(self):
+    # The Riemannian gradient of 0.5 ||x - target||^2 is P_x(x - target).
+    shape = (2, 3, 4, 3)
+    x = variables.get_variable('x', initializer=initializers.random_tensor(
+        shape, tt_rank=3))
+    target = initializers.random_tensor(shape, tt_rank=2)
+    with self.test_session() as sess:
+      target = TensorTrain(sess.run(target.tt_cores))
+
+      def loss(x):
+        return 0.5 * ops.frobenius_norm_squared(ops.add(x, -1.0 * target),
+                                                differentiable=True)
+
+      opt = optimizers.RiemannianGradientDescent(learning_rate=1.0)
+      grad, var = opt.compute_gradients(loss, [x])[0]
+      self.assertIs(x, var)
+      self.assertIs(x, grad.projection_on)
+      desired = riemannian.project(ops.add(x, -1.0 * target), x)
+      tf.global_variables_initializer().run()
+      actual_val, desired_val = sess.run((ops.full(grad.to_tt()),
+                                          ops.full(desired)))
+      self.assertAllClose(desired_val, actual_val, atol=1e-4, rtol=1e-4)
+
+  def testOptimizers(self):
+    # Approximate a TT-tensor of the same TT-rank.
+    shape = (2, 3, 4, 3)
+    target = initializers.random_tensor(shape, tt_rank=2)
+    optimizers_list = [
+        optimizers.RiemannianGradientDescent(learning_rate=0.5),
+        optimizers.RiemannianMomentum(learning_rate=0.3, momentum=0.5),
+        # The steps of Adam are of length about learning_rate.
+        optimizers.RiemannianAdam(learning_rate=1.0),
+        optimizers.RiemannianConjugateGradient(learning_rate=0.5)]
+    with self.test_session() as sess:
+      target = TensorTrain(sess.run(target.tt_cores))
+      target_norm = np.linalg.norm(sess.run(ops.full(target)))
+
+      def loss(x):
+        return 0.5 * ops.frobenius_norm_squared(ops.add(x, -1.0 * target),
+                                                differentiable=True)
+
+      for opt_idx, opt in enumerate(optimizers_list):
+        init = initializers.random_tensor(shape, tt_rank=2)
+        x = variables.get_variable('x_%d' % opt_idx, initializer=init)
+        global_step = tf.Variable(0, trainable=False)
+        step = opt.minimize(loss, global_step=global_step, var_list=[x])
+        error = ops.frobenius_norm(ops.add(x, -1.0 * target)) / target_norm
+        tf.global_variables_initializer().run()
+        init_error = sess.run(error)
+        for _ in range(30):
+          sess.run(step)
+        self.assertEqual(30, sess.run(global_step))
+        self.assertEqual([1, 2, 2, 2, 1], x.get_tt_ranks().as_list())
+        self.assertLess(sess.run(error), 0.3 * init_error)
+
+  def testSlots(self):
+    init = initializers.random_tensor((2, 3, 4), tt_rank=2)
+    x = variables.get_variable('x_slots', initializer=init)
+
+    def loss(x):
+      return ops.frobenius_norm_squared(x, differentiable=True)
+
+    opt = optimizers.RiemannianAdam()
+    opt.minimize(loss, var_list=[x])
+    self.assertEqual(['m', 'step', 'v'], opt.get_slot_names())
+    for core in x.tt_cores:
+      self.assertEqual(core.get_shape(),
+                       opt.get_slot(core, 'm').get_shape())
+    self.assertEqual([], opt.get_slot(x.tt_cores[0], 'v').get_shape().as_list())
+
+  def testNoGradientThroughQr(self):
+    # The tangent space is fixed, the gradient is taken w.r.t. the deltas only.
+    init = initializers.random_tensor((2, 3, 4), tt_rank=2)
+    x = variables.get_variable('x_no_qr_grad', initializer=init)
+
+    def loss(x):
+      return ops.frobenius_norm_squared(x, differentiable=True)
+
+    opt = optimizers.RiemannianGradientDescent(learning_rate=0.1)
+    opt.compute_gradients(loss, [x])
+    op_names = [op.name for op in tf.get_default_graph().get_operations()]
+    self.assertEqual([], [name for name in op_names if 'Qr_grad' in name])
+
+  def testTooLargeTTRank(self):
+    # The first TT-core is 1 x 2 x 5, the retraction can not keep TT-rank 5.
+    init = initializers.random_tensor((2, 3, 4, 3), tt_rank=5)
+    x = variables.get_variable('x_large', initializer=init)
+
+    def loss(x):
+      return ops.frobenius_norm_squared(x, differentiable=True)
+
+    opt = optimizers.RiemannianGradientDescent(learning_rate=0.1)
+    with self.assertRaises(ValueError):
+      opt.minimize(loss, var_list=[x])
+
+  def testLossTensor(self):
+    init = initializers.random_tensor((2, 3, 4), tt_rank=2)
+    x = variables.get_variable('x_tensor_loss', initializer=init)
+    opt = optimizers.RiemannianGradientDescent(learning_rate=0.1)
+    with self.assertRaises(ValueError):
+      opt.compute_gradients(ops.frobenius_norm_squared(x), [x])
+
+
+if __name__ == "__main__":
+  tf.test.main()
@@ -1,9 +1,12 @@
 import tensorflow as tf
 
+from t3f.tensor_train_base import TensorTrainBase
 from t3f.tensor_train import TensorTrain
 from t3f.tensor_train_batch import TensorTrainBatch
 from t3f import shapes
 from t3f import decompositions
+from t3f import linalg
+from t3f import utils
 
 
 def project_sum(what, where, weights=None):
@@ -20,22 +23,51 @@ def project_sum(what, where, weights=None):
 
   Args:
     what: TensorTrain or TensorTrainBatch. In the case of batch returns
-      projection of the sum of elements in the batch.
-    where: TensorTrain, TT-tensor or TT-matrix on which tangent space to project
+      projection of the sum of elements in the batch. Can also be a dense
+      tf.Tensor of the shape of `where` (a matrix of size M x N for
+      TT-matrices) or a batch of them with an additional leading dimension,
+      which is contracted with the orthogonal TT-cores of `where` mode by
+      mode instead of being converted into TT-format.
+    where: TensorTrain, TT-tensor or TT-matrix on which tangent space to
+      project, or a `TangentSpace` with the precomputed orthogonalizations of
+      it.
     weights: python list or tf.Tensor of numbers or None, weights of the sum
 
   Returns:
      a TensorTrain with the TT-ranks equal 2 * tangent_space_tens.get_tt_ranks()
   """
+  return _project_sum(what, where, weights).to_tt()
+
+
+def _project_sum(what, where, weights=None):
+  """Computes `project_sum` as a `TangentVector`."""
+  if not isinstance(what, TensorTrainBase):
+    space = _tangent_space(where)
+    what = tf.convert_to_tensor(what)
+    if not _is_dense_batch(what, space.point):
+      what = tf.expand_dims(what, 0)
+    if weights is None:
+      what = tf.expand_dims(tf.reduce_sum(what, 0), 0)
+      return _project_dense(what, space, False)
+    weights = tf.cast(weights, space.point.dtype)
+    weights_shape = weights.get_shape()
+    output_is_batch = len(weights_shape) > 1 and weights_shape[1] > 1
+    # Sum the dense tensors before projecting.
+    what = tf.tensordot(weights, what, [[0], [0]])
+    if len(weights_shape) == 1:
+      what = tf.expand_dims(what, 0)
+    return _project_dense(what, space, output_is_batch)
+
   # Always work with batch of TT objects for simplicity.
   what = shapes.expand_batch_dim(what)
 
   if weights is not None:
     weights = tf.convert_to_tensor(weights)
 
-  if not isinstance(where, TensorTrain):
-    raise ValueError('The first argument should be a TensorTrain object, got '
-                     '"%s".' % where)
+  space = _tangent_space(where)
+  where = space.point
+  left_tangent_space_tens = space.left
+  right_tangent_space_tens = space.right
 
   if where.get_raw_shape() != what.get_raw_shape():
     raise ValueError('The shapes of the tensor we want to project and of the '
@@ -44,37 +76,23 @@ def project_sum(what, where, weights=None):
                      (where.get_raw_shape(),
                       what.get_raw_shape()))
 
-  if not where.dtype.is_compatible_with(what.dtype):
+  if not where.dtype.base_dtype.is_compatible_with(what.dtype.base_dtype):
     raise ValueError('Dtypes of the arguments should coincide, got %s and %s.' %
                      (where.dtype,
                       what.dtype))
 
-  left_tangent_space_tens = decompositions.orthogonalize_tt_cores(
-    where)
-  right_tangent_space_tens = decompositions.orthogonalize_tt_cores(
-    left_tangent_space_tens, left_to_right=False)
-
   ndims = where.ndims()
   dtype = where.dtype
-  raw_shape = shapes.lazy_raw_shape(where)
   batch_size = shapes.lazy_batch_size(what)
-  right_tangent_tt_ranks = shapes.lazy_tt_ranks(right_tangent_space_tens)
-  left_tangent_tt_ranks = shapes.lazy_tt_ranks(left_tangent_space_tens)
 
   # For einsum notation.
   mode_str = 'ij' if where.is_tt_matrix() else 'i'
-  right_rank_dim = where.right_tt_rank_dim
-  left_rank_dim = where.left_tt_rank_dim
   if weights is not None:
     weights_shape = weights.get_shape()
     output_is_batch = len(weights_shape) > 1 and weights_shape[1] > 1
   else:
     output_is_batch = False
   output_batch_str = 'o' if output_is_batch else ''
-  if output_is_batch:
-    right_rank_dim += 1
-    left_rank_dim += 1
-    output_batch_size = weights.get_shape()[1].value
 
   # Prepare rhs vectors.
   # rhs[core_idx] is of size
@@ -101,11 +119,10 @@ def project_sum(what, where, weights=None):
                                   tens_core)
 
   # Left to right sweep.
-  res_cores_list = []
+  deltas = []
   for core_idx in range(ndims):
     tens_core = what.tt_cores[core_idx]
     left_tang_core = left_tangent_space_tens.tt_cores[core_idx]
-    right_tang_core = right_tangent_space_tens.tt_cores[core_idx]
 
     if core_idx < ndims - 1:
       einsum_str = 'sab,sb{0}c->sa{0}c'.format(mode_str)
@@ -131,57 +148,8 @@ def project_sum(what, where, weights=None):
         einsum_str = 's{1},sa{0}c->{1}a{0}c'.format(mode_str, output_batch_str)
         proj_core = tf.einsum(einsum_str, weights, proj_core_s)
 
-    if output_is_batch:
-      # Add batch dimension of size output_batch_size to left_tang_core and
-      # right_tang_core
-      extended_left_tang_core = tf.expand_dims(left_tang_core, 0)
-      extended_right_tang_core = tf.expand_dims(right_tang_core, 0)
-      if where.is_tt_matrix():
-        extended_left_tang_core = tf.tile(extended_left_tang_core,
-                                          [output_batch_size, 1, 1, 1, 1])
-        extended_right_tang_core = tf.tile(extended_right_tang_core,
-                                           [output_batch_size, 1, 1, 1, 1])
-      else:
-        extended_left_tang_core = tf.tile(extended_left_tang_core,
-                                          [output_batch_size, 1, 1, 1])
-        extended_right_tang_core = tf.tile(extended_right_tang_core,
-                                           [output_batch_size, 1, 1, 1])
-    else:
-      extended_left_tang_core = left_tang_core
-      extended_right_tang_core = right_tang_core
-
-    if core_idx == 0:
-      res_core = tf.concat((proj_core, extended_left_tang_core),
-                           axis=right_rank_dim)
-    elif core_idx == ndims - 1:
-      res_core = tf.concat((extended_right_tang_core, proj_core), axis=left_rank_dim)
-    else:
-      rank_1 = right_tangent_tt_ranks[core_idx]
-      rank_2 = left_tangent_tt_ranks[core_idx + 1]
-      if where.is_tt_matrix():
-        mode_size_n = raw_shape[0][core_idx]
-        mode_size_m = raw_shape[1][core_idx]
-        shape = [rank_1, mode_size_n, mode_size_m, rank_2]
-      else:
-        mode_size = raw_shape[0][core_idx]
-        shape = [rank_1, mode_size, rank_2]
-      if output_is_batch:
-        shape = [output_batch_size] + shape
-      zeros = tf.zeros(shape, dtype)
-      upper = tf.concat((extended_right_tang_core, zeros), axis=right_rank_dim)
-      lower = tf.concat((proj_core, extended_left_tang_core),
-                        axis=right_rank_dim)
-      res_core = tf.concat((upper, lower), axis=left_rank_dim)
-    res_cores_list.append(res_core)
-  # TODO: TT-ranks.
-  if output_is_batch:
-    res = TensorTrainBatch(res_cores_list, where.get_raw_shape(),
-                            batch_size=output_batch_size)
-  else:
-    res = TensorTrain(res_cores_list, where.get_raw_shape())
-
-  res.projection_on = where
-  return res
+    deltas.append(proj_core)
+  return TangentVector(deltas, space, output_is_batch)
 
 
 def project(what, where):
@@ -197,16 +165,35 @@ def project(what, where):
 
   Args:
     what: TensorTrain or TensorTrainBatch. In the case of batch returns
-      batch with projection of each individual tensor.
-    where: TensorTrain, TT-tensor or TT-matrix on which tangent space to project
+      batch with projection of each individual tensor. Can also be a dense
+      tf.Tensor of the shape of `where` (a matrix of size M x N for
+      TT-matrices) or a batch of them with an additional leading dimension,
+      which is contracted with the orthogonal TT-cores of `where` mode by
+      mode instead of being converted into TT-format (no TT-SVD).
+    where: TensorTrain, TT-tensor or TT-matrix on which tangent space to
+      project, or a `TangentSpace` with the precomputed orthogonalizations of
+      it.
 
   Returns:
      a TensorTrain with the TT-ranks equal 2 * tangent_space_tens.get_tt_ranks()
   """
+  return _project(what, where).to_tt()
 
-  if not isinstance(where, TensorTrain):
-    raise ValueError('The first argument should be a TensorTrain object, got '
-                     '"%s".' % where)
+
+def _project(what, where):
+  """Computes `project` as a `TangentVector`."""
+  if not isinstance(what, TensorTrainBase):
+    space = _tangent_space(where)
+    what = tf.convert_to_tensor(what)
+    output_is_batch = _is_dense_batch(what, space.point)
+    if not output_is_batch:
+      what = tf.expand_dims(what, 0)
+    return _project_dense(what, space, output_is_batch)
+
+  space = _tangent_space(where)
+  where = space.point
+  left_tangent_space_tens = space.left
+  right_tangent_space_tens = space.right
 
   if where.get_raw_shape() != what.get_raw_shape():
     raise ValueError('The shapes of the tensor we want to project and of the '
@@ -215,29 +202,17 @@ def project(what, where):
                      (where.get_raw_shape(),
                       what.get_raw_shape()))
 
-  if not where.dtype.is_compatible_with(what.dtype):
+  if not where.dtype.base_dtype.is_compatible_with(what.dtype.base_dtype):
     raise ValueError('Dtypes of the arguments should coincide, got %s and %s.' %
                      (where.dtype,
                       what.dtype))
 
-  left_tangent_space_tens = decompositions.orthogonalize_tt_cores(
-    where)
-  right_tangent_space_tens = decompositions.orthogonalize_tt_cores(
-    left_tangent_space_tens, left_to_right=False)
-
   ndims = where.ndims()
   dtype = where.dtype
-  raw_shape = shapes.lazy_raw_shape(where)
-  right_tangent_tt_ranks = shapes.lazy_tt_ranks(right_tangent_space_tens)
-  left_tangent_tt_ranks = shapes.lazy_tt_ranks(left_tangent_space_tens)
 
   # For einsum notation.
   mode_str = 'ij' if where.is_tt_matrix() else 'i'
-  right_rank_dim = what.right_tt_rank_dim
-  left_rank_dim = what.left_tt_rank_dim
   output_is_batch = isinstance(what, TensorTrainBatch)
-  if output_is_batch:
-    output_batch_size = what.batch_size
 
   # Always work with batch of TT objects for simplicity.
   what = shapes.expand_batch_dim(what)
@@ -268,11 +243,10 @@ def project(what, where):
                                   tens_core)
 
   # Left to right sweep.
-  res_cores_list = []
+  deltas = []
   for core_idx in range(ndims):
     tens_core = what.tt_cores[core_idx]
     left_tang_core = left_tangent_space_tens.tt_cores[core_idx]
-    right_tang_core = right_tangent_space_tens.tt_cores[core_idx]
 
     if core_idx < ndims - 1:
       einsum_str = 'sab,sb{0}c->sa{0}c'.format(mode_str)
@@ -292,57 +266,8 @@ def project(what, where):
         einsum_str = 'sab,sb{0}c->a{0}c'.format(mode_str)
       proj_core = tf.einsum(einsum_str, lhs[core_idx], tens_core)
 
-    if output_is_batch:
-      # Add batch dimension of size output_batch_size to left_tang_core and
-      # right_tang_core
-      extended_left_tang_core = tf.expand_dims(left_tang_core, 0)
-      extended_right_tang_core = tf.expand_dims(right_tang_core, 0)
-      if where.is_tt_matrix():
-        extended_left_tang_core = tf.tile(extended_left_tang_core,
-                                          [output_batch_size, 1, 1, 1, 1])
-        extended_right_tang_core = tf.tile(extended_right_tang_core,
-                                           [output_batch_size, 1, 1, 1, 1])
-      else:
-        extended_left_tang_core = tf.tile(extended_left_tang_core,
-                                          [output_batch_size, 1, 1, 1])
-        extended_right_tang_core = tf.tile(extended_right_tang_core,
-                                           [output_batch_size, 1, 1, 1])
-    else:
-      extended_left_tang_core = left_tang_core
-      extended_right_tang_core = right_tang_core
-
-    if core_idx == 0:
-      res_core = tf.concat((proj_core, extended_left_tang_core),
-                           axis=right_rank_dim)
-    elif core_idx == ndims - 1:
-      res_core = tf.concat((extended_right_tang_core, proj_core), axis=left_rank_dim)
-    else:
-      rank_1 = right_tangent_tt_ranks[core_idx]
-      rank_2 = left_tangent_tt_ranks[core_idx + 1]
-      if where.is_tt_matrix():
-        mode_size_n = raw_shape[0][core_idx]
-        mode_size_m = raw_shape[1][core_idx]
-        shape = [rank_1, mode_size_n, mode_size_m, rank_2]
-      else:
-        mode_size = raw_shape[0][core_idx]
-        shape = [rank_1, mode_size, rank_2]
-      if output_is_batch:
-        shape = [output_batch_size] + shape
-      zeros = tf.zeros(shape, dtype)
-      upper = tf.concat((extended_right_tang_core, zeros), axis=right_rank_dim)
-      lower = tf.concat((proj_core, extended_left_tang_core),
-                        axis=right_rank_dim)
-      res_core = tf.concat((upper, lower), axis=left_rank_dim)
-    res_cores_list.append(res_core)
-  # TODO: TT-ranks.
-  if output_is_batch:
-    res = TensorTrainBatch(res_cores_list, where.get_raw_shape(),
-                            batch_size=output_batch_size)
-  else:
-    res = TensorTrain(res_cores_list, where.get_raw_shape())
-
-  res.projection_on = where
-  return res
+    deltas.append(proj_core)
+  return TangentVector(deltas, space, output_is_batch)
 
 
 def project_matmul(what, where, matrix):
@@ -359,16 +284,23 @@ def project_matmul(what, where, matrix):
   Args:
     what: TensorTrain or TensorTrainBatch. In the case of batch returns
       batch with projection of each individual tensor.
-    where: TensorTrain, TT-tensor or TT-matrix on which tangent space to project
+    where: TensorTrain, TT-tensor or TT-matrix on which tangent space to
+      project, or a `TangentSpace` with the precomputed orthogonalizations of
+      it.
     matrix: TensorTrain, TT-matrix to multiply by what
 
   Returns:
      a TensorTrain with the TT-ranks equal 2 * tangent_space_tens.get_tt_ranks()
   """
+  return _project_matmul(what, where, matrix).to_tt()
 
-  if not isinstance(where, TensorTrain):
-    raise ValueError('The first argument should be a TensorTrain object, got '
-                     '"%s".' % where)
+
+def _project_matmul(what, where, matrix):
+  """Computes `project_matmul` as a `TangentVector`."""
+  space = _tangent_space(where)
+  where = space.point
+  left_tangent_space_tens = space.left
+  right_tangent_space_tens = space.right
 
   if where.get_raw_shape() != what.get_raw_shape():
     raise ValueError('The shapes of the tensor we want to project and of the '
@@ -377,32 +309,19 @@ def project_matmul(what, where, matrix):
                      (where.get_raw_shape(),
                       what.get_raw_shape()))
 
-  if not where.dtype.is_compatible_with(what.dtype):
+  if not where.dtype.base_dtype.is_compatible_with(what.dtype.base_dtype):
     raise ValueError('Dtypes of the arguments should coincide, got %s and %s.' %
                      (where.dtype,
                       what.dtype))
 
-  left_tangent_space_tens = decompositions.orthogonalize_tt_cores(
-    where)
-  right_tangent_space_tens = decompositions.orthogonalize_tt_cores(
-    left_tangent_space_tens, left_to_right=False)
-
   ndims = where.ndims()
   dtype = where.dtype
-  raw_shape = shapes.lazy_raw_shape(where)
-  batch_size = shapes.lazy_batch_size(what)
-  right_tangent_tt_ranks = shapes.lazy_tt_ranks(right_tangent_space_tens)
-  left_tangent_tt_ranks = shapes.lazy_tt_ranks(left_tangent_space_tens)
 
-  # For einsum notation.
-  right_rank_dim = what.right_tt_rank_dim
-  left_rank_dim = what.left_tt_rank_dim
   output_is_batch = isinstance(what, TensorTrainBatch)
-  if output_is_batch:
-    output_batch_size = what.batch_size
 
   # Always work with batch of TT objects for simplicity.
   what = shapes.expand_batch_dim(what)
+  batch_size = shapes.lazy_batch_size(what)
 
   # Prepare rhs vectors.
   # rhs[core_idx] is of size
@@ -429,12 +348,11 @@ def project_matmul(what, where, matrix):
                                   left_tang_core, lhs[core_idx], tens_core)
 
   # Left to right sweep.
-  res_cores_list = []
+  deltas = []
   for core_idx in range(ndims):
     tens_core = what.tt_cores[core_idx]
     matrix_core = matrix.tt_cores[core_idx]
     left_tang_core = left_tangent_space_tens.tt_cores[core_idx]
-    right_tang_core = right_tangent_space_tens.tt_cores[core_idx]
 
     if core_idx < ndims - 1:
       proj_core = tf.einsum('scjke,sabc,bijd->saikde', tens_core,
@@ -450,50 +368,118 @@ def project_matmul(what, where, matrix):
       proj_core = tf.einsum('sabc,bijd,scjke->saike', lhs[core_idx], matrix_core,
                             tens_core)
 
-    if output_is_batch:
-      # Add batch dimension of size output_batch_size to left_tang_core and
-      # right_tang_core
-      extended_left_tang_core = tf.expand_dims(left_tang_core, 0)
-      extended_right_tang_core = tf.expand_dims(right_tang_core, 0)
-      extended_left_tang_core = tf.tile(extended_left_tang_core,
-                                        [output_batch_size, 1, 1, 1, 1])
-      extended_right_tang_core = tf.tile(extended_right_tang_core,
-                                         [output_batch_size, 1, 1, 1, 1])
-    else:
-      extended_left_tang_core = left_tang_core
-      extended_right_tang_core = right_tang_core
+    if not output_is_batch:
+      # Remove the batch dimension of size 1 added by expand_batch_dim.
+      proj_core = proj_core[0]
 
-    if core_idx == 0:
-      res_core = tf.concat((proj_core, extended_left_tang_core),
-                           axis=right_rank_dim)
-    elif core_idx == ndims - 1:
-      res_core = tf.concat((extended_right_tang_core, proj_core),
-                           axis=left_rank_dim)
-    else:
-      rank_1 = right_tangent_tt_ranks[core_idx]
-      rank_2 = left_tangent_tt_ranks[core_idx + 1]
-      mode_size_n = raw_shape[0][core_idx]
-      mode_size_m = raw_shape[1][core_idx]
-      shape = [rank_1, mode_size_n, mode_size_m, rank_2]
-      if output_is_batch:
-        shape = [output_batch_size] + shape
-      zeros = tf.zeros(shape, dtype)
-      upper = tf.concat((extended_right_tang_core, zeros),
-                        axis=right_rank_dim)
-      lower = tf.concat((proj_core, extended_left_tang_core),
-                        axis=right_rank_dim)
-      res_core = tf.concat((upper, lower), axis=left_rank_dim)
-    res_cores_list.append(res_core)
-
-  # TODO: TT-ranks.
-  if output_is_batch:
-    res = TensorTrainBatch(res_cores_list, where.get_raw_shape(),
-                            batch_size=output_batch_size)
-  else:
-    res = TensorTrain(res_cores_list, where.get_raw_shape())
+    deltas.append(proj_core)
+  return TangentVector(deltas, space, output_is_batch)
 
-  res.projection_on = where
-  return res
+
+def project_sparse(sparse_tensor, where):
+  """Projects a `tf.SparseTensor` on the tangent space of `where` TT.
+
+  Equals to project(t3f.to_tt_tensor(sparse_tensor), where) but never builds a
+  TT-object (or the dense tensor) from the sparse tensor: for each nonzero
+  the products of the gathered slices of the left-orthogonal TT-cores of
+  `where` (from the left) and of the right-orthogonal ones (from the right)
+  are computed and scattered into the delta cores. The complexity is
+  O(nnz d r^2 + d n r^3), where nnz is the number of nonzeros.
+
+  The typical use case is the Riemannian gradient of the tensor completion
+  loss, which is nonzero only at the observed elements:
+    >>> errors = t3f.gather_nd(x, observed_idx) - observed_values
+    >>> grad = tf.SparseTensor(observed_idx, errors, x.get_shape())
+    >>> riemannian_grad = t3f.project_sparse(grad, x)
+
+  Args:
+    sparse_tensor: tf.SparseTensor of the shape of `where` (a matrix of size
+      M x N for TT-matrices), the indices can also be given in the format of
+      `t3f.gather_nd`.
+    where: TensorTrain, TT-tensor or TT-matrix on which tangent space to
+      project, or a `TangentSpace` with the precomputed orthogonalizations of
+      it.
+
+  Returns:
+     a TensorTrain with the TT-ranks equal 2 * tangent_space_tens.get_tt_ranks()
+
+  Raises:
+    ValueError if the indices are not compatible with `where` or the dtypes
+      of the arguments do not coincide.
+  """
+  return _project_sparse(sparse_tensor, where).to_tt()
+
+
+def _project_sparse(sparse_tensor, where):
+  """Computes `project_sparse` as a `TangentVector`."""
+  space = _tangent_space(where)
+  where = space.point
+  left_tangent_space_tens = space.left
+  right_tangent_space_tens = space.right
+
+  values = sparse_tensor.values
+  if not where.dtype.base_dtype.is_compatible_with(values.dtype.base_dtype):
+    raise ValueError('Dtypes of the arguments should coincide, got %s and %s.' %
+                     (where.dtype,
+                      values.dtype))
+
+  ndims = where.ndims()
+  dtype = where.dtype
+  # For einsum notation.
+  mode_str = 'ij' if where.is_tt_matrix() else 'i'
+  mode_indices, mode_sizes = utils.gather_nd_mode_indices(
+      where, sparse_tensor.indices)
+  num_nonzeros = tf.shape(values)[0]
+
+  # The slices of the TT-cores at the indices of the nonzeros,
+  # num_nonzeros x r_k x r_k+1.
+  left_slices = []
+  right_slices = []
+  for core_idx in range(ndims):
+    curr_slices = utils.gather_core_slices(left_tangent_space_tens, core_idx,
+                                           mode_sizes[core_idx])
+    left_slices.append(tf.gather(curr_slices, mode_indices[core_idx]))
+    curr_slices = utils.gather_core_slices(right_tangent_space_tens, core_idx,
+                                           mode_sizes[core_idx])
+    right_slices.append(tf.gather(curr_slices, mode_indices[core_idx]))
+
+  # rhs[core_idx] is the product of the slices of the right-orthogonal
+  # TT-cores core_idx, ..., d-1, of size
+  #   num_nonzeros x tangent_tt_ranks[core_idx].
+  rhs = [None] * (ndims + 1)
+  rhs[ndims] = tf.ones((num_nonzeros, 1), dtype=dtype)
+  for core_idx in range(ndims - 1, 0, -1):
+    rhs[core_idx] = tf.einsum('pab,pb->pa', right_slices[core_idx],
+                              rhs[core_idx + 1])
+
+  # lhs[core_idx] is the product of the slices of the left-orthogonal
+  # TT-cores 0, ..., core_idx-1 multiplied by the values of the nonzeros,
+  # of size num_nonzeros x tangent_tt_ranks[core_idx].
+  lhs = tf.reshape(values, (-1, 1))
+  raw_shape = shapes.lazy_raw_shape(where)
+  tt_ranks = shapes.lazy_tt_ranks(left_tangent_space_tens)
+  deltas = []
+  for core_idx in range(ndims):
+    # The sum of the outer products lhs rhs^T of the nonzeros with the same
+    # index of the current mode.
+    outer = tf.einsum('pa,pb->pab', lhs, rhs[core_idx + 1])
+    proj_core = tf.unsorted_segment_sum(outer, mode_indices[core_idx],
+                                        mode_sizes[core_idx])
+    proj_core = tf.transpose(proj_core, (1, 0, 2))
+    if where.is_tt_matrix():
+      proj_core = tf.reshape(proj_core, (tt_ranks[core_idx],
+                                         raw_shape[0][core_idx],
+                                         raw_shape[1][core_idx], -1))
+    if core_idx < ndims - 1:
+      # Make the delta orthogonal to the left-orthogonal TT-core.
+      left_tang_core = left_tangent_space_tens.tt_cores[core_idx]
+      einsum_str = 'a{0}b,a{0}c->cb'.format(mode_str)
+      gram = tf.einsum(einsum_str, proj_core, left_tang_core)
+      einsum_str = 'a{0}c,cb->a{0}b'.format(mode_str)
+      proj_core -= tf.einsum(einsum_str, left_tang_core, gram)
+      lhs = tf.einsum('pa,pab->pb', lhs, left_slices[core_idx])
+    deltas.append(proj_core)
+  return TangentVector(deltas, space)
 
 
 def pairwise_flat_inner_projected(projected_tt_vectors_1,
@@ -509,9 +495,9 @@ def pairwise_flat_inner_projected(projected_tt_vectors_1,
   than general pairwise_flat_inner. 
   
   Args:
-    projected_tt_vectors_1: TensorTrainBatch of tensors projected on the same
-      tangent space as projected_tt_vectors_2.
-    projected_tt_vectors_2: TensorTrainBatch.
+    projected_tt_vectors_1: TensorTrainBatch or TangentVector of tensors
+      projected on the same tangent space as projected_tt_vectors_2.
+    projected_tt_vectors_2: TensorTrainBatch or TangentVector.
     
   Returns:
     tf.tensor with the scalar product matrix.
@@ -531,58 +517,17 @@ def pairwise_flat_inner_projected(projected_tt_vectors_1,
                      (projected_tt_vectors_1.projection_on,
                       projected_tt_vectors_2.projection_on))
 
-  # Always work with batches of objects for simplicity.
-  projected_tt_vectors_1 = shapes.expand_batch_dim(projected_tt_vectors_1)
-  projected_tt_vectors_2 = shapes.expand_batch_dim(projected_tt_vectors_2)
-
-  ndims = projected_tt_vectors_1.ndims()
-  tt_ranks = shapes.lazy_tt_ranks(projected_tt_vectors_1)
-
-  if projected_tt_vectors_1.is_tt_matrix():
-    right_size = tt_ranks[1] // 2
-    curr_core_1 = projected_tt_vectors_1.tt_cores[0]
-    curr_core_2 = projected_tt_vectors_2.tt_cores[0]
-    curr_du_1 = curr_core_1[:, :, :, :, :right_size]
-    curr_du_2 = curr_core_2[:, :, :, :, :right_size]
-    res = tf.einsum('paijb,qaijb->pq', curr_du_1, curr_du_2)
-    for core_idx in range(1, ndims):
-      left_size = tt_ranks[core_idx] // 2
-      right_size = tt_ranks[core_idx + 1] // 2
-      curr_core_1 = projected_tt_vectors_1.tt_cores[core_idx]
-      curr_core_2 = projected_tt_vectors_2.tt_cores[core_idx]
-      curr_du_1 = curr_core_1[:, left_size:, :, :, :right_size]
-      curr_du_2 = curr_core_2[:, left_size:, :, :, :right_size]
-      res += tf.einsum('paijb,qaijb->pq', curr_du_1, curr_du_2)
-
-    left_size = tt_ranks[-2] // 2
-    curr_core_1 = projected_tt_vectors_1.tt_cores[-1]
-    curr_core_2 = projected_tt_vectors_2.tt_cores[-1]
-    curr_du_1 = curr_core_1[:, left_size:, :, :, :]
-    curr_du_2 = curr_core_2[:, left_size:, :, :, :]
-    res += tf.einsum('paijb,qaijb->pq', curr_du_1, curr_du_2)
-  else:
-    # Working with TT-tensor, not TT-matrix.
-    right_size = tt_ranks[1] // 2
-    curr_core_1 = projected_tt_vectors_1.tt_cores[0]
-    curr_core_2 = projected_tt_vectors_2.tt_cores[0]
-    curr_du_1 = curr_core_1[:, :, :, :right_size]
-    curr_du_2 = curr_core_2[:, :, :, :right_size]
-    res = tf.einsum('paib,qaib->pq', curr_du_1, curr_du_2)
-    for core_idx in range(1, ndims):
-      left_size = tt_ranks[core_idx] // 2
-      right_size = tt_ranks[core_idx + 1] // 2
-      curr_core_1 = projected_tt_vectors_1.tt_cores[core_idx]
-      curr_core_2 = projected_tt_vectors_2.tt_cores[core_idx]
-      curr_du_1 = curr_core_1[:, left_size:, :, :right_size]
-      curr_du_2 = curr_core_2[:, left_size:, :, :right_size]
-      res += tf.einsum('paib,qaib->pq', curr_du_1, curr_du_2)
-
-    left_size = tt_ranks[-2] // 2
-    curr_core_1 = projected_tt_vectors_1.tt_cores[-1]
-    curr_core_2 = projected_tt_vectors_2.tt_cores[-1]
-    curr_du_1 = curr_core_1[:, left_size:, :, :]
-    curr_du_2 = curr_core_2[:, left_size:, :, :]
-    res += tf.einsum('paib,qaib->pq', curr_du_1, curr_du_2)
+  deltas_1 = _projection_deltas(projected_tt_vectors_1)
+  deltas_2 = _projection_deltas(projected_tt_vectors_2)
+  # The projections are orthogonal to the tangent space frames, so the scalar
+  # product is the sum of the scalar products of the delta cores.
+  res = 0
+  for delta_1, delta_2 in zip(deltas_1, deltas_2):
+    batch_size_1 = tf.shape(delta_1)[0]
+    batch_size_2 = tf.shape(delta_2)[0]
+    delta_1 = tf.reshape(delta_1, (batch_size_1, -1))
+    delta_2 = tf.reshape(delta_2, (batch_size_2, -1))
+    res += tf.matmul(delta_1, delta_2, transpose_b=True)
   return res
 
 
@@ -594,7 +539,7 @@ def add_n_projected(tt_objects, coef=None):
 
   Args:
     tt_objects: a list of TT-objects that are projections on the same tangent
-      space.
+      space, or a list of TangentVectors from the same tangent space.
     coef: a list of numbers or anything else convertable to tf.Tensor.
       If provided, computes weighted sum. The size of this array should be
         len(tt_objects) x tt_objects[0].batch_size
@@ -619,6 +564,9 @@ def add_n_projected(tt_objects, coef=None):
                        'least the pointers are different.' % (tt.projection_on,
                                                               projection_on))
 
+  if isinstance(tt_objects[0], TangentVector):
+    return _add_n_tangent_vectors(tt_objects, coef)
+
   ndims = tt_objects[0].ndims()
   tt_ranks = shapes.lazy_tt_ranks(tt_objects[0])
   left_rank_dim = tt_objects[0].left_tt_rank_dim
@@ -696,3 +644,787 @@ def add_n_projected(tt_objects, coef=None):
   # Maintain the projection_on property.
   res.projection_on = tt_objects[0].projection_on
   return res
+
+
+def retract(x, tangent, max_tt_rank=10):
+  """Maps a tangent vector at x back to the manifold of TT-rank max_tt_rank.
+
+  Computes t3f.round(x + tangent, max_tt_rank), but uses that the projections
+  share the orthogonal TT-cores of x: the TT-cores of x + tangent are
+    [delta_1 U_1], [[V_k 0], [delta_k U_k]], [[V_d], [delta_d + S_d]],
+  of twice (instead of three times for t3f.add) the TT-ranks r of x, where
+  U_k and V_k are the left- and right-orthogonal TT-cores of x and S_d is the
+  last TT-core of the left-orthogonal x. Since the deltas are orthogonal to
+  U_k, the orthogonalization only needs the QR decompositions of the
+  (2r n) x r blocks [R V_k; delta_k], and the truncation only needs the
+  SVDs of the at most 2r x 2r triangular factors.
+
+  Example:
+    >>> space = t3f.TangentSpace(x)
+    >>> riemannian_grad = space.project(grad, compact=True)
+    >>> x = t3f.retract(x, -learning_rate * riemannian_grad, max_tt_rank=5)
+
+  Args:
+    x: TensorTrain, TT-tensor or TT-matrix.
+    tangent: TensorTrain or TangentVector from the tangent space at x (not a
+      batch), e.g. the result of `project`, `project_sum` or
+      `add_n_projected`.
+    max_tt_rank: a number or a list of d+1 numbers, the maximal TT-ranks of the
+      result, see `t3f.round`.
+
+  Returns:
+    TensorTrain of the same shape as x, the TT-cores are right-orthogonal
+    (except the first one).
+
+  Raises:
+    ValueError if x is not a TensorTrain, if tangent is not from the tangent
+      space at x or is a batch, or if max_tt_rank is less than 1 or is not a
+      number and not a vector of length d + 1.
+  """
+  if not isinstance(x, TensorTrain):
+    raise ValueError('The first argument should be a TensorTrain object, got '
+                     '"%s".' % x)
+  if getattr(tangent, 'projection_on', None) is not x:
+    raise ValueError('The second argument should be a projection on the '
+                     'tangent space of the first argument, got %s.' % tangent)
+  if _is_batch(tangent):
+    raise ValueError('Batches of tangent vectors are not supported, got %s.' %
+                     tangent)
+  ndims = x.ndims()
+  max_tt_rank = utils.max_tt_rank_vector(max_tt_rank, ndims)
+
+  if isinstance(tangent, TangentVector):
+    space = tangent.space
+    deltas = tangent.deltas
+  else:
+    # The orthogonalizations of x are cached, so they are not recomputed.
+    space = TangentSpace(x)
+    deltas = [delta[0] for delta in _projection_deltas(tangent)]
+
+  # Work with 3d TT-cores r x (n m) x r for TT-matrices as well.
+  left_cores = [_to_3d_core(core) for core in space.left.tt_cores]
+  right_cores = [_to_3d_core(core) for core in space.right.tt_cores]
+  deltas = [_to_3d_core(delta) for delta in deltas]
+
+  # Left-orthogonalize the TT-cores of x + tangent. The R factor of the
+  # previous QR is multiplied into the upper (V) block of the next TT-core.
+  tt_cores = []
+  r_factor = None
+  for core_idx in range(ndims):
+    curr_core = deltas[core_idx]
+    if core_idx == ndims - 1:
+      curr_core += left_cores[core_idx]
+    if r_factor is not None:
+      upper = tf.einsum('ab,bic->aic', r_factor, right_cores[core_idx])
+      curr_core = tf.concat((upper, curr_core), axis=0)
+    if core_idx == ndims - 1:
+      tt_cores.append(curr_core)
+      break
+    core_shape = _lazy_3d_shape(curr_core)
+    q, r_factor = linalg.qr(tf.reshape(curr_core, (-1, core_shape[2])))
+    q = tf.reshape(q, (core_shape[0], core_shape[1], -1))
+    # The block [0; U_k] is orthogonal to [R V_k; delta_k].
+    left_core = left_cores[core_idx]
+    if core_idx > 0:
+      left_shape = _lazy_3d_shape(left_core)
+      zeros_shape = (_lazy_3d_shape(upper)[0], left_shape[1], left_shape[2])
+      zeros = tf.zeros(zeros_shape, dtype=x.dtype)
+      left_core = tf.concat((zeros, left_core), axis=0)
+    tt_cores.append(tf.concat((q, left_core), axis=2))
+
+  # Truncate from right to left: LQ of the TT-core and SVD of the small L.
+  for core_idx in range(ndims - 1, 0, -1):
+    core_shape = _lazy_3d_shape(tt_cores[core_idx])
+    curr_core = tf.reshape(tt_cores[core_idx], (core_shape[0], -1))
+    q, r_factor = linalg.qr(tf.transpose(curr_core))
+    s, u, v = linalg.svd(tf.transpose(r_factor), max_tt_rank[core_idx])
+    num_singular_values = s.get_shape().as_list()[-1]
+    if num_singular_values is None:
+      rank = tf.minimum(max_tt_rank[core_idx], tf.shape(s)[-1])
+    else:
+      rank = min(max_tt_rank[core_idx], num_singular_values)
+    u = u[:, :rank]
+    s = s[:rank]
+    v = v[:, :rank]
+    curr_core = tf.transpose(tf.matmul(q, v))
+    tt_cores[core_idx] = tf.reshape(curr_core,
+                                    (rank, core_shape[1], core_shape[2]))
+    tt_cores[core_idx - 1] = tf.einsum('aib,bc->aic', tt_cores[core_idx - 1],
+                                       u * s)
+
+  raw_shape = shapes.lazy_raw_shape(x)
+  num_mode_dims = len(x.get_raw_shape())
+  for core_idx in range(ndims):
+    core_shape = _lazy_3d_shape(tt_cores[core_idx])
+    mode_shape = [raw_shape[i][core_idx] for i in range(num_mode_dims)]
+    new_shape = [core_shape[0]] + mode_shape + [core_shape[2]]
+    tt_cores[core_idx] = tf.reshape(tt_cores[core_idx], new_shape)
+  res = TensorTrain(tt_cores, x.get_raw_shape())
+  # The TT-cores are the right singular vectors.
+  res._orthogonality = 'right'
+  return res
+
+
+def transport(what, where):
+  """Moves a tangent vector into the tangent space at `where`.
+
+  The vector transport for the Riemannian optimization: transport(what, y)
+  equals project(what, y), but uses that `what` is from the tangent space at
+  another point x. The environments of the projection are computed directly
+  from the delta cores of `what` and the orthogonal TT-cores of x and y
+  (the cached orthogonalizations are reused), without building the TT-object
+  of twice the TT-ranks of x. The cost is O(d n r^3) and the TT-ranks of the
+  result are 2 * r as for any projection.
+
+  Example:
+    >>> riemannian_grad = t3f.project(grad, x)
+    >>> y = t3f.retract(x, -learning_rate * riemannian_grad, max_tt_rank=5)
+    >>> grad_at_y = t3f.transport(riemannian_grad, y)
+
+  Args:
+    what: TensorTrain, TensorTrainBatch or TangentVector with the
+      projection_on field, e.g. the result of `project`.
+    where: TensorTrain, TT-tensor or TT-matrix on which tangent space to
+      transport, or a `TangentSpace` with the precomputed orthogonalizations
+      of it.
+
+  Returns:
+     a TensorTrain (TensorTrainBatch if what is a batch) with the TT-ranks
+     equal 2 * where.get_tt_ranks()
+  """
+  return _transport(what, where).to_tt()
+
+
+def _transport(what, where):
+  """Computes `transport` as a `TangentVector`."""
+  if getattr(what, 'projection_on', None) is None:
+    raise ValueError('The first argument should be a projection on a tangent '
+                     'space (with the projection_on field), got %s.' % what)
+  new_space = _tangent_space(where)
+  if isinstance(what, TangentVector):
+    old_space = what.space
+  else:
+    old_space = TangentSpace(what.projection_on)
+  if new_space.point.get_raw_shape() != old_space.point.get_raw_shape():
+    raise ValueError('The shapes of the tangent spaces should match, got %s '
+                     'and %s.' % (old_space.point.get_raw_shape(),
+                                  new_space.point.get_raw_shape()))
+  if not new_space.point.dtype.base_dtype.is_compatible_with(
+      old_space.point.dtype.base_dtype):
+    raise ValueError('Dtypes of the arguments should coincide, got %s and %s.' %
+                     (old_space.point.dtype, new_space.point.dtype))
+
+  ndims = new_space.point.ndims()
+  dtype = new_space.point.dtype
+  # For einsum notation.
+  mode_str = 'ij' if new_space.point.is_tt_matrix() else 'i'
+  output_is_batch = _is_batch(what)
+  # The delta cores with a leading batch dimension.
+  deltas = _projection_deltas(what)
+  old_left = old_space.left.tt_cores
+  old_right = old_space.right.tt_cores
+  new_left = new_space.left.tt_cores
+  new_right = new_space.right.tt_cores
+
+  # what = sum_k U_1 ... U_k-1 delta_k V_k+1 ... V_d is the TT-object with
+  # the TT-cores [delta_1 U_1], [[V_k 0], [delta_k U_k]], [[V_d], [delta_d]],
+  # its environments are stored block by block.
+  # left_u[core_idx] = (U'_1 ... U'_core_idx-1)^T U_1 ... U_core_idx-1 is of
+  # size new_tt_ranks[core_idx] x tt_ranks[core_idx] and left_v[core_idx] is
+  # the same product for the sum of the first core_idx - 1 terms, of size
+  #   batch_size x new_tt_ranks[core_idx] x tt_ranks[core_idx].
+  left_u = [None] * ndims
+  left_v = [None] * ndims
+  left_u[0] = tf.ones((1, 1), dtype=dtype)
+  for core_idx in range(ndims - 1):
+    einsum_str = 'ab,a{0}c,b{0}d->cd'.format(mode_str)
+    left_u[core_idx + 1] = tf.einsum(einsum_str, left_u[core_idx],
+                                     new_left[core_idx], old_left[core_idx])
+    einsum_str = 'ab,a{0}c,sb{0}d->scd'.format(mode_str)
+    left_v[core_idx + 1] = tf.einsum(einsum_str, left_u[core_idx],
+                                     new_left[core_idx], deltas[core_idx])
+    if left_v[core_idx] is not None:
+      einsum_str = 'sab,a{0}c,b{0}d->scd'.format(mode_str)
+      left_v[core_idx + 1] += tf.einsum(einsum_str, left_v[core_idx],
+                                        new_left[core_idx],
+                                        old_right[core_idx])
+
+  # right_v[core_idx] = V_core_idx ... V_d (V'_core_idx ... V'_d)^T is of size
+  # tt_ranks[core_idx] x new_tt_ranks[core_idx] and right_u[core_idx] is the
+  # same product for the sum of the last d - core_idx terms, of size
+  #   batch_size x tt_ranks[core_idx] x new_tt_ranks[core_idx].
+  right_v = [None] * (ndims + 1)
+  right_u = [None] * (ndims + 1)
+  right_v[ndims] = tf.ones((1, 1), dtype=dtype)
+  for core_idx in range(ndims - 1, 0, -1):
+    einsum_str = 'a{0}b,bd,c{0}d->ac'.format(mode_str)
+    right_v[core_idx] = tf.einsum(einsum_str, old_right[core_idx],
+                                  right_v[core_idx + 1], new_right[core_idx])
+    einsum_str = 'sa{0}b,bd,c{0}d->sac'.format(mode_str)
+    right_u[core_idx] = tf.einsum(einsum_str, deltas[core_idx],
+                                  right_v[core_idx + 1], new_right[core_idx])
+    if right_u[core_idx + 1] is not None:
+      einsum_str = 'a{0}b,sbd,c{0}d->sac'.format(mode_str)
+      right_u[core_idx] += tf.einsum(einsum_str, old_left[core_idx],
+                                     right_u[core_idx + 1],
+                                     new_right[core_idx])
+
+  new_deltas = []
+  for core_idx in range(ndims):
+    # The TT-core of what contracted with the new frames from both sides.
+    einsum_str = 'ab,sb{0}c,cd->sa{0}d'.format(mode_str)
+    proj_core = tf.einsum(einsum_str, left_u[core_idx], deltas[core_idx],
+                          right_v[core_idx + 1])
+    if left_v[core_idx] is not None:
+      einsum_str = 'sab,b{0}c,cd->sa{0}d'.format(mode_str)
+      proj_core += tf.einsum(einsum_str, left_v[core_idx],
+                             old_right[core_idx], right_v[core_idx + 1])
+    if right_u[core_idx + 1] is not None:
+      einsum_str = 'ab,b{0}c,scd->sa{0}d'.format(mode_str)
+      proj_core += tf.einsum(einsum_str, left_u[core_idx],
+                             old_left[core_idx], right_u[core_idx + 1])
+    if core_idx < ndims - 1:
+      # Make the delta orthogonal to the left-orthogonal TT-core of where.
+      new_left_core = new_left[core_idx]
+      einsum_str = 'sa{0}b,a{0}c->scb'.format(mode_str)
+      gram = tf.einsum(einsum_str, proj_core, new_left_core)
+      einsum_str = 'a{0}c,scb->sa{0}b'.format(mode_str)
+      proj_core -= tf.einsum(einsum_str, new_left_core, gram)
+    if not output_is_batch:
+      proj_core = proj_core[0]
+    new_deltas.append(proj_core)
+  return TangentVector(new_deltas, new_space, output_is_batch)
+
+
+class TangentSpace(object):
+  """The tangent space of the manifold of TT-objects of fixed TT-rank.
+
+  Projecting onto the tangent space at `where` requires the left- and the
+  right-orthogonal versions of `where`. The functions `project_sum`, `project`
+  and `project_matmul` compute them on each call, while a TangentSpace object
+  computes them once and reuses them for all the projections, e.g. of many
+  gradients onto the same point:
+
+    >>> space = t3f.TangentSpace(x)
+    >>> proj_1 = space.project(grad_1)
+    >>> proj_2 = space.project_matmul(x, A)
+    >>> space.inner(proj_1, proj_2)
+
+  The projections have the `projection_on` field equal to `where` (as the
+  results of `project(what, where)`), so they can be used in
+  `pairwise_flat_inner_projected` and `add_n_projected`. With compact=True the
+  projections are returned as `TangentVector`s.
+
+  @@point
+  @@left
+  @@right
+  @@project
+  @@project_sum
+  @@project_matmul
+  @@project_sparse
+  @@transport
+  @@inner
+  """
+
+  def __init__(self, where):
+    """Creates the tangent space at `where`.
+
+    Args:
+      where: TensorTrain, TT-tensor or TT-matrix.
+
+    Raises:
+      ValueError if `where` is not a TensorTrain.
+    """
+    if not isinstance(where, TensorTrain):
+      raise ValueError('The first argument should be a TensorTrain object, '
+                       'got "%s".' % where)
+    self._point = where
+    self._left = decompositions.orthogonalize_tt_cores(where)
+    self._right = decompositions.orthogonalize_tt_cores(self._left,
+                                                        left_to_right=False)
+
+  @property
+  def point(self):
+    """The TT-object the tangent space is attached to."""
+    return self._point
+
+  @property
+  def left(self):
+    """`point` with all the TT-cores except the last one left-orthogonal."""
+    return self._left
+
+  @property
+  def right(self):
+    """`point` with all the TT-cores except the first one right-orthogonal."""
+    return self._right
+
+  def project(self, what, compact=False):
+    """Projects `what` onto the tangent space, see `t3f.project`.
+
+    Returns:
+      TensorTrain or TensorTrainBatch, or TangentVector if compact is True.
+    """
+    res = _project(what, self)
+    return res if compact else res.to_tt()
+
+  def project_sum(self, what, weights=None, compact=False):
+    """Projects the (weighted) sum of `what`, see `t3f.project_sum`.
+
+    Returns:
+      TensorTrain or TensorTrainBatch, or TangentVector if compact is True.
+    """
+    res = _project_sum(what, self, weights)
+    return res if compact else res.to_tt()
+
+  def project_matmul(self, what, matrix, compact=False):
+    """Projects `matrix` * `what`, see `t3f.project_matmul`.
+
+    Returns:
+      TensorTrain or TensorTrainBatch, or TangentVector if compact is True.
+    """
+    res = _project_matmul(what, self, matrix)
+    return res if compact else res.to_tt()
+
+  def project_sparse(self, sparse_tensor, compact=False):
+    """Projects a `tf.SparseTensor`, see `t3f.project_sparse`.
+
+    Returns:
+      TensorTrain, or TangentVector if compact is True.
+    """
+    res = _project_sparse(sparse_tensor, self)
+    return res if compact else res.to_tt()
+
+  def transport(self, what, compact=False):
+    """Moves a tangent vector into this tangent space, see `t3f.transport`.
+
+    Returns:
+      TensorTrain or TensorTrainBatch, or TangentVector if compact is True.
+    """
+    res = _transport(what, self)
+    return res if compact else res.to_tt()
+
+  def inner(self, projected_1, projected_2):
+    """Scalar products of the projections onto this tangent space.
+
+    Args:
+      projected_1: TensorTrain, TensorTrainBatch or TangentVector projected
+        onto this tangent space.
+      projected_2: TensorTrain, TensorTrainBatch or TangentVector projected
+        onto this tangent space.
+
+    Returns:
+      tf.Tensor, a scalar if both arguments are not batches, a vector if one
+      of them is a batch and the matrix of the pairwise scalar products (see
+      `pairwise_flat_inner_projected`) if both are.
+
+    Raises:
+      ValueError if the arguments are not projections onto this tangent space.
+    """
+    for projected in (projected_1, projected_2):
+      if getattr(projected, 'projection_on', None) is not self.point:
+        raise ValueError('The arguments should be projections on the tangent '
+                         'space of %s, got %s.' % (self.point, projected))
+    res = pairwise_flat_inner_projected(projected_1, projected_2)
+    if not _is_batch(projected_2):
+      res = res[:, 0]
+    if not _is_batch(projected_1):
+      res = res[0]
+    return res
+
+
+class TangentVector(object):
+  """A compact representation of an element of a tangent space.
+
+  The projection onto the tangent space at x is
+    P_x(z) = sum_k U_1 ... U_{k-1} delta_k V_{k+1} ... V_d,
+  where U_i and V_i are the TT-cores of the left- and right-orthogonal versions
+  of x. The TT-objects returned by `project` store it with the TT-cores
+    [delta_1 U_1], [[V_k 0], [delta_k U_k]], [[V_d], [delta_d]]
+  of twice the TT-ranks of x, while a TangentVector stores only the delta
+  cores (about 4 times less memory) and a reference to the `TangentSpace`
+  with the shared U_i and V_i (which are not copied for batches).
+
+  Supports addition and subtraction of TangentVectors from the same tangent
+  space and multiplication by a number; `pairwise_flat_inner_projected` and
+  `add_n_projected` work directly with the delta cores.
+
+  @@deltas
+  @@space
+  @@projection_on
+  @@is_batch
+  @@batch_size
+  @@dtype
+  @@ndims
+  @@is_tt_matrix
+  @@get_raw_shape
+  @@to_tt
+  """
+
+  def __init__(self, deltas, space, is_batch=False):
+    """Creates a TangentVector from the delta cores.
+
+    Args:
+      deltas: a list of d tf.Tensors, the k-th of shape
+        [left_rank_k, n_k, right_rank_k+1] ([left_rank_k, n_k, m_k,
+        right_rank_k+1] for TT-matrices) where left_rank and right_rank are
+        the TT-ranks of space.left and space.right (with an additional
+        leading batch dimension if is_batch).
+      space: TangentSpace.
+      is_batch: bool, whether the deltas represent a batch of tangent vectors.
+    """
+    self._deltas = list(deltas)
+    self._space = space
+    self._is_batch = is_batch
+
+  @property
+  def deltas(self):
+    """A list of the delta cores."""
+    return self._deltas
+
+  @property
+  def space(self):
+    """The TangentSpace the vector belongs to."""
+    return self._space
+
+  @property
+  def projection_on(self):
+    """The TT-object to which tangent space the vector belongs."""
+    return self._space.point
+
+  @property
+  def is_batch(self):
+    """True if the object represents a batch of tangent vectors."""
+    return self._is_batch
+
+  @property
+  def batch_size(self):
+    """The (static) batch size, None if unknown or if not a batch."""
+    if not self._is_batch:
+      return None
+    return self._deltas[0].get_shape().as_list()[0]
+
+  @property
+  def dtype(self):
+    return self._space.point.dtype
+
+  def ndims(self):
+    return self._space.point.ndims()
+
+  def is_tt_matrix(self):
+    return self._space.point.is_tt_matrix()
+
+  def get_raw_shape(self):
+    return self._space.point.get_raw_shape()
+
+  def to_tt(self):
+    """Converts the vector into a TT-object of twice the TT-ranks of the point.
+
+    Returns:
+      TensorTrain or TensorTrainBatch (if is_batch) with the projection_on
+      field, as the results of `project`.
+    """
+    point = self._space.point
+    left_tangent_space_tens = self._space.left
+    right_tangent_space_tens = self._space.right
+    ndims = point.ndims()
+    dtype = point.dtype
+    raw_shape = shapes.lazy_raw_shape(point)
+    right_tangent_tt_ranks = shapes.lazy_tt_ranks(right_tangent_space_tens)
+    left_tangent_tt_ranks = shapes.lazy_tt_ranks(left_tangent_space_tens)
+    right_rank_dim = point.right_tt_rank_dim
+    left_rank_dim = point.left_tt_rank_dim
+    if self._is_batch:
+      right_rank_dim += 1
+      left_rank_dim += 1
+      output_batch_size = self.batch_size
+      if output_batch_size is None:
+        output_batch_size = tf.shape(self._deltas[0])[0]
+
+    res_cores_list = []
+    for core_idx in range(ndims):
+      proj_core = self._deltas[core_idx]
+      left_tang_core = left_tangent_space_tens.tt_cores[core_idx]
+      right_tang_core = right_tangent_space_tens.tt_cores[core_idx]
+
+      if self._is_batch:
+        # Add batch dimension of size output_batch_size to left_tang_core and
+        # right_tang_core
+        multiples = [output_batch_size] + [1] * len(left_tang_core.get_shape())
+        extended_left_tang_core = tf.tile(tf.expand_dims(left_tang_core, 0),
+                                          multiples)
+        extended_right_tang_core = tf.tile(tf.expand_dims(right_tang_core, 0),
+                                           multiples)
+      else:
+        extended_left_tang_core = left_tang_core
+        extended_right_tang_core = right_tang_core
+
+      if core_idx == 0:
+        res_core = tf.concat((proj_core, extended_left_tang_core),
+                             axis=right_rank_dim)
+      elif core_idx == ndims - 1:
+        res_core = tf.concat((extended_right_tang_core, proj_core),
+                             axis=left_rank_dim)
+      else:
+        rank_1 = right_tangent_tt_ranks[core_idx]
+        rank_2 = left_tangent_tt_ranks[core_idx + 1]
+        if point.is_tt_matrix():
+          mode_size_n = raw_shape[0][core_idx]
+          mode_size_m = raw_shape[1][core_idx]
+          shape = [rank_1, mode_size_n, mode_size_m, rank_2]
+        else:
+          mode_size = raw_shape[0][core_idx]
+          shape = [rank_1, mode_size, rank_2]
+        if self._is_batch:
+          shape = [output_batch_size] + shape
+        zeros = tf.zeros(shape, dtype)
+        upper = tf.concat((extended_right_tang_core, zeros),
+                          axis=right_rank_dim)
+        lower = tf.concat((proj_core, extended_left_tang_core),
+                          axis=right_rank_dim)
+        res_core = tf.concat((upper, lower), axis=left_rank_dim)
+      res_cores_list.append(res_core)
+    out_ranks = [1]
+    static_left_ranks = left_tangent_space_tens.get_tt_ranks()
+    static_right_ranks = right_tangent_space_tens.get_tt_ranks()
+    for core_idx in range(1, ndims):
+      out_ranks.append(static_right_ranks[core_idx] +
+                       static_left_ranks[core_idx])
+    out_ranks.append(1)
+    if self._is_batch:
+      res = TensorTrainBatch(res_cores_list, point.get_raw_shape(),
+                             out_ranks, self.batch_size)
+    else:
+      res = TensorTrain(res_cores_list, point.get_raw_shape(), out_ranks)
+
+    res.projection_on = point
+    return res
+
+  def __add__(self, other):
+    """Returns the sum of two TangentVectors from the same tangent space."""
+    _check_same_tangent_space((self, other))
+    deltas = [a + b for a, b in zip(self._deltas, other.deltas)]
+    return TangentVector(deltas, self._space, self._is_batch or other.is_batch)
+
+  def __sub__(self, other):
+    """Returns the difference of two TangentVectors from the same space."""
+    return self + (-1.0) * other
+
+  def __neg__(self):
+    return (-1.0) * self
+
+  def __mul__(self, other):
+    """Returns the TangentVector multiplied by a number."""
+    if isinstance(other, (TangentVector, TensorTrain, TensorTrainBatch)):
+      raise ValueError('A TangentVector can only be multiplied by a number, '
+                       'got %s.' % other)
+    other = tf.cast(other, self.dtype)
+    deltas = [other * delta for delta in self._deltas]
+    return TangentVector(deltas, self._space, self._is_batch)
+
+  def __rmul__(self, other):
+    return self.__mul__(other)
+
+
+def _tangent_space(where):
+  """Returns the TangentSpace at where (or where if it is a TangentSpace).
+
+  Raises:
+    ValueError if `where` is not a TensorTrain or a TangentSpace.
+  """
+  if isinstance(where, TangentSpace):
+    return where
+  return TangentSpace(where)
+
+
+def _is_batch(projected):
+  if isinstance(projected, TangentVector):
+    return projected.is_batch
+  return isinstance(projected, TensorTrainBatch)
+
+
+def _check_same_tangent_space(tangent_vectors):
+  projection_on = tangent_vectors[0].projection_on
+  for vector in tangent_vectors:
+    if not isinstance(vector, TangentVector):
+      raise ValueError('Expected TangentVectors, got %s.' % vector)
+    if vector.projection_on is not projection_on:
+      raise ValueError('All the TangentVectors should be from the tangent '
+                       'space of the same TT-object, got %s and %s.' %
+                       (vector.projection_on, projection_on))
+
+
+def _projection_deltas(projected):
+  """Returns the delta cores of a projection with a leading batch dimension.
+
+  Args:
+    projected: TangentVector or a TT-object returned by a projection
+      function.
+
+  Returns:
+    A list of tf.Tensors, see `TangentVector`.
+  """
+  if isinstance(projected, TangentVector):
+    if projected.is_batch:
+      return projected.deltas
+    return [tf.expand_dims(delta, 0) for delta in projected.deltas]
+  projected = shapes.expand_batch_dim(projected)
+  ndims = projected.ndims()
+  tt_ranks = shapes.lazy_tt_ranks(projected)
+  deltas = []
+  for core_idx in range(ndims):
+    # The delta cores are the lower left blocks of the TT-cores.
+    left_size = tt_ranks[core_idx] // 2 if core_idx > 0 else 0
+    right_size = tt_ranks[core_idx + 1] // 2 if core_idx < ndims - 1 else None
+    core = projected.tt_cores[core_idx]
+    deltas.append(core[:, left_size:, ..., :right_size])
+  return deltas
+
+
+def _add_n_tangent_vectors(tangent_vectors, coef=None):
+  """Adds TangentVectors from the same tangent space, see `add_n_projected`."""
+  _check_same_tangent_space(tangent_vectors)
+  is_batch = any(vector.is_batch for vector in tangent_vectors)
+  if coef is not None:
+    coef = tf.cast(coef, tangent_vectors[0].dtype)
+  res_deltas = []
+  for core_idx in range(tangent_vectors[0].ndims()):
+    chunks = []
+    for obj_idx, vector in enumerate(tangent_vectors):
+      curr_delta = vector.deltas[core_idx]
+      if coef is not None:
+        curr_coef = coef[obj_idx]
+        if is_batch:
+          # Broadcast the coefficients of the batch elements.
+          num_core_dims = len(curr_delta.get_shape()) - int(vector.is_batch)
+          curr_coef = tf.reshape(curr_coef, [-1] + [1] * num_core_dims)
+        curr_delta = curr_coef * curr_delta
+      chunks.append(curr_delta)
+    # Not tf.add_n: batch and non-batch deltas are broadcasted.
+    res_delta = chunks[0]
+    for curr_delta in chunks[1:]:
+      res_delta += curr_delta
+    res_deltas.append(res_delta)
+  return TangentVector(res_deltas, tangent_vectors[0].space, is_batch)
+
+
+def _project_dense(what, space, output_is_batch):
+  """Projects dense tensors onto the tangent space without TT-SVD.
+
+  The dense tensor is contracted with the left-orthogonal TT-cores of the
+  point mode by mode from the left, and each delta core is the contraction of
+  the current partial product with the right-orthogonal TT-cores from the
+  right. Apart from the dense input, the memory is that of one partial
+  product, which is at most r / n_1 times the size of the input.
+
+  Args:
+    what: tf.Tensor with a leading batch dimension, the other dimensions are
+      the shape of space.point (M x N for TT-matrices).
+    space: TangentSpace.
+    output_is_batch: bool, whether to keep the batch dimension in the result.
+
+  Returns:
+    TangentVector.
+  """
+  where = space.point
+  ndims = where.ndims()
+  raw_shape = shapes.lazy_raw_shape(where)
+  batch_size = tf.shape(what)[0]
+  if where.is_tt_matrix():
+    # Interleave the row and the column indices, so that the k-th mode of
+    # the dense tensor corresponds to the k-th TT-core r x (n m) x r'.
+    what = tf.reshape(what, [batch_size] + [raw_shape[0][i]
+                                            for i in range(ndims)] +
+                      [raw_shape[1][i] for i in range(ndims)])
+    perm = [0]
+    for core_idx in range(ndims):
+      perm += [core_idx + 1, ndims + core_idx + 1]
+    what = tf.transpose(what, perm)
+    mode_sizes = [raw_shape[0][i] * raw_shape[1][i] for i in range(ndims)]
+  else:
+    mode_sizes = [raw_shape[0][i] for i in range(ndims)]
+  left_cores = [_to_3d_core(core) for core in space.left.tt_cores]
+  right_cores = [_to_3d_core(core) for core in space.right.tt_cores]
+  tt_ranks = shapes.lazy_tt_ranks(space.left)
+  right_tt_ranks = shapes.lazy_tt_ranks(space.right)
+
+  # partial is the dense tensor contracted with the left-orthogonal TT-cores
+  # 0, ..., core_idx-1, of size
+  #   batch_size x tangent_tt_ranks[core_idx] x n_core_idx x (n_core_idx+1 ...)
+  partial = tf.reshape(what, (batch_size, 1, mode_sizes[0], -1))
+  deltas = []
+  for core_idx in range(ndims):
+    # Contract the trailing modes with the right-orthogonal TT-cores.
+    proj_core = tf.reshape(partial, (batch_size, -1, mode_sizes[-1], 1))
+    for right_idx in range(ndims - 1, core_idx, -1):
+      proj_core = tf.einsum('spib,aib->spa', proj_core, right_cores[right_idx])
+      if right_idx - 1 > core_idx:
+        proj_core = tf.reshape(proj_core, (batch_size, -1,
+                                           mode_sizes[right_idx - 1],
+                                           right_tt_ranks[right_idx]))
+    proj_core = tf.reshape(proj_core, (batch_size, tt_ranks[core_idx],
+                                       mode_sizes[core_idx], -1))
+    left_core = left_cores[core_idx]
+    if core_idx < ndims - 1:
+      # Make the delta orthogonal to the left-orthogonal TT-core.
+      gram = tf.einsum('saib,aic->scb', proj_core, left_core)
+      proj_core -= tf.einsum('aic,scb->saib', left_core, gram)
+      partial = tf.einsum('saip,aib->sbp', partial, left_core)
+      partial = tf.reshape(partial, (batch_size, tt_ranks[core_idx + 1],
+                                     mode_sizes[core_idx + 1], -1))
+    if where.is_tt_matrix():
+      proj_core = tf.reshape(proj_core, (batch_size, tt_ranks[core_idx],
+                                         raw_shape[0][core_idx],
+                                         raw_shape[1][core_idx], -1))
+    if not output_is_batch:
+      proj_core = proj_core[0]
+    deltas.append(proj_core)
+  return TangentVector(deltas, space, output_is_batch)
+
+
+def _is_dense_batch(what, where):
+  """Checks the shape of a dense tensor to project.
+
+  Returns:
+    False if the shape of `what` is the shape of `where` and True if it has an
+    additional leading batch dimension.
+
+  Raises:
+    ValueError if the shapes are not compatible.
+  """
+  what_shape = what.get_shape()
+  num_dims = 2 if where.is_tt_matrix() else where.ndims()
+  if len(what_shape) not in (num_dims, num_dims + 1):
+    raise ValueError('The dense tensor we want to project should be of the '
+                     'shape of the tensor on which tangent space we want to '
+                     'project (with an optional batch dimension), got %s and '
+                     '%s.' % (what_shape, where.get_shape()))
+  if not what_shape[-num_dims:].is_compatible_with(where.get_shape()):
+    raise ValueError('The shapes of the tensor we want to project and of the '
+                     'tensor on which tangent space we want to project should '
+                     'match, got %s and %s.' % (what_shape, where.get_shape()))
+  if not where.dtype.base_dtype.is_compatible_with(what.dtype.base_dtype):
+    raise ValueError('Dtypes of the arguments should coincide, got %s and %s.' %
+                     (where.dtype,
+                      what.dtype))
+  return len(what_shape) == num_dims + 1
+
+
+def _lazy_3d_shape(core):
+  """Returns the shape of a 3d tf.Tensor, static where it is known."""
+  static_shape = core.get_shape().as_list()
+  dynamic_shape = tf.shape(core)
+  return [static_shape[i] if static_shape[i] is not None else dynamic_shape[i]
+          for i in range(3)]
+
+
+def _to_3d_core(core):
+  """Reshapes a TT-core r x n x m x r' of a TT-matrix into r x (n m) x r'."""
+  if len(core.get_shape()) == 3:
+    return core
+  static_shape = core.get_shape().as_list()
+  dynamic_shape = tf.shape(core)
+  left_rank = static_shape[0] if static_shape[0] is not None else \
+      dynamic_shape[0]
+  right_rank = static_shape[-1] if static_shape[-1] is not None else \
+      dynamic_shape[-1]
+  return tf.reshape(core, (left_rank, -1, right_rank))
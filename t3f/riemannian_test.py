@@ -2,11 +2,13 @@ import numpy as np
 import tensorflow as tf
 
 from t3f.tensor_train import TensorTrain
+from t3f.tensor_train_batch import TensorTrainBatch
 from t3f import ops
 from t3f import initializers
 from t3f import riemannian
 from t3f import shapes
 from t3f import batch_ops
+from t3f import decompositions
 
 
 class RiemannianTest(tf.test.TestCase):
@@ -137,6 +139,287 @@ class RiemannianTest(tf.test.TestCase):
       actual_val, desired_val = sess.run((ops.full(proj), ops.full(proj_desired)))
       self.assertAllClose(desired_val, actual_val, atol=1e-5, rtol=1e-5)
 
+  def testProjectSparse(self):
+    # Compare project_sparse with the projection of the TT-representation of
+    # the sparse tensor.
+    np.random.seed(1)
+    shape = (2, 3, 4, 3)
+    flat_idx = np.random.choice(np.prod(shape), 20, replace=False)
+    indices = np.array(np.unravel_index(flat_idx, shape)).T
+    values = np.random.randn(20).astype(np.float32)
+    dense = np.zeros(shape, dtype=np.float32)
+    dense[tuple(indices.T)] = values
+    sparse = tf.SparseTensor(indices, values, shape)
+    where = initializers.random_tensor(shape, 3)
+    with self.test_session() as sess:
+      where = TensorTrain(sess.run(where.tt_cores))
+      proj = riemannian.project_sparse(sparse, where)
+      compact = riemannian.TangentSpace(where).project_sparse(sparse,
+                                                              compact=True)
+      desired = riemannian.project(decompositions.to_tt_tensor(dense, 100),
+                                   where)
+      self.assertEqual(where, proj.projection_on)
+      self.assertEqual(desired.get_tt_ranks(), proj.get_tt_ranks())
+      self.assertEqual([1, 5, 6, 6, 1],
+                       compact.to_tt().get_tt_ranks().as_list())
+      proj_val, compact_val, desired_val = sess.run(
+          (ops.full(proj), ops.full(compact.to_tt()), ops.full(desired)))
+      self.assertAllClose(desired_val, proj_val, atol=1e-4, rtol=1e-4)
+      self.assertAllClose(desired_val, compact_val, atol=1e-4, rtol=1e-4)
+
+  def testProjectSparseMatrix(self):
+    np.random.seed(1)
+    shape = ((2, 3, 4), (2, 2, 2))
+    flat_idx = np.random.choice(24 * 8, 30, replace=False)
+    indices = np.array(np.unravel_index(flat_idx, (24, 8))).T
+    values = np.random.randn(30).astype(np.float32)
+    dense = np.zeros((24, 8), dtype=np.float32)
+    dense[tuple(indices.T)] = values
+    sparse = tf.SparseTensor(indices, values, (24, 8))
+    where = initializers.random_matrix(shape, 2)
+    with self.test_session() as sess:
+      where = TensorTrain(sess.run(where.tt_cores))
+      proj = riemannian.project_sparse(sparse, where)
+      tt_dense = decompositions.to_tt_matrix(dense, shape, 100)
+      desired = riemannian.project(tt_dense, where)
+      proj_val, desired_val = sess.run((ops.full(proj), ops.full(desired)))
+      self.assertAllClose(desired_val, proj_val, atol=1e-4, rtol=1e-4)
+
+  def testProjectDense(self):
+    # Compare the projection of dense tensors with the projection of their
+    # TT-representations.
+    np.random.seed(1)
+    for shape in ((2, 3, 4, 3), ((2, 3, 4), (2, 2, 2))):
+      if isinstance(shape[0], tuple):
+        dense = np.random.randn(3, 24, 8).astype(np.float32)
+        where = initializers.random_matrix(shape, 2)
+        to_tt = lambda x: decompositions.to_tt_matrix(x, shape, 100)
+      else:
+        dense = np.random.randn(3, *shape).astype(np.float32)
+        where = initializers.random_tensor(shape, 3)
+        to_tt = lambda x: decompositions.to_tt_tensor(x, 100)
+      with self.test_session() as sess:
+        where = TensorTrain(sess.run(where.tt_cores))
+        weights = np.array([[1.0, 0.5], [-2.0, 0.0], [0.5, 1.0]], np.float32)
+        tt_batch = batch_ops.concat_along_batch_dim(
+            [shapes.expand_batch_dim(to_tt(x)) for x in dense])
+        pairs = [(riemannian.project(dense[0], where),
+                  riemannian.project(to_tt(dense[0]), where)),
+                 (riemannian.project(dense, where),
+                  riemannian.project(tt_batch, where)),
+                 (riemannian.project_sum(dense, where),
+                  riemannian.project_sum(tt_batch, where)),
+                 (riemannian.project_sum(dense, where, weights[:, 0]),
+                  riemannian.project_sum(tt_batch, where, weights[:, 0])),
+                 (riemannian.project_sum(dense, where, weights),
+                  riemannian.project_sum(tt_batch, where, weights))]
+        for actual, desired in pairs:
+          self.assertEqual(type(desired), type(actual))
+          self.assertEqual(desired.get_tt_ranks(), actual.get_tt_ranks())
+          actual_val, desired_val = sess.run((ops.full(actual),
+                                              ops.full(desired)))
+          self.assertAllClose(desired_val, actual_val, atol=1e-4, rtol=1e-4)
+
+    with self.assertRaises(ValueError):
+      riemannian.project(np.zeros((24, 7), np.float32), where)
+
+  def testTangentSpace(self):
+    # Compare the projections onto a TangentSpace with project and project_sum.
+    what = initializers.random_tensor_batch((2, 3, 4), 3, batch_size=3)
+    where = initializers.random_tensor((2, 3, 4), 3)
+    space = riemannian.TangentSpace(where)
+    graph = tf.get_default_graph()
+    num_qr = len([op for op in graph.get_operations() if op.type == 'Qr'])
+    proj = space.project(what)
+    proj_sum = space.project_sum(what, [1.0, -2.0, 0.5])
+    proj_single = space.project(what[0])
+    new_num_qr = len([op for op in graph.get_operations() if op.type == 'Qr'])
+    # The orthogonalizations of where are not recomputed.
+    self.assertEqual(num_qr, new_num_qr)
+    self.assertIs(where, proj.projection_on)
+    desired_proj = riemannian.project(what, where)
+    desired_proj_sum = riemannian.project_sum(what, where, [1.0, -2.0, 0.5])
+    inner = space.inner(proj_single, proj)
+    desired_inner = ops.flat_inner(proj_single, proj)
+    norm_sq = space.inner(proj_single, proj_single)
+    desired_norm_sq = ops.frobenius_norm_squared(proj_single)
+    pairwise = riemannian.pairwise_flat_inner_projected(proj, desired_proj)
+    to_run = [ops.full(proj), ops.full(desired_proj), ops.full(proj_sum),
+              ops.full(desired_proj_sum), inner, desired_inner, norm_sq,
+              desired_norm_sq, pairwise]
+    with self.test_session() as sess:
+      res = sess.run(to_run)
+      for actual_val, desired_val in zip(res[:8:2], res[1:8:2]):
+        self.assertAllClose(desired_val, actual_val, atol=1e-5, rtol=1e-5)
+      self.assertEqual((3, 3), res[8].shape)
+
+    with self.assertRaises(ValueError):
+      # The argument is not a projection on this tangent space.
+      space.inner(proj, riemannian.project(what, what[0]))
+
+  def testTangentSpaceMatmul(self):
+    tt_mat = initializers.random_matrix(((2, 3, 4), (2, 3, 4)))
+    tt_vec_what = initializers.random_matrix(((2, 3, 4), None))
+    tt_vec_where = initializers.random_matrix(((2, 3, 4), None))
+    space = riemannian.TangentSpace(tt_vec_where)
+    proj = space.project_matmul(tt_vec_what, tt_mat)
+    proj_desired = riemannian.project_matmul(tt_vec_what, tt_vec_where, tt_mat)
+    with self.test_session() as sess:
+      actual_val, desired_val = sess.run((ops.full(proj),
+                                          ops.full(proj_desired)))
+      self.assertAllClose(desired_val, actual_val, atol=1e-5, rtol=1e-5)
+
+  def testTangentVector(self):
+    # Compare the compact projections with the TT-objects ones.
+    what = initializers.random_tensor_batch((2, 3, 4), 4, batch_size=3)
+    where = initializers.random_tensor((2, 3, 4), 3)
+    space = riemannian.TangentSpace(where)
+    graph = tf.get_default_graph()
+    num_tiles = len([op for op in graph.get_operations() if op.type == 'Tile'])
+    compact = space.project(what, compact=True)
+    compact_single = space.project(what[0], compact=True)
+    new_num_tiles = len([op for op in graph.get_operations()
+                         if op.type == 'Tile'])
+    # The tangent space frames are not copied for batches.
+    self.assertEqual(num_tiles, new_num_tiles)
+    self.assertTrue(compact.is_batch)
+    self.assertEqual(3, compact.batch_size)
+    self.assertIs(where, compact.projection_on)
+    self.assertEqual([[1, 2, 2], [2, 3, 3], [3, 4, 1]],
+                     [delta.get_shape().as_list()[1:]
+                      for delta in compact.deltas])
+    proj = space.project(what)
+    proj_single = space.project(what[0])
+    weighted = 2.0 * compact_single - compact
+    add_n = riemannian.add_n_projected((compact, compact_single),
+                                       coef=[[1.0, 2.0, 3.0], [0.5, 0.5, 0.5]])
+    inner = space.inner(compact_single, compact)
+    desired_inner = space.inner(proj_single, proj)
+    mixed_inner = riemannian.pairwise_flat_inner_projected(compact, proj)
+    desired_mixed_inner = riemannian.pairwise_flat_inner_projected(proj, proj)
+    to_run = [ops.full(compact.to_tt()), ops.full(proj),
+              ops.full(compact_single.to_tt()), ops.full(proj_single),
+              inner, desired_inner, mixed_inner, desired_mixed_inner,
+              ops.full(weighted.to_tt()), ops.full(add_n.to_tt())]
+    with self.test_session() as sess:
+      res = sess.run(to_run)
+      for actual_val, desired_val in zip(res[:8:2], res[1:8:2]):
+        self.assertAllClose(desired_val, actual_val, atol=1e-4, rtol=1e-4)
+      proj_val = res[1]
+      weighted_val, add_n_val = res[8:]
+      self.assertAllClose(2.0 * proj_val[0] - proj_val, weighted_val,
+                          atol=1e-4, rtol=1e-4)
+      # coef[0] multiplies the batch elements of compact.
+      desired_add_n_val = (np.array([1.0, 2.0, 3.0])[:, None, None, None] *
+                           proj_val + 0.5 * proj_val[0])
+      self.assertAllClose(desired_add_n_val, add_n_val, atol=1e-4, rtol=1e-4)
+
+    with self.assertRaises(ValueError):
+      # The vectors are from different tangent spaces.
+      compact + riemannian.TangentSpace(what[0]).project(what, compact=True)
+
+  def testRetract(self):
+    # Compare retract with rounding of the sum.
+    shape = (2, 3, 4, 3)
+    what = initializers.random_tensor_batch(shape, 4, batch_size=3)
+    x = initializers.random_tensor(shape, 3)
+    with self.test_session() as sess:
+      what, x = sess.run((what.tt_cores, x.tt_cores))
+      what = TensorTrainBatch(what)
+      x = TensorTrain(x)
+      space = riemannian.TangentSpace(x)
+      tangents = [riemannian.project(what[0], x),
+                  riemannian.project_sum(what, x, [0.5, -1.0, 2.0]),
+                  riemannian.add_n_projected((riemannian.project(what[0], x),
+                                              riemannian.project(what[1], x))),
+                  space.project(what[2], compact=True)]
+      for tangent in tangents:
+        if isinstance(tangent, riemannian.TangentVector):
+          tangent_tt = tangent.to_tt()
+        else:
+          tangent_tt = tangent
+        x_plus_tangent = ops.add(x, tangent_tt)
+        for max_tt_rank in (2, 3, 6):
+          retracted = riemannian.retract(x, tangent, max_tt_rank)
+          desired = decompositions.round(x_plus_tangent, max_tt_rank)
+          self.assertEqual('right', retracted.orthogonality)
+          self.assertLessEqual(max(retracted.get_tt_ranks().as_list()),
+                               max_tt_rank)
+          actual_val, desired_val = sess.run((ops.full(retracted),
+                                              ops.full(desired)))
+          self.assertAllClose(desired_val, actual_val, atol=1e-4, rtol=1e-4)
+
+    with self.assertRaises(ValueError):
+      # The tangent vector is not from the tangent space at x.
+      riemannian.retract(what[0], tangents[0], 3)
+    with self.assertRaises(ValueError):
+      riemannian.retract(x, riemannian.project(what, x), 3)
+
+  def testRetractMatrix(self):
+    shape = ((2, 3, 4), (2, 2, 2))
+    what = initializers.random_matrix(shape, 4)
+    x = initializers.random_matrix(shape, 2)
+    with self.test_session() as sess:
+      what, x = sess.run((what.tt_cores, x.tt_cores))
+      what = TensorTrain(what)
+      x = TensorTrain(x)
+      tangent = riemannian.project(what, x)
+      retracted = riemannian.retract(x, tangent, 2)
+      desired = decompositions.round(ops.add(x, tangent), 2)
+      graph = tf.get_default_graph()
+      svd_shapes = [op.inputs[0].get_shape().as_list()
+                    for op in graph.get_operations() if op.type == 'Svd']
+      # The SVDs of retract are of at most 2r x 2r matrices.
+      self.assertIn([4, 4], svd_shapes)
+      actual_val, desired_val = sess.run((ops.full(retracted),
+                                          ops.full(desired)))
+      self.assertAllClose(desired_val, actual_val, atol=1e-4, rtol=1e-4)
+
+  def testTransport(self):
+    # Compare transport with the projection of the TT-object.
+    for shape in ((2, 3, 4, 3), ((2, 3, 4), (2, 2, 2))):
+      if isinstance(shape[0], tuple):
+        what = initializers.random_matrix_batch(shape, 4, batch_size=2)
+        x = initializers.random_matrix(shape, 2)
+        y = initializers.random_matrix(shape, 3)
+      else:
+        what = initializers.random_tensor_batch(shape, 4, batch_size=2)
+        x = initializers.random_tensor(shape, 3)
+        y = initializers.random_tensor(shape, 2)
+      with self.test_session() as sess:
+        what, x, y = sess.run((what.tt_cores, x.tt_cores, y.tt_cores))
+        what = TensorTrainBatch(what)
+        x = TensorTrain(x)
+        y = TensorTrain(y)
+        space = riemannian.TangentSpace(y)
+        tangents = [riemannian.project(what[0], x),
+                    riemannian.project(what, x),
+                    riemannian.TangentSpace(x).project(what[1], compact=True)]
+        for tangent in tangents:
+          if isinstance(tangent, riemannian.TangentVector):
+            tangent_tt = tangent.to_tt()
+          else:
+            tangent_tt = tangent
+          desired = riemannian.project(tangent_tt, y)
+          actual = riemannian.transport(tangent, y)
+          compact = space.transport(tangent, compact=True)
+          self.assertEqual(y, actual.projection_on)
+          self.assertEqual(y, compact.projection_on)
+          self.assertEqual(desired.get_tt_ranks(), actual.get_tt_ranks())
+          desired_val, actual_val, compact_val = sess.run(
+              (ops.full(desired), ops.full(actual), ops.full(compact.to_tt())))
+          self.assertAllClose(desired_val, actual_val, atol=1e-4, rtol=1e-4)
+          self.assertAllClose(desired_val, compact_val, atol=1e-4, rtol=1e-4)
+          # Transport onto the same tangent space does not change the vector.
+          same_val, tangent_val = sess.run(
+              (ops.full(riemannian.transport(tangent, x)),
+               ops.full(tangent_tt)))
+          self.assertAllClose(tangent_val, same_val, atol=1e-4, rtol=1e-4)
+
+    with self.assertRaises(ValueError):
+      # Not a projection.
+      riemannian.transport(what[0], y)
+
   def testPairwiseFlatInnerTensor(self):
     # Compare pairwise_flat_inner_projected against naive implementation.
     what1 = initializers.random_tensor_batch((2, 3, 4), 4, batch_size=3)
@@ -0,0 +1,362 @@
+import numpy as np
+import tensorflow as tf
+
+from t3f.tensor_train import TensorTrain
+from t3f.tensor_train_batch import TensorTrainBatch
+from t3f import decompositions
+from t3f import utils
+
+
+def full_tiled(tt, out, tile_ndims=None, max_tile_size=2**20, session=None,
+               feed_dict=None):
+  """Converts a TT-object into a dense array tile by tile.
+
+  Unlike `t3f.full`, never builds the whole dense tensor in memory: the
+  TT-cores are evaluated once and the dense tensor is written into `out` in
+  tiles, each tile corresponds to fixed values of the first `tile_ndims`
+  indices (row indices for TT-matrices). The product of the last
+  d - `tile_ndims` TT-cores is computed once and shared by all the tiles,
+  and the products of the first TT-cores are reused between the neighbouring
+  tiles, so the peak memory is of the order of the tile size.
+
+  Example:
+    >>> tt = t3f.random_tensor((100, 100, 100, 100), tt_rank=10)
+    >>> out = np.memmap('tt.dat', dtype=np.float32, mode='w+',
+    ...                 shape=(100, 100, 100, 100))
+    >>> t3f.full_tiled(tt, out, session=sess)
+
+  Args:
+    tt: `TensorTrain` or `TensorTrainBatch` object.
+    out: np.ndarray or np.memmap of the shape `tt.get_shape()`, or a string
+      with a filename to create a np.memmap in, or a callable
+      `out(index, tile)` that receives tiles and the (tuple) index of the tile
+      in the dense tensor, i.e. `dense[index] = tile`.
+    tile_ndims: the number of leading indices (TT-cores) that are fixed in one
+      tile. If None, the smallest number for which the tile and the shared
+      product of the TT-cores have at most `max_tile_size` elements.
+    max_tile_size: the desired number of elements in a tile, used if
+      `tile_ndims` is None.
+    session: (Optional.) The `Session` to evaluate the TT-cores in. If None,
+      the default session will be used.
+    feed_dict: A dictionary that maps `Tensor` objects to feed values.
+
+  Returns:
+    `out` (or the created np.memmap if `out` is a string).
+
+  Raises:
+    ValueError if the shape or the TT-ranks of `tt` are not known on the
+      compilation stage or if `tile_ndims` is not in [0, d].
+  """
+  if not tt.get_shape().is_fully_defined():
+    raise ValueError('The shape of the TT-object should be known on the '
+                     'compilation stage, got %s.' % tt)
+  if not tt.get_tt_ranks().is_fully_defined():
+    raise ValueError('The TT-ranks of the TT-object should be known on the '
+                     'compilation stage, got %s.' % tt)
+  num_dims = tt.ndims()
+  is_batch = isinstance(tt, TensorTrainBatch)
+  raw_shape = [s.as_list() for s in tt.get_raw_shape()]
+  if not tt.is_tt_matrix():
+    # Treat a TT-tensor as a TT-matrix with 1 column.
+    raw_shape.append([1] * num_dims)
+  row_modes, col_modes = np.array(raw_shape)
+  ranks = tt.get_tt_ranks().as_list()
+  dense_shape = tuple(tt.get_shape().as_list())
+
+  if tile_ndims is None:
+    for tile_ndims in range(num_dims + 1):
+      tile_size = np.prod(row_modes[tile_ndims:]) * np.prod(col_modes)
+      shared_size = ranks[tile_ndims] * np.prod(row_modes[tile_ndims:]) * \
+                    np.prod(col_modes[tile_ndims:])
+      if max(tile_size, shared_size) <= max_tile_size:
+        break
+  if tile_ndims < 0 or tile_ndims > num_dims:
+    raise ValueError('tile_ndims should be in [0, %d], got %d.' %
+                     (num_dims, tile_ndims))
+
+  if isinstance(out, str):
+    out = np.memmap(out, dtype=tt.dtype.as_numpy_dtype, mode='w+',
+                    shape=dense_shape)
+  if callable(out):
+    sink = out
+  else:
+    def sink(index, tile):
+      out[index] = tile
+
+  if session is None:
+    session = tf.get_default_session()
+  cores = session.run(tt.tt_cores, feed_dict=feed_dict)
+  batch_size = dense_shape[0] if is_batch else 1
+  for batch_idx in range(batch_size):
+    curr_cores = []
+    for core_idx in range(num_dims):
+      core = cores[core_idx][batch_idx] if is_batch else cores[core_idx]
+      # Make each TT-core a 4d array r_k-1 x n_k x m_k x r_k.
+      core_shape = (ranks[core_idx], row_modes[core_idx], col_modes[core_idx],
+                    ranks[core_idx + 1])
+      curr_cores.append(core.reshape(core_shape))
+    batch_index = (batch_idx,) if is_batch else ()
+    _write_tiles(curr_cores, tile_ndims, row_modes, col_modes,
+                 tt.is_tt_matrix(), batch_index, sink)
+  return out
+
+
+def _write_tiles(cores, tile_ndims, row_modes, col_modes, is_tt_matrix,
+                 batch_index, sink):
+  """Computes the tiles of one TT-object and passes them to the sink.
+
+  Args:
+    cores: list of 4d np.arrays r_k-1 x n_k x m_k x r_k.
+    tile_ndims: the number of leading indices fixed in one tile.
+    row_modes: np.array with n_k.
+    col_modes: np.array with m_k.
+    is_tt_matrix: bool, whether to write the tiles as blocks of rows of a
+      matrix or as subtensors.
+    batch_index: a tuple prepended to the index of each tile.
+    sink: a callable sink(index, tile).
+  """
+  num_dims = len(cores)
+  # The product of the last TT-cores,
+  #   r_tile_ndims x (n_tile_ndims ... n_d-1) x (m_tile_ndims ... m_d-1)
+  suffix = np.ones((1, 1, 1), dtype=cores[0].dtype)
+  for core_idx in range(num_dims - 1, tile_ndims - 1, -1):
+    core = cores[core_idx]
+    suffix = np.einsum('aijb,bxy->aixjy', core, suffix)
+    suffix = suffix.reshape((core.shape[0], core.shape[1] * suffix.shape[2],
+                             core.shape[2] * suffix.shape[4]))
+  suffix_rows = suffix.shape[1]
+  suffix = suffix.reshape((suffix.shape[0], -1))
+
+  # prefixes[k] is the product of the first k TT-cores sliced at the current
+  # row indices, a (m_0 ... m_k-1) x r_k matrix.
+  prefixes = [np.ones((1, 1), dtype=cores[0].dtype)]
+  prev_index = None
+  for index in np.ndindex(*row_modes[:tile_ndims]):
+    # The first position where the index differs from the previous one, all
+    # the prefix products before it can be reused.
+    start = 0
+    if prev_index is not None:
+      while index[start] == prev_index[start]:
+        start += 1
+    del prefixes[start + 1:]
+    for core_idx in range(start, tile_ndims):
+      core_slice = cores[core_idx][:, index[core_idx], :, :]
+      curr_prefix = np.einsum('xa,ajb->xjb', prefixes[-1], core_slice)
+      prefixes.append(curr_prefix.reshape((-1, core_slice.shape[-1])))
+    prev_index = index
+
+    tile = prefixes[-1].dot(suffix)
+    if is_tt_matrix:
+      # Move the row indices of the suffix in front of the column indices of
+      # the prefix.
+      num_prefix_cols = prefixes[-1].shape[0]
+      tile = tile.reshape((num_prefix_cols, suffix_rows, -1))
+      tile = tile.transpose((1, 0, 2)).reshape((suffix_rows, -1))
+      row_start = int(np.ravel_multi_index(index, row_modes[:tile_ndims])) \
+                  if tile_ndims > 0 else 0
+      row_start *= suffix_rows
+      sink(batch_index + (slice(row_start, row_start + suffix_rows),), tile)
+    else:
+      tile = tile.reshape(row_modes[tile_ndims:])
+      sink(batch_index + tuple(int(i) for i in index), tile)
+
+
+def to_tt_tensor_streaming(tens, max_tt_rank=10, shape=None, oversampling=10,
+                           chunk_size=2**20, seed=None):
+  """Converts a dense array that does not fit into memory into a TT-tensor.
+
+  Unlike `t3f.to_tt_tensor`, never loads the whole dense tensor: the tensor is
+  read once in chunks and each chunk updates small random sketches of the
+  unfoldings, from which the TT-cores are recovered in the end (streaming
+  TT-approximation, see
+    Kressner et al., Streaming tensor train approximation, 2023).
+  The unfoldings are sketched from the right by Khatri-Rao products of
+  random Gaussian matrices with R = max_tt_rank + oversampling columns and
+  from the left by Khatri-Rao products of (other) random Gaussian matrices
+  with R + oversampling columns, the recovered TT-tensor of TT-rank R is then
+  rounded to `max_tt_rank`. A tensor with
+  TT-ranks at most `max_tt_rank` is recovered exactly (up to the round-off
+  errors), for other tensors the error is close to the error of
+  `t3f.to_tt_tensor`.
+
+  Apart from the chunk, the memory is O(chunk_size * R) and
+  O(d n R (R + oversampling)) for the sketches.
+
+  Example:
+    >>> tens = np.memmap('simulation.dat', dtype=np.float32, mode='r',
+    ...                  shape=(100, 100, 100, 100, 100))
+    >>> tt = t3f.to_tt_tensor_streaming(tens, max_tt_rank=20)
+
+  Args:
+    tens: np.ndarray or np.memmap (C-contiguous) or an iterable of slabs,
+      consecutive np.arrays of shape (s_i, n_2, ..., n_d) with
+      s_1 + s_2 + ... = n_1.
+    max_tt_rank: a number or a list of d+1 numbers, the maximal TT-ranks of
+      the result, see `t3f.to_tt_tensor`.
+    shape: the shape of the tensor, required if `tens` is an iterable of
+      slabs.
+    oversampling: the number of additional columns of the sketches.
+    chunk_size: the number of elements of `tens` read at once, used if `tens`
+      is an array.
+    seed: the seed of the random sketches.
+
+  Returns:
+    `TensorTrain` object containing a TT-tensor with TT-cores of the dtype of
+    `tens`.
+
+  Raises:
+    ValueError if `tens` is an iterable of slabs and `shape` is not provided,
+      if the slabs do not match the shape, if max_tt_rank is less than 1, if
+      max_tt_rank is not a number and not a vector of length d + 1, or if
+      oversampling is less than 0 or chunk_size is less than 1.
+  """
+  is_array = isinstance(tens, np.ndarray)
+  if is_array:
+    shape = tens.shape
+  elif shape is None:
+    raise ValueError('The shape should be provided if tens is an iterable of '
+                     'slabs.')
+  shape = tuple(int(n) for n in shape)
+  num_dims = len(shape)
+  max_tt_rank = utils.max_tt_rank_vector(max_tt_rank, num_dims)
+  max_tt_rank = max_tt_rank.astype(np.int64)
+  if oversampling < 0:
+    raise ValueError('Oversampling should be non-negative.')
+  if chunk_size < 1:
+    raise ValueError('chunk_size should be positive.')
+
+  # ranks[k] is the TT-rank of the result before rounding and left_ranks[k]
+  # is the number of columns of the left sketch of the k-th unfolding.
+  ranks = [1] * (num_dims + 1)
+  left_ranks = [1] * (num_dims + 1)
+  for k in range(1, num_dims):
+    left_size = int(np.prod(shape[:k]))
+    right_size = int(np.prod(shape[k:]))
+    ranks[k] = int(min(max_tt_rank[k] + oversampling, left_size, right_size))
+    left_ranks[k] = min(ranks[k] + oversampling, left_size)
+  right_cols = max(ranks)
+  left_cols = max(left_ranks)
+  rng = np.random.RandomState(seed)
+  left_factors = [rng.randn(n, left_cols) for n in shape]
+  right_factors = [rng.randn(n, right_cols) for n in shape]
+  # sketches[k] is the k-th unfolding multiplied by the Khatri-Rao products
+  # of the left factors of the modes < k and of the right factors of the
+  # modes > k, a (left_cols or 1) x n_k x (right_cols or 1) array.
+  sketches = []
+  for k in range(num_dims):
+    left_dim = left_cols if k > 0 else 1
+    right_dim = right_cols if k < num_dims - 1 else 1
+    sketches.append(np.zeros((left_dim, shape[k], right_dim)))
+
+  if is_array:
+    dtype = tens.dtype
+    # The number of leading modes fixed in a row of a chunk.
+    num_row_dims = 0
+    while (num_row_dims < num_dims - 1 and
+           np.prod(shape[num_row_dims:]) > chunk_size):
+      num_row_dims += 1
+    row_modes = shape[:num_row_dims]
+    num_rows = int(np.prod(row_modes))
+    flat = tens.reshape(num_rows, -1)
+    rows_per_chunk = max(1, chunk_size // flat.shape[1])
+    for start in range(0, num_rows, rows_per_chunk):
+      stop = min(start + rows_per_chunk, num_rows)
+      chunk = np.asarray(flat[start:stop], dtype=np.float64)
+      chunk = chunk.reshape((stop - start,) + shape[num_row_dims:])
+      if num_row_dims > 0:
+        row_index = np.unravel_index(np.arange(start, stop), row_modes)
+      else:
+        row_index = ()
+      _update_sketches(sketches, chunk, row_index, left_factors,
+                       right_factors)
+  else:
+    dtype = None
+    start = 0
+    for slab in tens:
+      slab = np.asarray(slab)
+      if dtype is None:
+        dtype = slab.dtype
+      if slab.shape[1:] != shape[1:] or start + slab.shape[0] > shape[0]:
+        raise ValueError('The slabs of shape %s do not match the shape %s.' %
+                         (slab.shape, shape))
+      stop = start + slab.shape[0]
+      row_index = (np.arange(start, stop),)
+      _update_sketches(sketches, slab.astype(np.float64), row_index,
+                       left_factors, right_factors)
+      start = stop
+    if start != shape[0]:
+      raise ValueError('The slabs have %d rows in total, expected %d.' %
+                       (start, shape[0]))
+
+  tt_cores = []
+  for k in range(num_dims):
+    core = sketches[k][:left_ranks[k], :, :ranks[k + 1]]
+    core = core.reshape((left_ranks[k], -1))
+    if k > 0:
+      # The sketch of the (k-1)-th unfolding from both sides,
+      # left_ranks[k] x ranks[k].
+      if k == 1:
+        omega = np.einsum('ir,il->lr', sketches[0][0], left_factors[0])
+      else:
+        omega = np.einsum('lir,il->lr', sketches[k - 1], left_factors[k - 1])
+      omega = omega[:left_ranks[k], :ranks[k]]
+      core = np.linalg.lstsq(omega, core, rcond=None)[0]
+    core = core.reshape((ranks[k], shape[k], ranks[k + 1]))
+    tt_cores.append(core.astype(dtype))
+  tt = TensorTrain(tt_cores)
+  if np.all(ranks <= max_tt_rank):
+    return tt
+  return decompositions.round(tt, max_tt_rank)
+
+
+def _update_sketches(sketches, chunk, row_index, left_factors, right_factors):
+  """Adds the contribution of a chunk of a tensor to the sketches.
+
+  Args:
+    sketches: list of np.arrays, see to_tt_tensor_streaming.
+    chunk: np.array of shape (b, n_m, ..., n_d-1), the rows of the tensor
+      with the leading m indices fixed.
+    row_index: tuple of m np.arrays of length b, the leading m indices of
+      the rows of the chunk.
+    left_factors: list of d np.arrays n_k x left_cols.
+    right_factors: list of d np.arrays n_k x right_cols.
+  """
+  num_dims = len(sketches)
+  num_row_dims = len(row_index)
+  num_rows = chunk.shape[0]
+  left_cols = left_factors[0].shape[1]
+
+  # right[k] is the chunk multiplied by the right factors of the modes > k,
+  # of shape (b, n_m, ..., n_k, right_cols), or (b, right_cols) for k = m-1.
+  right = {num_dims - 1: chunk[..., np.newaxis]}
+  if num_dims > 1:
+    right[num_dims - 2] = np.einsum('...i,ir->...r', chunk, right_factors[-1])
+  for k in range(num_dims - 2, max(num_row_dims, 1) - 1, -1):
+    right[k - 1] = np.einsum('...ir,ir->...r', right[k], right_factors[k])
+
+  # left[k] is the left sketch of the rows of the chunk, the product of the
+  # left factors of the modes < k, b x left_cols.
+  left = [np.ones((num_rows, left_cols))]
+  for k in range(num_row_dims):
+    left.append(left[-1] * left_factors[k][row_index[k]])
+
+  # The modes fixed in each row of the chunk.
+  for k in range(num_row_dims):
+    right_part = right[num_row_dims - 1]
+    for j in range(k + 1, num_row_dims):
+      right_part = right_part * right_factors[j][row_index[j]]
+    one_hot = np.eye(sketches[k].shape[1])[row_index[k]]
+    curr_left = left[k] if k > 0 else left[k][:, :1]
+    sketches[k] += np.einsum('pl,pi,pr->lir', curr_left, one_hot, right_part)
+
+  # The remaining modes.
+  for k in range(num_row_dims, num_dims):
+    curr_left = left[num_row_dims] if k > 0 else left[0][:, :1]
+    if k == num_row_dims:
+      curr = np.einsum('pl,p...->l...', curr_left, right[k])
+    else:
+      curr = np.einsum('pl,jl,pj...->l...', curr_left,
+                       left_factors[num_row_dims], right[k])
+      for j in range(num_row_dims + 1, k):
+        curr = np.einsum('lj...,jl->l...', curr, left_factors[j])
+    sketches[k] += curr
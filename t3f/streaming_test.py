@@ -0,0 +1,119 @@
+import os
+import tempfile
+
+import numpy as np
+import tensorflow as tf
+
+from t3f.tensor_train import TensorTrain
+from t3f.tensor_train_batch import TensorTrainBatch
+from t3f import ops
+from t3f import initializers
+from t3f import decompositions
+from t3f import streaming
+
+
+class StreamingTest(tf.test.TestCase):
+
+  def testFullTiledTensor(self):
+    tt = initializers.random_tensor((2, 3, 4, 3), tt_rank=(1, 2, 5, 3, 1))
+    with self.test_session() as sess:
+      # Fix the values of the random TT-cores.
+      tt = TensorTrain(sess.run(tt.tt_cores))
+      desired = sess.run(ops.full(tt))
+      for tile_ndims in range(5):
+        out = np.zeros((2, 3, 4, 3), dtype=np.float32)
+        streaming.full_tiled(tt, out, tile_ndims=tile_ndims)
+        self.assertAllClose(desired, out)
+      # Choose the tile size automatically.
+      out = np.zeros((2, 3, 4, 3), dtype=np.float32)
+      streaming.full_tiled(tt, out, max_tile_size=20)
+      self.assertAllClose(desired, out)
+
+  def testFullTiledMatrix(self):
+    tt = initializers.random_matrix(((2, 3, 2), (3, 2, 2)), tt_rank=3)
+    with self.test_session() as sess:
+      tt = TensorTrain(sess.run(tt.tt_cores))
+      desired = sess.run(ops.full(tt))
+      for tile_ndims in range(4):
+        out = np.zeros((12, 12), dtype=np.float32)
+        streaming.full_tiled(tt, out, tile_ndims=tile_ndims)
+        self.assertAllClose(desired, out)
+
+  def testFullTiledBatchToMemmap(self):
+    tt = initializers.random_matrix_batch(((2, 3), (3, 2)), tt_rank=2,
+                                          batch_size=3)
+    filename = os.path.join(tempfile.mkdtemp(), 'tt.dat')
+    with self.test_session() as sess:
+      tt = TensorTrainBatch(sess.run(tt.tt_cores))
+      desired = sess.run(ops.full(tt))
+      out = streaming.full_tiled(tt, filename, tile_ndims=1)
+      self.assertAllClose(desired, out)
+      out.flush()
+      from_disk = np.memmap(filename, dtype=np.float32, mode='r',
+                            shape=(3, 6, 6))
+      self.assertAllClose(desired, from_disk)
+
+  def testFullTiledSink(self):
+    # Collect the tiles with a callable.
+    tt = initializers.random_tensor((2, 3, 4), tt_rank=2)
+    tiles = {}
+
+    def sink(index, tile):
+      tiles[index] = tile
+
+    with self.test_session() as sess:
+      tt = TensorTrain(sess.run(tt.tt_cores))
+      desired = sess.run(ops.full(tt))
+      streaming.full_tiled(tt, sink, tile_ndims=2)
+      self.assertEqual(6, len(tiles))
+      for index, tile in tiles.items():
+        self.assertAllClose(desired[index], tile)
+
+  def testToTTTensorStreaming(self):
+    shape = (4, 5, 6, 3)
+    tt = initializers.random_tensor(shape, tt_rank=3)
+    with self.test_session() as sess:
+      desired = sess.run(ops.full(tt))
+      filename = os.path.join(tempfile.mkdtemp(), 'tens.dat')
+      tens = np.memmap(filename, dtype=np.float32, mode='w+', shape=shape)
+      tens[:] = desired
+      # Chunks of several rows of the whole tensor, of the matricization
+      # (4 * 5) x (6 * 3), and of the matricization (4 * 5 * 6) x 3.
+      for chunk_size in [2**20, 40, 20, 1]:
+        res = streaming.to_tt_tensor_streaming(tens, max_tt_rank=3,
+                                               chunk_size=chunk_size, seed=1)
+        self.assertEqual([1, 3, 3, 3, 1], res.get_tt_ranks().as_list())
+        self.assertAllClose(desired, sess.run(ops.full(res)), atol=1e-4,
+                            rtol=1e-4)
+      # Slabs along the first mode.
+      slabs = (desired[i:i + 3] for i in range(0, 4, 3))
+      res = streaming.to_tt_tensor_streaming(slabs, max_tt_rank=3,
+                                             shape=shape, seed=1)
+      self.assertAllClose(desired, sess.run(ops.full(res)), atol=1e-4,
+                          rtol=1e-4)
+      with self.assertRaises(ValueError):
+        streaming.to_tt_tensor_streaming(iter([desired]), max_tt_rank=3)
+      with self.assertRaises(ValueError):
+        streaming.to_tt_tensor_streaming(iter([desired[:2]]), max_tt_rank=3,
+                                         shape=shape)
+
+  def testToTTTensorStreamingApproximation(self):
+    shape = (6, 7, 8, 5)
+    np.random.seed(1)
+    tt = initializers.random_tensor(shape, tt_rank=4)
+    with self.test_session() as sess:
+      tens = sess.run(ops.full(tt)).astype(np.float64)
+      noise = np.random.randn(*shape)
+      tens += 1e-2 * noise * np.linalg.norm(tens) / np.linalg.norm(noise)
+      res = streaming.to_tt_tensor_streaming(tens, max_tt_rank=4,
+                                             chunk_size=50, seed=1)
+      self.assertEqual([1, 4, 4, 4, 1], res.get_tt_ranks().as_list())
+      optimal = decompositions.to_tt_tensor(tens, max_tt_rank=4)
+      res_val, optimal_val = sess.run([ops.full(res), ops.full(optimal)])
+      error = np.linalg.norm(res_val - tens)
+      optimal_error = np.linalg.norm(optimal_val - tens)
+      self.assertLess(error, 1.5 * optimal_error)
+
+
+if __name__ == "__main__":
+  tf.test.main()
@@ -17,6 +17,7 @@ class TensorTrainBase(object):
   @@get_tt_ranks
   @@is_tt_matrix
   @@is_variable
+  @@orthogonality
   @@eval
   """
 
@@ -108,6 +109,32 @@ class TensorTrainBase(object):
     """True if the TensorTrain object is a variable (e.g. is trainable)."""
     return isinstance(self.tt_cores[0], tf.Variable)
 
+  @property
+  def orthogonality(self):
+    """The known orthogonality of the TT-cores.
+
+    Returns:
+      'left' if all the TT-cores except the last one are known to be
+      left-orthogonal, 'right' if all the TT-cores except the first one are
+      known to be right-orthogonal, and None otherwise.
+    """
+    return getattr(self, '_orthogonality', None)
+
+  def _cache(self):
+    """A dict with the TT-objects computed from this one.
+
+    Used to reuse e.g. the orthogonalized versions of the TT-object instead of
+    building the same chain of QR decompositions again, see
+    `t3f.orthogonalize_tt_cores`.
+    """
+    if not hasattr(self, '_cached'):
+      self._cached = {}
+    return self._cached
+
+  def _clear_cache(self):
+    """Forgets the TT-objects computed from this one, e.g. on assign."""
+    self._cached = {}
+
   @property
   def op(self):
     """The `Operation` that evaluates all the cores."""
@@ -180,8 +180,14 @@ class TensorTrainBatch(TensorTrainBase):
                          self.get_tt_ranks())
     else:
       batch_size = new_tt_cores[0].get_shape()[0].value
-      return TensorTrainBatch(new_tt_cores, self.get_raw_shape(),
-                              self.get_tt_ranks(), batch_size)
+      res = TensorTrainBatch(new_tt_cores, self.get_raw_shape(),
+                             self.get_tt_ranks(), batch_size)
+      # The TT-ranks of the elements of a padded batch, see
+      # `t3f.element_tt_ranks`.
+      element_ranks = getattr(self, '_element_tt_ranks', None)
+      if element_ranks is not None:
+        res._element_tt_ranks = element_ranks[element_spec]
+      return res
 
   def _full_getitem(self, slice_spec):
     """__getitem__ when provided full index of length ndims + 1.
@@ -1,6 +1,10 @@
 import numpy as np
 import tensorflow as tf
 
+from t3f.tensor_train_batch import TensorTrainBatch
+from t3f import shapes
+from t3f import linalg
+
 
 # TODO: substitute with native implementation when it's ready.
 # https://github.com/tensorflow/tensorflow/issues/2075
@@ -13,27 +17,135 @@ def unravel_index(indices, shape):
     return tf.transpose(res, (1, 0))
 
 
+def gather_nd_mode_indices(tt, indices):
+  """Converts gather_nd indices into the indices of the TT-core slices.
+
+  Args:
+    tt: `TensorTrain` or `TensorTrainBatch` object.
+    indices: int tf.Tensor, see `t3f.gather_nd`.
+
+  Returns:
+    A list of d int64 tf.Tensors of size N with the linear index of the slice
+    of each TT-core (row_idx * m_k + col_idx for TT-matrices), and a list of
+    d mode sizes (n_k or n_k * m_k) as ints or tf.Tensors.
+
+  Raises:
+    ValueError if the size of the indices is not compatible with tt.
+  """
+  num_dims = tt.ndims()
+  indices.get_shape().assert_has_rank(2)
+  num_cols = indices.get_shape()[1].value
+  if num_cols is None:
+    raise ValueError('The second dimension of indices should be known on the '
+                     'compilation stage.')
+  raw_shape = shapes.lazy_raw_shape(tt)
+  if tt.is_tt_matrix():
+    if num_cols == 2:
+      row_idx = unravel_index(tf.cast(indices[:, 0], tf.int64),
+                              tf.cast(raw_shape[0], tf.int64))
+      col_idx = unravel_index(tf.cast(indices[:, 1], tf.int64),
+                              tf.cast(raw_shape[1], tf.int64))
+    elif num_cols == 2 * num_dims:
+      row_idx = tf.cast(indices[:, :num_dims], tf.int64)
+      col_idx = tf.cast(indices[:, num_dims:], tf.int64)
+    else:
+      raise ValueError('For TT-matrices indices should be of size N x 2 or '
+                       'N x %d, got %s.' % (2 * num_dims, indices.get_shape()))
+  elif num_cols != num_dims:
+    raise ValueError('For TT-tensors indices should be of size N x %d, got '
+                     '%s.' % (num_dims, indices.get_shape()))
+
+  mode_indices = []
+  mode_sizes = []
+  for core_idx in range(num_dims):
+    if tt.is_tt_matrix():
+      # Ravel multiindex (row_idx[:, core_idx], col_idx[:, core_idx]) into
+      # a linear index to use tf.gather that supports only first dimensional
+      # gather.
+      curr_idx = row_idx[:, core_idx] * tf.cast(raw_shape[1][core_idx],
+                                                tf.int64)
+      curr_idx += col_idx[:, core_idx]
+      mode_sizes.append(raw_shape[0][core_idx] * raw_shape[1][core_idx])
+    else:
+      curr_idx = tf.cast(indices[:, core_idx], tf.int64)
+      mode_sizes.append(raw_shape[0][core_idx])
+    mode_indices.append(curr_idx)
+  return mode_indices, mode_sizes
+
+
+def gather_core_slices(tt, core_idx, mode_size):
+  """Reshapes a TT-core to make its slices gatherable along the first axis.
+
+  Args:
+    tt: `TensorTrain` or `TensorTrainBatch` object.
+    core_idx: the index of the TT-core.
+    mode_size: n_k for TT-tensors and n_k * m_k for TT-matrices.
+
+  Returns:
+    tf.Tensor of size mode_size x r_k-1 x r_k, or
+    mode_size x batch_size x r_k-1 x r_k for `TensorTrainBatch`.
+  """
+  curr_core = tt.tt_cores[core_idx]
+  ranks = shapes.lazy_tt_ranks(tt)
+  left_rank = ranks[core_idx]
+  right_rank = ranks[core_idx + 1]
+  mode_axes = [1, 2] if tt.is_tt_matrix() else [1]
+  if isinstance(tt, TensorTrainBatch):
+    # Move the mode axes in front of the batch dimension.
+    mode_axes = [ax + 1 for ax in mode_axes]
+    perm = mode_axes + [0, 1, len(mode_axes) + 2]
+    curr_core = tf.transpose(curr_core, perm)
+    batch_size = shapes.lazy_batch_size(tt)
+    return tf.reshape(curr_core, (mode_size, batch_size, left_rank,
+                                  right_rank))
+  else:
+    perm = mode_axes + [0, len(mode_axes) + 1]
+    curr_core = tf.transpose(curr_core, perm)
+    return tf.reshape(curr_core, (mode_size, left_rank, right_rank))
+
+
+def max_tt_rank_vector(max_tt_rank, ndims):
+  """Converts the max_tt_rank argument into a vector of length d+1.
+
+  None and np.inf mean that the TT-ranks are not restricted and are replaced
+  with the maximal int32 value.
+
+  Args:
+    max_tt_rank: a number, a list of d+1 numbers, None or np.inf.
+    ndims: d, the number of dimensions (rank) of the tensor.
+
+  Returns:
+    np.array of d+1 np.int32 numbers.
+
+  Raises:
+    ValueError if max_tt_rank is less than 1 or if max_tt_rank is not a number
+      and not a vector of length d + 1.
+  """
+  if max_tt_rank is None:
+    max_tt_rank = np.inf
+  max_tt_rank = np.array(max_tt_rank, dtype=np.float64)
+  if np.any(max_tt_rank < 1):
+    raise ValueError('Maximum TT-rank should be greater or equal to 1.')
+  max_tt_rank = np.minimum(max_tt_rank, np.iinfo(np.int32).max)
+  max_tt_rank = max_tt_rank.astype(np.int32)
+  if max_tt_rank.size == 1:
+    max_tt_rank = (max_tt_rank * np.ones(ndims + 1)).astype(np.int32)
+  elif max_tt_rank.size != ndims + 1:
+    raise ValueError('max_tt_rank should be a number or a vector of size (d+1) '
+                     'where d is the number of dimensions (rank) of the tensor.')
+  return max_tt_rank
+
+
 # TODO: get rid of this when TF fixes the NaN bugs in tf.svd:
 # https://github.com/tensorflow/tensorflow/issues/8905
 def replace_tf_svd_with_np_svd():
-  """Replaces tf.svd with np.svd. Slow, but a workaround for tf.svd bugs."""
-  if hasattr(tf, 'original_svd'):
-    # This function has been already called and tf.svd is already replaced.
-    return
-  tf.original_svd = tf.svd
-
-  def my_svd(tensor, full_matrices=False, compute_uv=True):
-    dtype = tensor.dtype
-    u, s, v = tf.py_func(np.linalg.svd, [tensor, full_matrices, compute_uv],
-                         [dtype, dtype, dtype])
-    s_, u_, v_ = tf.original_svd(tensor, full_matrices, compute_uv)
-    s = tf.reshape(s, s_.get_shape())
-    u = tf.reshape(u, u_.get_shape())
-    v = tf.reshape(v, v_.get_shape())
-    # Converting numpy order of v dims to TF order.
-    order = range(tensor.get_shape().ndims)
-    order[-2], order[-1] = order[-1], order[-2]
-    v = tf.transpose(v, order)
-    return s, u, v
-
-  tf.svd = my_svd
+  """Makes t3f use np.svd instead of tf.svd. A workaround for tf.svd bugs.
+
+  Deprecated, use t3f.linalg.set_svd_backend('numpy') or the
+  t3f.linalg.svd_backend('numpy') scope instead. Unlike the previous version,
+  does not replace tf.svd globally, but it still permanently changes the
+  default SVD backend of t3f for the whole process and there is no way to
+  undo it with this function; call t3f.linalg.set_svd_backend('tf') to
+  restore the default.
+  """
+  linalg.set_svd_backend('numpy')
@@ -21,6 +21,19 @@ class UtilsTest(tf.test.TestCase):
       actual = utils.unravel_index(linear_idx, shape)
       self.assertAllEqual(desired, actual.eval())
 
+  def testMaxTTRankVector(self):
+    self.assertAllEqual([3, 3, 3, 3], utils.max_tt_rank_vector(3, 3))
+    self.assertAllEqual([1, 2, 3, 1],
+                        utils.max_tt_rank_vector([1, 2, 3, 1], 3))
+    int32_max = np.iinfo(np.int32).max
+    for max_tt_rank in [None, np.inf]:
+      self.assertAllEqual([int32_max] * 3,
+                          utils.max_tt_rank_vector(max_tt_rank, 2))
+    with self.assertRaises(ValueError):
+      utils.max_tt_rank_vector(0, 3)
+    with self.assertRaises(ValueError):
+      utils.max_tt_rank_vector([1, 2, 1], 3)
+
 
 if __name__ == "__main__":
   tf.test.main()
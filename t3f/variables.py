@@ -119,11 +119,15 @@ def assign(ref, value, validate_shape=None, use_locking=None, name=None):
     for i in range(ref.ndims()):
       new_cores.append(tf.assign(ref.tt_cores[i], value.tt_cores[i],
                                  use_locking=use_locking))
+  # The orthogonalizations cached in ref were computed from the old values.
+  ref._clear_cache()
   if isinstance(value, TensorTrainBatch):
-    return TensorTrainBatch(new_cores, value.get_raw_shape(),
-                            value.get_tt_ranks(), value.batch_size,
-                            convert_to_tensors=False)
+    res = TensorTrainBatch(new_cores, value.get_raw_shape(),
+                           value.get_tt_ranks(), value.batch_size,
+                           convert_to_tensors=False)
   else:
-    return TensorTrain(new_cores, value.get_raw_shape(),
-                                  value.get_tt_ranks(),
-                                  convert_to_tensors=False)
+    res = TensorTrain(new_cores, value.get_raw_shape(),
+                      value.get_tt_ranks(), convert_to_tensors=False)
+  # The assigned TT-cores are the TT-cores of value.
+  res._orthogonality = value.orthogonality
+  return res
@@ -4,6 +4,7 @@ import tensorflow as tf
 from t3f import variables
 from t3f import ops
 from t3f import initializers
+from t3f import decompositions
 
 class VariablesTest(tf.test.TestCase):
 
@@ -77,6 +78,16 @@ class VariablesTest(tf.test.TestCase):
       rel_diff = abs_diff / np.linalg.norm((init_value).flatten())
       self.assertGreater(rel_diff, 0.2)
 
+  def testAssignClearsCache(self):
+    init = initializers.random_tensor([2, 3, 2], tt_rank=2)
+    tt = variables.get_variable('tt_cache', initializer=init)
+    orth_tt = decompositions.orthogonalize_tt_cores(tt)
+    new_init = decompositions.round(initializers.random_tensor([2, 3, 2],
+                                                              tt_rank=2))
+    assigner = variables.assign(tt, new_init)
+    self.assertEqual('right', assigner.orthogonality)
+    self.assertIsNot(orth_tt, decompositions.orthogonalize_tt_cores(tt))
+
 
 if __name__ == "__main__":
   tf.test.main()